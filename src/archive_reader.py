@@ -0,0 +1,240 @@
+"""
+Memory-mapped reader for the message archive
+Each segment gets a sidecar index of (group, message_id, date, offset, length)
+so replays can filter and seek without decoding every JSON line
+"""
+
+import datetime
+import gzip
+import json
+import mmap
+import os
+import struct
+
+from telethon.tl.types import MessageMediaPhoto
+
+import serializer
+from backtest import BacktestPool, MessageRecord
+from message_archive import list_segments
+
+INDEX_SUFFIX = ".idx"
+INDEX_VERSION = 1
+# offset, length, message_id, unix date, group number
+INDEX_ENTRY = struct.Struct('<QIqqH')
+
+
+def _index_path(segment_path):
+    return segment_path + INDEX_SUFFIX
+
+
+def _to_timestamp(value):
+    if value is None:
+        return 0
+    if isinstance(value, datetime.datetime):
+        return int(value.timestamp())
+    return int(datetime.datetime.fromisoformat(value).timestamp())
+
+
+class ArchiveSegment:
+    """
+    One archive segment mapped into memory, with its sidecar index.
+    Plain segments are memory-mapped; gzipped ones are decompressed once into
+    memory since a compressed file cannot be mapped.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+        if path.endswith(".gz"):
+            with gzip.open(path, 'rb') as f:
+                self.data = f.read()
+        else:
+            self._file = open(path, 'rb')
+            size = os.fstat(self._file.fileno()).st_size
+            self.data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+        self.groups, self.entries = self._load_index()
+
+    def _load_index(self):
+        """Read the sidecar index, rebuilding it if missing or older than the segment"""
+        index_path = _index_path(self.path)
+        if os.path.exists(index_path):
+            with open(index_path, 'rb') as f:
+                header = json.loads(f.readline())
+                if header.get('version') == INDEX_VERSION and header.get('segment_bytes') == len(self.data):
+                    return header['groups'], list(INDEX_ENTRY.iter_unpack(f.read()))
+        return self._build_index()
+
+    def _build_index(self):
+        groups = []
+        entries = []
+        data = self.data
+        offset = 0
+        end = len(data)
+        while offset < end:
+            newline = data.find(b"\n", offset)
+            if newline == -1:
+                # Trailing partial line from an interrupted write
+                break
+            record = serializer.loads(data[offset:newline])
+            group = record.get('group') or ''
+            if group not in groups:
+                groups.append(group)
+            entries.append((offset, newline - offset, record['id'], _to_timestamp(record.get('date')), groups.index(group)))
+            offset = newline + 1
+
+        index_path = _index_path(self.path)
+        temp_path = index_path + ".tmp"
+        with open(temp_path, 'wb') as f:
+            header = {'version': INDEX_VERSION, 'segment_bytes': len(data), 'groups': groups}
+            f.write(json.dumps(header).encode('utf-8') + b"\n")
+            for entry in entries:
+                f.write(INDEX_ENTRY.pack(*entry))
+        os.replace(temp_path, index_path)
+        return groups, entries
+
+    def raw(self, offset, length):
+        """Zero-copy view of one JSON line"""
+        return memoryview(self.data)[offset:offset + length]
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        if self._file is not None:
+            self._file.close()
+
+
+class ArchiveReader:
+    """
+    Replays archived messages without loading whole segments into Python
+    objects: filters run on the sidecar index and only matching lines are
+    decoded, one at a time.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.segments = [ArchiveSegment(path) for path in list_segments(directory)]
+        # (group, message_id) -> (segment, offset, length), built on the first find()
+        self._locations = None
+
+    def __len__(self):
+        return sum(len(segment.entries) for segment in self.segments)
+
+    def iter_entries(self, groups=None, since=None, until=None):
+        """Yield (segment, group, message_id, unix_date, offset, length) matching the filters"""
+        groups = {group.upper() for group in groups} if groups else None
+        since = _to_timestamp(since) if since else None
+        until = _to_timestamp(until) if until else None
+
+        for segment in self.segments:
+            wanted = [groups is None or group.upper() in groups for group in segment.groups]
+            for offset, length, message_id, date, group_number in segment.entries:
+                if not wanted[group_number]:
+                    continue
+                if (since is not None and date < since) or (until is not None and date >= until):
+                    continue
+                yield segment, segment.groups[group_number], message_id, date, offset, length
+
+    def iter_records(self, groups=None, since=None, until=None):
+        """Yield MessageRecord objects ready for enhanced_message_processor"""
+        for segment, group, message_id, _, offset, length in self.iter_entries(groups, since, until):
+            record = serializer.loads(segment.raw(offset, length))
+            yield MessageRecord(
+                id=message_id,
+                date=datetime.datetime.fromisoformat(record['date']) if record.get('date') else None,
+                message=record.get('text'),
+                media=MessageMediaPhoto() if record.get('has_image') else None,
+                has_media=record.get('has_media', False),
+                group=group
+            )
+
+    def find(self, group, message_id):
+        """Decoded archive record for one message, or None"""
+        if self._locations is None:
+            self._locations = {}
+            for segment in self.segments:
+                groups = [group_name.upper() for group_name in segment.groups]
+                for offset, length, entry_id, _, group_number in segment.entries:
+                    # The first copy of a message archived twice wins, as in a replay
+                    self._locations.setdefault((groups[group_number], entry_id), (segment, offset, length))
+        location = self._locations.get((group.upper(), message_id))
+        if location is None:
+            return None
+        segment, offset, length = location
+        return serializer.loads(segment.raw(offset, length))
+
+    def close(self):
+        for segment in self.segments:
+            segment.close()
+
+
+def replay_archive(reader, groups=None, since=None, until=None, workers=None, chunk_size=500, pool=None):
+    """
+    Re-parse archived messages through a BacktestPool (pool, or one with
+    workers processes for this replay). Yields (MessageRecord, call_data)
+    with at most one batch (a chunk per worker) decoded at a time.
+    """
+    owned = pool is None
+    if owned:
+        pool = BacktestPool(workers, chunk_size)
+    try:
+        batch = []
+        for record in reader.iter_records(groups, since, until):
+            batch.append(record)
+            if len(batch) >= pool.batch_size:
+                yield from zip(batch, pool.parse(batch))
+                batch = []
+        if batch:
+            yield from zip(batch, pool.parse(batch))
+    finally:
+        if owned:
+            pool.close()
+
+
+def test_archive_reader():
+    """Archive synthetic messages, then replay a filtered subset through the index"""
+    import tempfile
+    from message_archive import MessageArchive
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        archive = MessageArchive(temp_dir, max_segment_bytes=32 * 1024, compress=False)
+        start = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+        for i in range(3000):
+            archive.append({
+                'id': i,
+                'date': (start + datetime.timedelta(minutes=i)).isoformat(),
+                'text': f"NIFTY {24000 + i % 50 * 50} CE ABOVE 120 SL 100 TARGET 150",
+                'has_media': False,
+                'has_image': False,
+                'group': ['DAY', 'UNIVEST', 'BTST'][i % 3]
+            })
+        archive.close()
+
+        reader = ArchiveReader(temp_dir)
+        since = start + datetime.timedelta(minutes=1000)
+        records = list(reader.iter_records(groups=['DAY'], since=since))
+        print(f"{len(reader)} archived messages in {len(reader.segments)} segments, {len(records)} DAY after {since}")
+        assert len(records) == 666 and all(record.group == 'DAY' for record in records)
+        assert reader.find('UNIVEST', 1000)['text'].startswith("NIFTY")
+        assert reader.find('day', 2997)['id'] == 2997
+        assert reader.find('DAY', 1000) is None and reader.find('DAY', 5000) is None
+
+        calls = [call_data for _, call_data in replay_archive(reader, groups=['BTST'], workers=0, chunk_size=200)]
+        print(f"Replayed {len(calls)} BTST messages, {sum(1 for call in calls if call)} trading calls")
+        assert len(calls) == 1000
+
+        # With workers, each batch holds a chunk per worker and goes through the pool
+        # (the last 200 records make a single chunk, parsed in-process)
+        with BacktestPool(workers=2, chunk_size=200) as pool:
+            parallel = [call_data for _, call_data in replay_archive(reader, groups=['BTST'], pool=pool)]
+            print(f"Parallel replay: {pool.stats}")
+            assert parallel == calls and pool.stats == {'batches': 3, 'parallel_batches': 2}
+        reader.close()
+
+        # Second open reads the sidecar index instead of rescanning
+        reader = ArchiveReader(temp_dir)
+        assert len(reader) == 3000
+        reader.close()
+
+
+if __name__ == "__main__":
+    test_archive_reader()
@@ -0,0 +1,123 @@
+"""
+Backtest helpers for re-running the parser over historical messages
+Messages are converted to small picklable records and parsed in chunks,
+optionally across a process pool that lives as long as the backtest
+"""
+
+import multiprocessing
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from telethon.tl.types import MessageMediaPhoto
+
+from message_parser import enhanced_message_processor, get_parser
+
+# Picklable stand-in for a Telethon message with just what the parser reads.
+# media is a bare MessageMediaPhoto for image messages and None otherwise.
+MessageRecord = namedtuple('MessageRecord', ['id', 'date', 'message', 'media', 'has_media', 'group'])
+
+
+def to_record(message_obj, group):
+    """Convert a Telethon message into a MessageRecord"""
+    has_image = bool(message_obj.media) and get_parser()._has_image_media(message_obj)
+    return MessageRecord(
+        id=message_obj.id,
+        date=message_obj.date,
+        message=message_obj.message,
+        media=MessageMediaPhoto() if has_image else None,
+        has_media=bool(message_obj.media),
+        group=group
+    )
+
+
+def parse_records(records):
+    """Parse a chunk of records; returns one call_data (or None) per record"""
+    return [enhanced_message_processor(record) for record in records]
+
+
+class BacktestPool:
+    """
+    Parses batches of records, spreading each batch's chunks over one
+    ProcessPoolExecutor that is started once and reused by every parse()
+    call (BACKTEST_WORKERS env var, default 0 = in-process). Use it as a
+    context manager around a whole backtest.
+
+    A batch is only parsed in parallel when it holds more than one chunk, so
+    streaming callers should hand parse() batch_size records at a time.
+    """
+
+    def __init__(self, workers=None, chunk_size=500):
+        if workers is None:
+            workers = int(os.getenv("BACKTEST_WORKERS", "0"))
+        self.workers = max(workers, 0)
+        self.chunk_size = chunk_size
+        # Enough records for one chunk per worker
+        self.batch_size = chunk_size * max(self.workers, 1)
+        self.stats = {'batches': 0, 'parallel_batches': 0}
+        self._executor = None
+
+    def parse(self, records):
+        """Parse every record exactly once and return the call_data list in order"""
+        records = list(records)
+        chunks = [records[i:i + self.chunk_size] for i in range(0, len(records), self.chunk_size)]
+        self.stats['batches'] += 1
+
+        if self.workers == 0 or len(chunks) <= 1:
+            return [call_data for chunk in chunks for call_data in parse_records(chunk)]
+
+        self.stats['parallel_batches'] += 1
+        if self._executor is None:
+            # Fork where available so workers do not re-import the calling script
+            context = multiprocessing.get_context("fork") if "fork" in multiprocessing.get_all_start_methods() else None
+            self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+        return [call_data for results in self._executor.map(parse_records, chunks) for call_data in results]
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def run_backtest(records, workers=None, chunk_size=500):
+    """
+    Parse every record exactly once and return the call_data list in order,
+    with a BacktestPool for this call only. Records are spread over the
+    workers only when they make more than one chunk; callers that parse
+    batch after batch should keep one BacktestPool open instead.
+    """
+    with BacktestPool(workers, chunk_size) as pool:
+        return pool.parse(records)
+
+
+def test_backtest():
+    """Parallel batches match in-process parsing, reusing one pool across batches"""
+    import datetime
+
+    start = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+    records = [MessageRecord(i, start + datetime.timedelta(minutes=i),
+                             "NIFTY 24000 CE ABOVE 120 SL 100 TARGET 150" if i % 2 else "GOOD MORNING TRADERS",
+                             None, False, 'DAY') for i in range(600)]
+    expected = run_backtest(records, workers=0, chunk_size=100)
+    assert sum(1 for call_data in expected if call_data) == 300
+
+    with BacktestPool(workers=2, chunk_size=100) as pool:
+        assert pool.batch_size == 200
+        for i in range(0, len(records), pool.batch_size):
+            assert pool.parse(records[i:i + pool.batch_size]) == expected[i:i + pool.batch_size]
+        executor = pool._executor
+        assert pool.parse(records[:50]) == expected[:50]  # one chunk: parsed in-process
+        assert pool._executor is executor is not None
+        print(f"Backtest pool: {pool.stats}")
+        assert pool.stats == {'batches': 4, 'parallel_batches': 3}
+    assert pool._executor is None
+
+
+if __name__ == "__main__":
+    test_backtest()
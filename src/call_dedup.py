@@ -0,0 +1,115 @@
+"""
+Cross-channel duplicate call suppression
+The same tip often lands in several monitored channels within seconds; the
+first channel to dispatch it claims the call for a time window and later
+copies are suppressed instead of being posted to the trading API again
+"""
+
+import os
+import time
+from collections import OrderedDict
+
+from metrics import registry
+
+duplicate_calls_suppressed = registry.counter('duplicate_calls_suppressed_total',
+                                              'Calls not dispatched because another channel sent them first',
+                                              ['channel', 'first_channel'])
+
+# CALL/PUT and CE/PE name the same contract
+_OPTION_ALIASES = {'CALL': 'CE', 'PUT': 'PE'}
+
+
+def call_key(api_data):
+    """(instrument, strike, option_type, trigger) identifying a call across channels"""
+    instrument = api_data['instrument']
+    option_type = str(instrument.get('instrumentType', '')).upper()
+    return (
+        str(instrument.get('name', '')).upper(),
+        str(instrument.get('strike', '')).replace(',', ''),
+        _OPTION_ALIASES.get(option_type, option_type),
+        round(float(api_data['price']), 2)
+    )
+
+
+class CallDeduplicator:
+    """
+    Time-windowed index of dispatched calls keyed by call_key(). Calls are
+    compared by message date, so live messages and history replays (newest
+    first) behave the same. Entries are kept in insertion order and expire
+    window seconds after they were claimed, by the clock, so they can be
+    popped from the front of an OrderedDict whatever order the dates arrive in.
+    """
+
+    def __init__(self, window=120.0):
+        self.window = window
+        self._claims = OrderedDict()
+
+    @classmethod
+    def from_env(cls):
+        """Deduplicator with DUPLICATE_CALL_WINDOW seconds (default 120); None when 0"""
+        window = float(os.getenv("DUPLICATE_CALL_WINDOW", "120"))
+        return cls(window) if window > 0 else None
+
+    def _expire(self):
+        now = time.monotonic()
+        while self._claims:
+            _, _, inserted_at = next(iter(self._claims.values()))
+            if now - inserted_at <= self.window:
+                break
+            self._claims.popitem(last=False)
+
+    def claim(self, api_data, group, message_date=None):
+        """
+        Claim a call for group at message_date (default: now). Returns None if
+        the call is new (and is now claimed), otherwise the group that claimed
+        it within the window.
+        """
+        now = message_date.timestamp() if message_date is not None else time.time()
+        self._expire()
+
+        key = call_key(api_data)
+        claim = self._claims.get(key)
+        # Out-of-order dates (e.g. interleaved history pages) are compared both ways
+        if claim is not None and abs(now - claim[0]) <= self.window:
+            duplicate_calls_suppressed.inc(channel=group, first_channel=claim[1])
+            return claim[1]
+
+        self._claims.pop(key, None)
+        self._claims[key] = (now, group, time.monotonic())
+        return None
+
+    def release(self, api_data):
+        """Drop a claim again, e.g. when the tip could not be queued or delivered"""
+        self._claims.pop(call_key(api_data), None)
+
+    def __len__(self):
+        return len(self._claims)
+
+
+def test_call_dedup():
+    """Duplicates within the window are suppressed and claims expire with newest-first dates too"""
+    import datetime
+
+    def tip(strike, option_type='PE'):
+        return {'instrument': {'name': 'NIFTY', 'strike': strike, 'instrumentType': option_type}, 'price': 20}
+
+    deduplicator = CallDeduplicator(window=0.2)
+    newest = datetime.datetime(2024, 1, 1, 10, 0, tzinfo=datetime.timezone.utc)
+    assert deduplicator.claim(tip('25100'), 'DAY', newest) is None
+    assert deduplicator.claim(tip('25100', 'PUT'), 'UNIVEST', newest - datetime.timedelta(seconds=0.1)) == 'DAY'
+
+    # A backtest feeds dates newest first; earlier claims must still expire
+    for index in range(1, 50):
+        deduplicator.claim(tip(str(25100 + index)), 'DAY', newest - datetime.timedelta(minutes=index))
+    assert len(deduplicator) == 50
+    time.sleep(0.25)
+    deduplicator.claim(tip('26000'), 'DAY', newest - datetime.timedelta(hours=2))
+    assert len(deduplicator) == 1
+
+    deduplicator.release(tip('26000'))
+    assert len(deduplicator) == 0
+    print("[OK] Cross-channel duplicates suppressed, claims expire in any date order")
+
+
+if __name__ == "__main__":
+    test_call_dedup()
@@ -2,21 +2,28 @@ import asyncio
 import datetime
 import ssl
 import os
-import json
-from pathlib import Path
+import sqlite3
+import sys
+import time
 
-import requests
 from telethon import TelegramClient, events
 from telethon.tl.types import PeerChannel
 
 # Import our enhanced message parser and constants
-from message_parser import enhanced_message_processor
+from message_parser import enhanced_message_processor, enrich_call_data, get_parser
 from constants import BTST_CHANNEL_ID, DAYTRADE_CHANNEL_ID, UNIVEST_CHANNEL_ID, TRADING_API_ENDPOINT
-
-# Create test data directories if they don't exist
-Path("src/test_data/raw_messages").mkdir(parents=True, exist_ok=True)
-Path("src/test_data/images").mkdir(parents=True, exist_ok=True)
-Path("src/test_data/parsing_results").mkdir(parents=True, exist_ok=True)
+from tip_dispatcher import TipDispatcher
+from call_dedup import CallDeduplicator
+from backtest import BacktestPool, to_record
+from history_fetcher import HistoryCheckpoint, stream_history
+from message_archive import MessageArchive, archive_record
+from archive_reader import ArchiveReader, replay_archive
+from metrics import (calls_detected, confidence_band, heartbeat, messages_seen,
+                     process_trading_data_latency, start_metrics_server)
+from media_store import MediaStore
+from image_ocr import OcrEngine
+from image_classifier import ImagePreClassifier
+import serializer
 
 ssl._create_default_https_context = ssl._create_unverified_context
 
@@ -32,44 +39,71 @@ daytrade_channel = DAYTRADE_CHANNEL_ID
 univest_channel = UNIVEST_CHANNEL_ID
 api_endpoint = TRADING_API_ENDPOINT
 
-# Validate required environment variables
-if not api_id or not api_hash or not phone_number:
-    raise ValueError("Missing required environment variables: TELEGRAM_API_ID, TELEGRAM_API_HASH, TELEGRAM_PHONE_NUMBER")
+# Suppresses the same call arriving from several channels (DUPLICATE_CALL_WINDOW)
+call_deduplicator = CallDeduplicator.from_env()
 
-# Use session file from mounted Azure File Share
-session_path = f"/app/sessions/{session_name}"
-print(f"Using session file: {session_path}")
+# Pooled, non-blocking client for the trading API; a tip that is never delivered
+# releases its duplicate claim, so another channel can still send it
+tip_dispatcher = TipDispatcher(api_endpoint + "tip",
+                               on_failure=call_deduplicator.release if call_deduplicator else None)
 
-# Check if session file exists and handle database lock
-import os
-import sqlite3
-import time
+# Raw messages and parsing results go to an append-only archive (MESSAGE_ARCHIVE_DIR)
+message_archive = MessageArchive()
 
-if os.path.exists(f"{session_path}.session"):
-    print(f"Found existing session file: {session_path}.session")
-    try:
-        # Try to open and close the database to check if it's accessible
-        conn = sqlite3.connect(f"{session_path}.session", timeout=10.0)
-        conn.execute("PRAGMA journal_mode=WAL")  # Use WAL mode to reduce locking
-        conn.close()
-        print("Session database is accessible")
-    except sqlite3.OperationalError as e:
-        print(f"Database lock detected, waiting and retrying: {e}")
-        time.sleep(2)
+# Local OCR for call images without a usable caption, with promo images screened
+# out first, when Tesseract is installed
+ocr_engine = OcrEngine.from_env()
+image_classifier = ImagePreClassifier.from_env(get_parser()) if ocr_engine else None
+
+# Telegram client and image store, created by create_client() so --replay
+# runs offline without credentials or a session file
+client = None
+media_store = None
+
+
+def create_client():
+    """
+    Validate the Telegram credentials, check the session file and create the
+    client with its message handlers, plus the image store that downloads
+    through it (MEDIA_DIR; each file is downloaded once, stored by content hash)
+    """
+    global client, media_store
+    if not api_id or not api_hash or not phone_number:
+        raise ValueError("Missing required environment variables: TELEGRAM_API_ID, TELEGRAM_API_HASH, TELEGRAM_PHONE_NUMBER")
+
+    # Use session file from mounted Azure File Share
+    session_path = f"/app/sessions/{session_name}"
+    print(f"Using session file: {session_path}")
+
+    # Check if session file exists and handle database lock
+    if os.path.exists(f"{session_path}.session"):
+        print(f"Found existing session file: {session_path}.session")
         try:
+            # Try to open and close the database to check if it's accessible
             conn = sqlite3.connect(f"{session_path}.session", timeout=10.0)
-            conn.execute("PRAGMA journal_mode=DELETE")  # Reset journal mode
-            conn.execute("PRAGMA locking_mode=NORMAL")
+            conn.execute("PRAGMA journal_mode=WAL")  # Use WAL mode to reduce locking
             conn.close()
-            print("Database lock cleared")
-        except Exception as lock_error:
-            print(f"Could not clear database lock: {lock_error}")
-else:
-    print(f"Session file not found at: {session_path}.session")
-
-client = TelegramClient(session_path, api_id, api_hash)
-
-# client.start() will be called inside async context
+            print("Session database is accessible")
+        except sqlite3.OperationalError as e:
+            print(f"Database lock detected, waiting and retrying: {e}")
+            time.sleep(2)
+            try:
+                conn = sqlite3.connect(f"{session_path}.session", timeout=10.0)
+                conn.execute("PRAGMA journal_mode=DELETE")  # Reset journal mode
+                conn.execute("PRAGMA locking_mode=NORMAL")
+                conn.close()
+                print("Database lock cleared")
+            except Exception as lock_error:
+                print(f"Could not clear database lock: {lock_error}")
+    else:
+        print(f"Session file not found at: {session_path}.session")
+
+    client = TelegramClient(session_path, api_id, api_hash)
+    client.add_event_handler(trade, events.NewMessage(chats=daytrade_channel))
+    client.add_event_handler(trade_btst, events.NewMessage(chats=btst_channel))
+    client.add_event_handler(trade_univest, events.NewMessage(chats=univest_channel))
+    media_store = MediaStore(client)
+    return client
 
 
 async def handleMessages(m, group):
@@ -78,20 +112,25 @@ async def handleMessages(m, group):
     Supports both text and image-based trading calls
     Saves raw messages and parsing results for testing
     """
+    await handle_parsed_message(m, group, enhanced_message_processor(m))
+
+
+async def handle_parsed_message(m, group, call_data):
+    """
+    Handle a message whose parse result is already known
+    (used by the backtest so each message is parsed only once)
+    """
     try:
-        # Save raw message data for testing (only for daytrade and univest groups)
-        if group.upper() in ['DAY', 'UNIVEST']:
-            await save_raw_message(m, group)
-            # Save image if present
-            if m.media:
-                await save_message_image(m, group)
-        
-        # Use the enhanced message processor
-        call_data = enhanced_message_processor(m)
+        messages_seen.inc(channel=group)
+        if call_data:
+            calls_detected.inc(channel=group, confidence_band=confidence_band(call_data['confidence']))
         
-        # Save parsing results for testing
+        # Archive raw message and parsing result for testing (only for daytrade and univest groups)
         if group.upper() in ['DAY', 'UNIVEST']:
-            await save_parsing_result(m, call_data, group)
+            message_archive.append(archive_record(m, group, call_data))
+            # Archive the image too; downloaded in the background and stored once per content hash
+            if m.media:
+                media_store.fetch(m)
         
         if not call_data:
             # Not a trading call, skip silently
@@ -117,39 +156,14 @@ async def handleMessages(m, group):
 async def handle_image_call(message_obj, call_data, group):
     """Handle image-based trading calls"""
     try:
-        if call_data['confidence'] >= 80:
+        data = call_data.get('data', {})
+        if data.get('requires_ocr'):
+            # No usable caption: read the image itself
+            await handle_ocr_image_call(message_obj, group)
+        elif call_data['confidence'] >= 80:
             print("[IMG] HIGH CONFIDENCE IMAGE CALL")
-            
-            # Save image to test data directory for testing (daytrade and univest)
-            if group.upper() in ['DAY', 'UNIVEST']:
-                timestamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
-                test_filename = f"src/test_data/images/call_{call_data['message_id']}_{group.lower()}_{timestamp}.jpg"
-                await client.download_media(message_obj, test_filename)
-                print(f"[TEST] Trading call image saved: {test_filename}")
-            
-            # Create directory for trading images if it doesn't exist
-            os.makedirs("trading_images", exist_ok=True)
-            
-            # Download the image
-            filename = f"trading_images/call_{call_data['message_id']}_{group.lower()}.jpg"
-            await client.download_media(message_obj, filename)
-            print(f"[SAVE] Image saved: {filename}")
-            
-            # If the image has a text caption with trading info, process it
-            data = call_data.get('data', {})
-            if not data.get('requires_ocr'):
-                # Caption contained parseable trading info
-                await process_trading_data(data, group, message_obj)
-            else:
-                # Image requires OCR - for now, just alert users
-                alert_msg = (f"HIGH CONFIDENCE IMAGE CALL DETECTED\n"
-                           f"Confidence: {call_data['confidence']}%\n" 
-                           f"Time: {call_data['timestamp']}\n"
-                           f"Saved as: {filename}\n"
-                           f"Manual review recommended")
-                
-                # await send_message_forward(group, alert_msg)  # Commented out
-                print("[ALERT] Image call alert would be sent to users")
+            # Caption (or image text) contained parseable trading info; the image itself is not needed
+            await process_trading_data(data, group, message_obj)
         else:
             print(f"[WARN] Low confidence image call ({call_data['confidence']}%), skipping...")
             
@@ -157,6 +171,38 @@ async def handle_image_call(message_obj, call_data, group):
         print(f"[ERROR] Error handling image call: {e}")
 
 
+async def handle_ocr_image_call(message_obj, group):
+    """Extract the text of a call image with local OCR and handle the result like a caption call"""
+    # Fetch the image (shared with the archive download) and keep a copy for manual review
+    stored = await media_store.fetch(message_obj)
+    if stored is None:
+        print("[ERROR] Could not download the call image")
+        return
+    filename = f"trading_images/call_{message_obj.id}_{group.lower()}.jpg"
+    await media_store.link(stored, filename)
+    print(f"[SAVE] Image saved: {filename}")
+    
+    promo_reason = await image_classifier.classify(message_obj, stored) if image_classifier else None
+    if promo_reason:
+        print(f"[SPAM] Promotional image skipped before OCR ({promo_reason})")
+        return
+    
+    image_text = await ocr_engine.extract_text(stored) if ocr_engine else None
+    if not image_text:
+        # await send_message_forward(group, alert_msg)  # Commented out
+        print(f"[ALERT] Image call without readable text, manual review recommended ({filename})")
+        return
+    
+    is_call, parsed_data, call_type = get_parser().analyze_image_text(image_text, message_obj)
+    if not is_call:
+        print("[OCR] Image text is not a trading call")
+        return
+    
+    ocr_call_data = enrich_call_data(parsed_data, call_type)
+    print(f"[OCR] Image text parsed as a trading call ({ocr_call_data['confidence']}%)")
+    await handle_image_call(message_obj, ocr_call_data, group)
+
+
 async def handle_text_call(message_obj, call_data, group):
     """Handle text-based trading calls"""
     try:
@@ -176,42 +222,16 @@ async def handle_text_call(message_obj, call_data, group):
         print(f"[ERROR] Error handling text call: {e}")
 
 
+@process_trading_data_latency.timed
 async def process_trading_data(data, group, message_obj, is_medium_confidence=False):
     """Process and send trading call data to API and users"""
     try:
-        # Validate essential data
-        if not data.get('strike') or not data.get('trigger_price'):
+        # Builds the payload from the parsed numbers; None without a strike and entry price
+        api_data = data.to_tip(group)
+        if api_data is None:
             print("[ERROR] Incomplete trading data, skipping API call")
             return
         
-        # Prepare trigger price (handle ranges like "50-60")
-        trigger_str = str(data.get('trigger_price', '0'))
-        trigger = float(trigger_str.split('-')[0]) if '-' in trigger_str else float(trigger_str)
-        
-        # Use smart stop loss and target if available, otherwise calculate basic ones
-        if data.get('smart_sl') and data.get('smart_target'):
-            stop_loss = data['smart_sl']
-            target = data['smart_target']
-        else:
-            # Fallback to basic calculation
-            stop_loss = max(0.5, trigger - 5) if trigger > 5 else trigger * 0.5
-            target = trigger + 10
-        
-        # Prepare API data
-        api_data = {
-            "instrument": {
-                "name": data.get('instrument', 'BANKNIFTY'),
-                "strike": data.get('strike'),
-                "instrumentType": data.get('option_type', 'PE')
-            },
-            "price": trigger,
-            "stopLoss": stop_loss,
-            "target": target,
-            "confidence": data.get('confidence', 0),
-            "type": group,
-            "parser_version": "enhanced_v1"
-        }
-        
         # Print detailed call information
         print(f"[INST] Instrument: {api_data['instrument']['name']}")
         print(f"[STRK] Strike: {api_data['instrument']['strike']}")
@@ -225,18 +245,16 @@ async def process_trading_data(data, group, message_obj, is_medium_confidence=Fa
             print("[API] Would send to API (commented out for testing)...")
             print(f"[DATA] API Data: {api_data}")
             
-            try:
-                print("📤 Sending to API...")
-                response = requests.post(url=api_endpoint + "tip", json=api_data, timeout=10)
-                print(f"✅ API Response: {response.status_code}")
-                
-                if response.status_code == 200:
-                    print("✅ Trading call successfully sent to API")
-                else:
-                    print(f"⚠️ API returned status code: {response.status_code}")
-                    
-            except requests.RequestException as e:
-                print(f"❌ API request failed: {e}")
+            # Skip calls another channel already sent within the duplicate window
+            first_group = call_deduplicator.claim(api_data, group, message_obj.date) if call_deduplicator else None
+            if first_group:
+                print(f"[SKIP] Duplicate of a {first_group} call, not sent again")
+            elif tip_dispatcher.submit(api_data, f"{group}:{message_obj.id}", message_obj.date):
+                print(f"📤 Queued for API (queue depth {tip_dispatcher.metrics()['queue_depth']})")
+            else:
+                print("⚠️ Tip not queued (duplicate or queue full)")
+                if call_deduplicator:
+                    call_deduplicator.release(api_data)
         else:
             # For medium confidence, just log but don't send to API
             print("[LOG] Medium confidence call logged, not sent to API")
@@ -259,32 +277,31 @@ async def handleMessages_old_backup(m, group):
 
 
 # get message from bank nifty (daytrade)
-@client.on(events.NewMessage(chats=daytrade_channel))
 async def trade(event):
     print(event.message.text)
     await handleMessages(event.message, "DAY")
 
 
 # get message from BTST
-@client.on(events.NewMessage(chats=btst_channel))
 async def trade_btst(event):
     await handleMessages(event.message, "BTST")
 
 
 # get message from univest
-@client.on(events.NewMessage(chats=univest_channel))
 async def trade_univest(event):
     print(f"[UNIVEST] Message: {event.message.text}")
     await handleMessages(event.message, "UNIVEST")
 
 
 def write_detected_calls_to_file(detected_calls, group):
-    """Write all detected trading calls to a formatted text file"""
-    import json
+    """Write all detected trading calls to a formatted text file, plus one JSON object per call"""
     from datetime import datetime
     
     filename = "detected_trading_calls.txt"
     
+    with open("detected_trading_calls.jsonl", 'wb') as f:
+        f.writelines(serializer.dumps(call) + b"\n" for call in detected_calls)
+    
     with open(filename, 'w', encoding='utf-8') as f:
         f.write("=" * 80 + "\n")
         f.write("DETECTED TRADING CALLS REPORT\n")
@@ -341,8 +358,8 @@ def write_detected_calls_to_file(detected_calls, group):
                         f.write(f"  Caption: {data.get('caption', 'No caption')}\n")
                     except:
                         f.write("  Caption: [Contains special characters]\n")
-                if data.get('message_id'):
-                    f.write(f"  Image saved as: trading_images/call_{data['message_id']}_day.jpg\n")
+                if data.get('requires_ocr') and data.get('message_id'):
+                    f.write(f"  Image saved as: trading_images/call_{data['message_id']}_{call['group'].lower()}.jpg\n")
             
             f.write("\n" + "=" * 80 + "\n\n")
         
@@ -372,77 +389,62 @@ def write_detected_calls_to_file(detected_calls, group):
         f.write(f"  Medium (50-69%): {med_conf}\n")
         f.write(f"  Low (<50%): {low_conf}\n")
     
-    print(f"\n[FILE] Detected trading calls written to: {filename}")
+    print(f"\n[FILE] Detected trading calls written to: {filename} (JSON lines: detected_trading_calls.jsonl)")
 
 
-async def save_raw_message(message_obj, group):
-    """Save raw message data to file for testing purposes"""
-    try:
-        timestamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f"src/test_data/raw_messages/{group.lower()}_{message_obj.id}_{timestamp}.json"
-        
-        message_data = {
-            'id': message_obj.id,
-            'date': str(message_obj.date),
-            'text': message_obj.text,
-            'has_media': bool(message_obj.media),
-            'media_type': str(type(message_obj.media).__name__) if message_obj.media else None,
-            'group': group,
-            'channel_id': message_obj.peer_id.channel_id if hasattr(message_obj.peer_id, 'channel_id') else None,
-            'saved_at': timestamp
-        }
-        
-        with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(message_data, f, indent=2, ensure_ascii=False)
-        
-        print(f"[TEST] Raw message saved: {filename}")
-        
-    except Exception as e:
-        print(f"[ERROR] Failed to save raw message: {e}")
+def detected_call_info(msg, group, call_data, has_media):
+    """Detailed call information for the detected calls report"""
+    return {
+        'message_id': msg.id,
+        'timestamp': str(msg.date),
+        'type': call_data['type'],
+        'confidence': call_data['confidence'],
+        'data': call_data.get('data', {}),
+        'raw_text': msg.message[:200] if msg.message else 'No text',
+        'has_media': has_media,
+        'group': group
+    }
 
 
-async def save_message_image(message_obj, group):
-    """Save message image to test data directory"""
-    try:
-        if message_obj.media:
-            timestamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
-            filename = f"src/test_data/images/msg_{message_obj.id}_{group.lower()}_{timestamp}.jpg"
-            await client.download_media(message_obj, filename)
-            print(f"[TEST] Message image saved: {filename}")
-    except Exception as e:
-        print(f"[ERROR] Failed to save message image: {e}")
-
-
-async def save_parsing_result(message_obj, call_data, group):
-    """Save parsing results to file for testing purposes"""
-    try:
-        timestamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f"src/test_data/parsing_results/{group.lower()}_{message_obj.id}_{timestamp}.json"
-        
-        parsing_result = {
-            'message_id': message_obj.id,
-            'message_text': message_obj.text,
-            'has_media': bool(message_obj.media),
-            'media_type': str(type(message_obj.media).__name__) if message_obj.media else None,
-            'group': group,
-            'parsing_result': call_data,
-            'is_trading_call': bool(call_data),
-            'confidence': call_data.get('confidence', 0) if call_data else 0,
-            'parsed_at': timestamp,
-            'message_date': str(message_obj.date)
-        }
-        
-        with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(parsing_result, f, indent=2, ensure_ascii=False)
-        
-        print(f"[TEST] Parsing result saved: {filename}")
-        
-    except Exception as e:
-        print(f"[ERROR] Failed to save parsing result: {e}")
+def replay_from_archive():
+    """
+    Backtest the parser against the local message archive instead of Telegram.
+    REPLAY_GROUPS (comma separated) and REPLAY_SINCE / REPLAY_UNTIL (ISO dates)
+    narrow the replay using the archive index. No tips are sent.
+    """
+    groups = [g.strip() for g in os.getenv("REPLAY_GROUPS", "").split(",") if g.strip()] or None
+    since = os.getenv("REPLAY_SINCE") or None
+    until = os.getenv("REPLAY_UNTIL") or None
+    
+    reader = ArchiveReader(message_archive.directory)
+    print(f"[REPLAY] {len(reader)} archived messages in {len(reader.segments)} segments")
+    
+    replayed = 0
+    detected_calls = []
+    for record, call_data in replay_archive(reader, groups, since, until):
+        replayed += 1
+        if call_data:
+            detected_calls.append(detected_call_info(record, record.group, call_data, record.has_media))
+    reader.close()
+    
+    write_detected_calls_to_file(detected_calls, ",".join(groups) if groups else "ARCHIVE")
+    
+    print(f"\n{'='*60}")
+    print(f"[SUMMARY]")
+    print(f"   Archived messages replayed: {replayed}")
+    print(f"   Trading calls detected: {len(detected_calls)}")
+    print(f"   Detected calls saved to: detected_trading_calls.txt")
+    print("="*60)
 
 
 async def main():
+    # Prometheus-style /metrics and /healthz endpoint (METRICS_PORT), up before
+    # connecting so the container health check passes during a slow connect
+    start_metrics_server()
+    asyncio.ensure_future(heartbeat())
+    
     try:
+        create_client()
         await client.start(phone=lambda: phone_number)
         print("Connected to Telegram successfully!")
     except Exception as e:
@@ -453,91 +455,104 @@ async def main():
     print("TESTING ENHANCED MESSAGE PARSER ON RECENT MESSAGES")
     print("="*60)
     
-    # Get recent messages from daytrade channel and test parsing
-    print("\n[FETCH] Fetching recent messages from daytrade channel...")
+    # Stream history page by page from both channels concurrently. By default every run
+    # re-reads the latest messages; HISTORY_RESUME=1 continues after the last processed
+    # message id of each channel, and HISTORY_SINCE (ISO date) backfills from that date,
+    # both up to HISTORY_BACKFILL_LIMIT messages per channel (default: no limit)
+    checkpoint = HistoryCheckpoint() if os.getenv("HISTORY_RESUME", "0") == "1" else None
+    since = os.getenv("HISTORY_SINCE") or None
+    if since:
+        since = datetime.datetime.fromisoformat(since)
+    backfill_limit = int(os.getenv("HISTORY_BACKFILL_LIMIT") or 0) or None
+    print("\n[FETCH] Streaming messages from daytrade and univest channels"
+          f"{' (resuming from checkpoint)' if checkpoint else ''}{f' since {since}' if since else ''}...")
     daytrade_entity = await client.get_entity(PeerChannel(daytrade_channel))
-    recent_messages = await client.get_messages(daytrade_entity, limit=1000)  # Get more messages for better analysis
-    
-    print(f"[PROC] Processing {len(recent_messages)} recent messages from daytrade...\n")
-    
-    # Also fetch from univest for comparison
-    print("\n[FETCH] Fetching recent messages from univest channel...")
     univest_entity = await client.get_entity(PeerChannel(univest_channel))
-    univest_messages = await client.get_messages(univest_entity, limit=500)
-    
-    print(f"[PROC] Processing {len(univest_messages)} recent messages from univest...\n")
-    
-    # Combine messages for processing
-    all_messages = [(msg, 'DAY') for msg in recent_messages] + [(msg, 'UNIVEST') for msg in univest_messages]
-    print(f"[TOTAL] Processing {len(all_messages)} total messages from both channels...\n")
+    channels = [('DAY', daytrade_entity, 1000), ('UNIVEST', univest_entity, 500)]
     
     trading_calls_found = 0
     detected_calls = []  # Store all detected calls
+    channel_counts = {'DAY': 0, 'UNIVEST': 0}
+    i = 0
     
-    for i, (msg, group) in enumerate(all_messages, 1):
-        print(f"\n--- Message {i} ({group}) ---")
-        print(f"[TIME] {msg.date}")
-        
-        # Show message content (handle encoding issues)
-        try:
-            if msg.message:
-                preview = msg.message[:100] if len(msg.message) > 100 else msg.message
-                print(f"[TEXT] {preview}")
-            else:
-                print(f"[TEXT] [No text content]")
-        except:
-            print(f"[TEXT] [Contains special characters]")
-        
-        # Check if it has media
-        if msg.media:
-            print(f"[MEDIA] Yes")
-        
-        # Test our enhanced parser
-        print(f"[TEST] Testing parser...")
-        await handleMessages(msg, group)
-        
-        # Check if it was detected as a trading call
-        call_data = enhanced_message_processor(msg)
-        if call_data:
-            trading_calls_found += 1
-            # Store detailed call information
-            call_info = {
-                'message_id': msg.id,
-                'timestamp': str(msg.date),
-                'type': call_data['type'],
-                'confidence': call_data['confidence'],
-                'data': call_data.get('data', {}),
-                'raw_text': msg.message[:200] if msg.message else 'No text',
-                'has_media': bool(msg.media),
-                'group': group
-            }
-            detected_calls.append(call_info)
-        
-        print("-" * 40)
-        
-        # Add small delay to avoid overwhelming output
-        if i % 10 == 0:
-            print(f"\n[INFO] Processed {i} messages so far...")
+    # Pages are parsed in batches big enough to give every BACKTEST_WORKERS process a chunk,
+    # on one process pool kept for the whole run
+    with BacktestPool() as backtest_pool:
+        async for group, page in stream_history(client, channels, checkpoint=checkpoint, since=since,
+                                                batch_size=backtest_pool.batch_size, backfill_limit=backfill_limit):
+            # Parse each batch once
+            records = [to_record(msg, group) for msg in page]
+            parse_results = await asyncio.get_event_loop().run_in_executor(None, backtest_pool.parse, records)
+            channel_counts[group] += len(page)
+        
+            for msg, call_data in zip(page, parse_results):
+                i += 1
+                print(f"\n--- Message {i} ({group}) ---")
+                print(f"[TIME] {msg.date}")
+            
+                # Show message content (handle encoding issues)
+                try:
+                    if msg.message:
+                        preview = msg.message[:100] if len(msg.message) > 100 else msg.message
+                        print(f"[TEXT] {preview}")
+                    else:
+                        print(f"[TEXT] [No text content]")
+                except:
+                    print(f"[TEXT] [Contains special characters]")
+            
+                # Check if it has media
+                if msg.media:
+                    print(f"[MEDIA] Yes")
+            
+                # Handle the message with its precomputed parse result
+                print(f"[TEST] Testing parser...")
+                await handle_parsed_message(msg, group, call_data)
+            
+                # Check if it was detected as a trading call
+                if call_data:
+                    trading_calls_found += 1
+                    detected_calls.append(detected_call_info(msg, group, call_data, bool(msg.media)))
+            
+                print("-" * 40)
+            
+                # Add small delay to avoid overwhelming output
+                if i % 10 == 0:
+                    print(f"\n[INFO] Processed {i} messages so far...")
+    
+    # Wait for queued tips to reach the API and images to be stored before reporting
+    await tip_dispatcher.drain()
+    await media_store.drain()
+    
+    # Flush and close the current archive segment
+    await asyncio.get_event_loop().run_in_executor(None, message_archive.close)
     
     # Write all detected calls to file
     write_detected_calls_to_file(detected_calls, "COMBINED_DAY_UNIVEST")
     
     print(f"\n{'='*60}")
     print(f"[SUMMARY]")
-    print(f"   Total messages processed: {len(all_messages)}")
-    print(f"   Daytrade messages: {len(recent_messages)}")
-    print(f"   Univest messages: {len(univest_messages)}")
+    print(f"   Total messages processed: {i}")
+    print(f"   Daytrade messages: {channel_counts['DAY']}")
+    print(f"   Univest messages: {channel_counts['UNIVEST']}")
     print(f"   Trading calls detected: {trading_calls_found}")
-    print(f"   Success rate: {(trading_calls_found/len(all_messages)*100):.1f}%")
-    print(f"   Raw messages saved to: src/test_data/raw_messages/")
-    print(f"   Parsing results saved to: src/test_data/parsing_results/")
-    print(f"   Images saved to: src/test_data/images/")
+    print(f"   Success rate: {(trading_calls_found/max(i, 1)*100):.1f}%")
+    print(f"   Messages archived to: {message_archive.directory}/ ({message_archive.stats['archived']} records)")
+    media = media_store.metrics()
+    print(f"   Images stored in: {media_store.directory}/ ({media['downloaded']} files, "
+          f"{media['duplicate_content']} duplicate images, {media['shared']} shared downloads)")
+    if image_classifier is not None:
+        print(f"   Promo images rejected before OCR: {image_classifier.reject_rate()*100:.1f}% "
+              f"({image_classifier.metrics()})")
     print(f"   Detected calls saved to: detected_trading_calls.txt")
     print("="*60)
 
 
-loop = asyncio.get_event_loop()
-loop.run_until_complete(main())
+if __name__ == "__main__":
+    if "--replay" in sys.argv:
+        replay_from_archive()
+    else:
+        loop = asyncio.get_event_loop()
+        loop.run_until_complete(main())
 
 
 # client.run_until_disconnected()
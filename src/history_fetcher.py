@@ -0,0 +1,192 @@
+"""
+Streaming history fetcher for Telegram channels
+Yields messages page by page from several channels concurrently and keeps a
+per-channel checkpoint of the highest processed message id for resuming
+"""
+
+import asyncio
+import json
+import os
+
+DEFAULT_CHECKPOINT_FILE = "src/test_data/history_checkpoint.json"
+
+
+class HistoryCheckpoint:
+    """
+    Highest processed message id per channel, persisted as a small JSON file.
+    Writes go to a temporary file first so a crash never leaves it truncated.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.getenv("HISTORY_CHECKPOINT_FILE", DEFAULT_CHECKPOINT_FILE)
+        self.max_ids = {}
+        if os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.max_ids = json.load(f)
+
+    def get(self, group):
+        return self.max_ids.get(group, 0)
+
+    def advance(self, group, message_id):
+        if message_id > self.get(group):
+            self.max_ids[group] = message_id
+            self.save()
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.max_ids, f)
+        os.replace(temp_path, self.path)
+
+
+async def iter_channel_pages(client, entity, min_id=0, limit=None, since=None, page_size=100):
+    """
+    Async generator yielding lists of up to page_size messages from one channel.
+    With min_id (resume) or since (backfill from a date) messages come oldest
+    first; otherwise the latest `limit` messages come newest first. limit=None
+    fetches everything.
+    """
+    kwargs = {'limit': limit, 'reverse': bool(min_id or since)}
+    if min_id:
+        kwargs['min_id'] = min_id
+    if since:
+        kwargs['offset_date'] = since
+
+    page = []
+    async for message in client.iter_messages(entity, **kwargs):
+        page.append(message)
+        if len(page) >= page_size:
+            yield page
+            page = []
+    if page:
+        yield page
+
+
+async def stream_history(client, channels, checkpoint=None, since=None, page_size=100, max_pending_pages=4,
+                         batch_size=0, backfill_limit=None):
+    """
+    Fetch several channels concurrently and yield (group, messages) as pages arrive.
+    channels is a list of (group, entity, limit), limit being how many of the
+    latest messages a newest-first fetch reads; resumed and since fetches
+    read everything, or at most backfill_limit messages per channel. Only
+    max_pending_pages pages are queued, so memory stays flat however much
+    history is fetched.
+
+    With batch_size, a channel's pages are joined until they hold at least
+    batch_size messages (or the channel ends) before being yielded, e.g. so
+    each batch keeps every worker of a BacktestPool busy.
+
+    With a checkpoint, each channel resumes after its highest processed message
+    id. The checkpoint advances once the caller asks for the next batch, i.e.
+    after the previous batch has been handled. That makes resume-after-crash
+    work only for oldest-first fetches (a stored checkpoint or since): a
+    newest-first fetch (the first run of a channel) is only checkpointed
+    once the channel is complete, so a crash during it fetches it again.
+    """
+    queue = asyncio.Queue(maxsize=max_pending_pages)
+    done = object()
+    oldest_first = {}
+
+    async def produce(group, entity, limit):
+        try:
+            min_id = checkpoint.get(group) if checkpoint else 0
+            oldest_first[group] = bool(min_id or since)
+            if oldest_first[group]:
+                limit = backfill_limit
+            async for page in iter_channel_pages(client, entity, min_id, limit, since, page_size):
+                await queue.put((group, page))
+            await queue.put((group, done))
+        except Exception as e:
+            await queue.put((group, e))
+
+    producers = [asyncio.ensure_future(produce(group, entity, limit)) for group, entity, limit in channels]
+    newest_seen = {}
+    buffers = {}
+    remaining = len(producers)
+
+    try:
+        while remaining:
+            group, page = await queue.get()
+            if isinstance(page, Exception):
+                raise page
+            finished = page is done
+            if not finished:
+                buffers.setdefault(group, []).extend(page)
+                if len(buffers[group]) < batch_size:
+                    continue
+
+            batch = buffers.pop(group, None)
+            if batch:
+                yield group, batch
+
+                batch_max_id = max(message.id for message in batch)
+                if checkpoint and oldest_first[group]:
+                    checkpoint.advance(group, batch_max_id)
+                else:
+                    newest_seen[group] = max(newest_seen.get(group, 0), batch_max_id)
+
+            if finished:
+                remaining -= 1
+                # Newest-first fetches only checkpoint once the channel is complete
+                if checkpoint and group in newest_seen:
+                    checkpoint.advance(group, newest_seen.pop(group))
+    finally:
+        for producer in producers:
+            producer.cancel()
+
+
+def test_history_fetcher():
+    """Stream two fake channels, then resume and check only new messages come back"""
+    import tempfile
+    from types import SimpleNamespace
+
+    class FakeClient:
+        def __init__(self, history):
+            self.history = history
+
+        async def iter_messages(self, entity, limit=None, reverse=False, min_id=0, offset_date=None):
+            ids = [i for i in self.history[entity] if i > min_id]
+            ids = sorted(ids, reverse=not reverse)[:limit]
+            for message_id in ids:
+                await asyncio.sleep(0)
+                yield SimpleNamespace(id=message_id)
+
+    async def collect(client, checkpoint, batch_size=0, sizes=None):
+        counts = {}
+        channels = [('DAY', 'day', 1000), ('UNIVEST', 'univest', 500)]
+        async for group, page in stream_history(client, channels, checkpoint=checkpoint, page_size=50,
+                                                batch_size=batch_size):
+            counts[group] = counts.get(group, 0) + len(page)
+            if sizes is not None:
+                sizes.append((group, len(page)))
+        return counts
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, "checkpoint.json")
+        client = FakeClient({'day': list(range(1, 1201)), 'univest': list(range(1, 301))})
+        loop = asyncio.new_event_loop()
+
+        first = loop.run_until_complete(collect(client, HistoryCheckpoint(path)))
+        print(f"First run: {first}, checkpoint {HistoryCheckpoint(path).max_ids}")
+        assert first == {'DAY': 1000, 'UNIVEST': 300}
+
+        client.history['day'].extend(range(1201, 1331))
+        second = loop.run_until_complete(collect(client, HistoryCheckpoint(path)))
+        print(f"Resumed run: {second}, checkpoint {HistoryCheckpoint(path).max_ids}")
+        assert second == {'DAY': 130}
+        assert HistoryCheckpoint(path).max_ids == {'DAY': 1330, 'UNIVEST': 300}
+
+        # A resumed backfill is not capped by the newest-first limit, and
+        # pages are joined into batches of at least batch_size messages
+        client.history['day'].extend(range(1331, 2531))
+        sizes = []
+        third = loop.run_until_complete(collect(client, HistoryCheckpoint(path), batch_size=400, sizes=sizes))
+        print(f"Resumed backfill: {third} in batches {sizes}")
+        assert third == {'DAY': 1200} and sizes == [('DAY', 400)] * 3
+        assert HistoryCheckpoint(path).max_ids == {'DAY': 2530, 'UNIVEST': 300}
+        loop.close()
+
+
+if __name__ == "__main__":
+    test_history_fetcher()
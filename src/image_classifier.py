@@ -0,0 +1,253 @@
+"""
+Image pre-classification for call images
+A cheap CPU-only check that runs before OCR and rejects obvious promotional
+images ("ZERO TO HERO" posters, profit screenshots): a perceptual hash
+matched against a library of known promo templates, plus size, shape and
+colour heuristics combined with the caption's image spam indicators.
+Works on a preview size as well as the full image, so the full image need
+only be downloaded for likely calls. Needs Pillow; without it every image
+goes on to OCR.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from collections import namedtuple
+
+from media_store import media_dimensions
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+preclassify_requests = registry.counter('image_preclassify_total', 'Image pre-classification by outcome', ['result'])
+preclassify_latency = registry.histogram('image_preclassify_seconds', 'Time to pre-classify one call image')
+
+DEFAULT_TEMPLATE_DIR = "src/test_data/promo_templates"
+TEMPLATE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp')
+
+# Colour statistics are taken from a SAMPLE_SIZE x SAMPLE_SIZE thumbnail
+SAMPLE_SIZE = 32
+
+ImageFeatures = namedtuple('ImageFeatures', ['width', 'height', 'dhash', 'saturated_share', 'green_share'])
+
+
+def preclassifier_available():
+    """True if Pillow is installed"""
+    try:
+        import PIL  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def difference_hash(pixels, width=9):
+    """64-bit dHash of 9x8 grayscale pixels in row order: one bit per pixel brighter than its right neighbour"""
+    value = 0
+    for row in range(0, len(pixels), width):
+        for col in range(width - 1):
+            value = (value << 1) | (pixels[row + col] > pixels[row + col + 1])
+    return value
+
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count('1')
+
+
+def image_features(path):
+    """Dimensions, perceptual hash and colour shares of an image file"""
+    from PIL import Image
+
+    with Image.open(path) as image:
+        width, height = image.size
+        # JPEGs decode at a reduced scale, which is most of the saving
+        image.draft('RGB', (SAMPLE_SIZE * 4, SAMPLE_SIZE * 4))
+        sample = image.convert('RGB').resize((SAMPLE_SIZE, SAMPLE_SIZE))
+
+    dhash = difference_hash(list(sample.convert('L').resize((9, 8)).getdata()))
+    saturated = green = 0
+    for hue, saturation, value in sample.convert('HSV').getdata():
+        if saturation >= 100 and value >= 60:
+            saturated += 1
+            # Pillow hue runs 0-255; green is roughly 70-170 degrees
+            if 50 <= hue <= 120:
+                green += 1
+    total = SAMPLE_SIZE * SAMPLE_SIZE
+    return ImageFeatures(width, height, dhash, saturated / total, green / total)
+
+
+def load_templates(directory, features_func=image_features):
+    """
+    Hashes of known promo images: every image in directory, plus any
+    hexadecimal hashes listed one per line in *.txt files there
+    """
+    hashes = []
+    if not directory or not os.path.isdir(directory):
+        return hashes
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        try:
+            if name.lower().endswith('.txt'):
+                with open(path) as f:
+                    hashes.extend(int(line.split()[0], 16) for line in f if line.strip() and not line.startswith('#'))
+            elif name.lower().endswith(TEMPLATE_EXTENSIONS):
+                hashes.append(features_func(path).dhash)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Skipping promo template {name}: {e}")
+    return hashes
+
+
+class ImagePreClassifier:
+    """
+    Rejects promotional call images before OCR. An image is a promo when its
+    hash is within max_distance bits of a template, when it is too small to
+    hold a readable call, or when at least min_signals of the weaker signals
+    agree: banner shape, a mostly saturated poster, a green-heavy profit
+    screenshot, image spam indicators in the caption.
+    """
+
+    def __init__(self, parser, templates=(), max_distance=10, min_side=120, min_signals=2,
+                 features_func=image_features):
+        self.parser = parser
+        self.templates = list(templates)
+        self.max_distance = max_distance
+        self.min_side = min_side
+        self.min_signals = min_signals
+        self.features_func = features_func
+        self.stats = {'passed': 0, 'template': 0, 'too_small': 0, 'heuristics': 0, 'not_image': 0, 'error': 0}
+
+    @classmethod
+    def from_env(cls, parser):
+        """
+        Classifier using the templates in PROMO_TEMPLATE_DIR, or None when
+        IMAGE_PRECLASSIFY=0 or Pillow is not installed
+        """
+        if os.getenv("IMAGE_PRECLASSIFY", "1") == "0":
+            return None
+        if not preclassifier_available():
+            logger.warning("Image pre-classification disabled: Pillow is not installed")
+            return None
+        templates = load_templates(os.getenv("PROMO_TEMPLATE_DIR", DEFAULT_TEMPLATE_DIR))
+        return cls(parser, templates, max_distance=int(os.getenv("PROMO_HASH_DISTANCE", "10")))
+
+    async def classify(self, message_obj, stored):
+        """
+        Return the reason a message's StoredMedia image (the full image or a
+        preview of it) is a promo, or None when it should go on to OCR (also
+        when the image cannot be read)
+        """
+        if not self.parser._has_image_media(message_obj):
+            # Documents that are not images have nothing to classify (or OCR)
+            self._count('not_image')
+            return None
+
+        started = time.monotonic()
+        try:
+            features = await asyncio.get_event_loop().run_in_executor(None, self.features_func, stored.path)
+        except Exception as e:
+            self._count('error')
+            logger.warning(f"Could not pre-classify image {stored.sha256[:12]}: {e}")
+            return None
+
+        # A preview is judged by the full image's size, known from the message metadata
+        dimensions = media_dimensions(message_obj)
+        if dimensions is not None:
+            features = features._replace(width=dimensions[0], height=dimensions[1])
+        reason = self.promo_reason(features, message_obj.message)
+        preclassify_latency.observe(time.monotonic() - started)
+        self._count(reason or 'passed')
+        return reason
+
+    def promo_reason(self, features, caption=""):
+        """'template', 'too_small' or 'heuristics' for a promo image, None otherwise"""
+        if any(hamming_distance(features.dhash, template) <= self.max_distance for template in self.templates):
+            return 'template'
+        if min(features.width, features.height) < self.min_side:
+            return 'too_small'
+
+        signals = (
+            features.width > features.height * 2.5,  # banner
+            features.saturated_share >= 0.5,  # poster
+            features.green_share >= 0.2,  # profit screenshot
+            self.parser.image_spam_hits(caption) >= 1
+        )
+        return 'heuristics' if sum(signals) >= self.min_signals else None
+
+    def reject_rate(self):
+        """Share of classified images rejected as promos"""
+        rejected = self.stats['template'] + self.stats['too_small'] + self.stats['heuristics']
+        checked = rejected + self.stats['passed']
+        return rejected / checked if checked else 0.0
+
+    def metrics(self):
+        return {**self.stats, 'templates': len(self.templates), 'reject_rate': round(self.reject_rate(), 3)}
+
+    def _count(self, result):
+        self.stats[result] += 1
+        preclassify_requests.inc(result=result)
+
+
+def test_image_classifier():
+    """Template matches, heuristics and the reject rate, with features supplied directly instead of decoded"""
+    import tempfile
+    from types import SimpleNamespace
+    from telethon.tl.types import MessageMediaPhoto, MessageMediaDocument, PhotoSize
+    from media_store import StoredMedia
+    from message_parser import get_parser
+
+    promo_hash = difference_hash([(i * 37) % 251 for i in range(72)])
+    near_promo = promo_hash ^ 0b10110  # 3 bits off, e.g. a recompressed repost
+    call_hash = difference_hash([(i * 11) % 97 for i in range(72)])
+    assert hamming_distance(promo_hash, call_hash) > 10
+
+    features = {
+        'template.jpg': ImageFeatures(1080, 1920, near_promo, 0.1, 0.0),
+        'sticker.jpg': ImageFeatures(96, 96, call_hash, 0.0, 0.0),
+        'profit_screenshot.jpg': ImageFeatures(1080, 2340, call_hash, 0.3, 0.25),
+        'banner.jpg': ImageFeatures(1600, 400, call_hash, 0.7, 0.0),
+        'call_screenshot.jpg': ImageFeatures(1080, 2340, call_hash, 0.05, 0.02),
+        'green_call_chart.jpg': ImageFeatures(1280, 720, call_hash, 0.3, 0.22),
+    }
+
+    def fake_features(path):
+        return features[os.path.basename(path)]
+
+    def message(caption="", media=None):
+        return SimpleNamespace(id=1, message=caption, media=media or MessageMediaPhoto(photo=None))
+
+    async def run(classifier):
+        expected = [
+            ('template.jpg', "", 'template'),
+            ('sticker.jpg', "", 'too_small'),
+            ('profit_screenshot.jpg', "", None),  # one signal alone is not enough
+            ('profit_screenshot.jpg', "🔥🔥", 'heuristics'),
+            ('banner.jpg', "", 'heuristics'),
+            ('call_screenshot.jpg', "", None),
+            ('green_call_chart.jpg', "", None),
+        ]
+        for name, caption, reason in expected:
+            stored = StoredMedia(f"{len(name):064x}", name, 0)
+            assert await classifier.classify(message(caption), stored) == reason, name
+        # A 90px preview of a full-size screenshot is not "too small"
+        preview = MessageMediaPhoto(photo=SimpleNamespace(sizes=[PhotoSize('s', 42, 90, 2000),
+                                                                 PhotoSize('y', 1080, 2340, 180000)]))
+        assert await classifier.classify(message(media=preview), StoredMedia("1" * 64, "sticker.jpg", 0)) is None
+        pdf = MessageMediaDocument(document=SimpleNamespace(mime_type='application/pdf'))
+        assert await classifier.classify(message(media=pdf), StoredMedia("0" * 64, "call.pdf", 0)) is None
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        with open(os.path.join(temp_dir, "hashes.txt"), 'w') as f:
+            f.write(f"# zero to hero poster\n{promo_hash:016x}\n")
+        with open(os.path.join(temp_dir, "notes.md"), 'w') as f:
+            f.write("ignored")
+        templates = load_templates(temp_dir, fake_features)
+        assert templates == [promo_hash]
+
+    classifier = ImagePreClassifier(get_parser(), templates, features_func=fake_features)
+    asyncio.get_event_loop().run_until_complete(run(classifier))
+    print(f"Image pre-classifier: {classifier.metrics()}")
+    assert classifier.stats['not_image'] == 1 and abs(classifier.reject_rate() - 4 / 8) < 1e-9
+
+
+if __name__ == "__main__":
+    test_image_classifier()
@@ -0,0 +1,176 @@
+"""
+Local OCR for image calls
+Text is extracted from downloaded call images with Tesseract (pytesseract +
+Pillow, optional) so image-only tips can be parsed like text calls. Each
+image runs in its own tesseract process; a small thread pool bounds how many
+run at once, so the event loop never waits on OCR.
+"""
+
+import asyncio
+import logging
+import os
+import shutil
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+ocr_requests = registry.counter('ocr_requests_total', 'OCR requests by outcome', ['result'])
+ocr_latency = registry.histogram('ocr_seconds', 'Time to extract text from one call image')
+
+
+def ocr_available():
+    """True if pytesseract, Pillow and the tesseract binary are installed"""
+    try:
+        import pytesseract
+        import PIL  # noqa: F401
+    except ImportError:
+        return False
+    return shutil.which(pytesseract.pytesseract.tesseract_cmd) is not None
+
+
+def run_tesseract(path, lang='eng', timeout=10.0):
+    """Extract text from an image file; raises TimeoutError when tesseract runs too long"""
+    import pytesseract
+    from PIL import Image, ImageOps
+
+    with Image.open(path) as image:
+        # Grayscale with stretched contrast reads better on dark-mode screenshots
+        image = ImageOps.autocontrast(image.convert('L'))
+        try:
+            return pytesseract.image_to_string(image, lang=lang, timeout=timeout)
+        except RuntimeError as e:
+            if 'timeout' in str(e).lower():
+                raise TimeoutError(f"tesseract timed out after {timeout}s") from e
+            raise
+
+
+class OcrEngine:
+    """
+    Runs ocr_func(path, lang, timeout) for StoredMedia images with at most
+    workers running at once. Results are cached by image SHA-256, and
+    concurrent requests for the same image share one run.
+    """
+
+    def __init__(self, workers=2, timeout=10.0, lang='eng', cache_size=1024, ocr_func=run_tesseract):
+        self.workers = workers
+        self.timeout = timeout
+        self.lang = lang
+        self.cache_size = cache_size
+        self.ocr_func = ocr_func
+        self.stats = {'cache_hit': 0, 'ok': 0, 'empty': 0, 'timeout': 0, 'error': 0}
+        self._cache = OrderedDict()
+        self._pending = {}
+        self._executor = None
+
+    @classmethod
+    def from_env(cls):
+        """
+        Engine configured by OCR_WORKERS / OCR_TIMEOUT / OCR_LANG, or None when
+        OCR_ENABLED=0 or Tesseract is not installed
+        """
+        if os.getenv("OCR_ENABLED", "1") == "0":
+            return None
+        if not ocr_available():
+            logger.warning("OCR disabled: pytesseract, Pillow or the tesseract binary is not installed")
+            return None
+        return cls(int(os.getenv("OCR_WORKERS", "2")), float(os.getenv("OCR_TIMEOUT", "10")),
+                   os.getenv("OCR_LANG", "eng"))
+
+    async def extract_text(self, stored):
+        """Text found in a StoredMedia image ('' if none), or None when OCR failed or timed out"""
+        text = self._cache.get(stored.sha256)
+        if text is not None:
+            self._cache.move_to_end(stored.sha256)
+            self._count('cache_hit')
+            return text
+
+        task = self._pending.get(stored.sha256)
+        if task is None:
+            task = asyncio.ensure_future(self._run(stored))
+            self._pending[stored.sha256] = task
+        return await asyncio.shield(task)
+
+    def metrics(self):
+        return {**self.stats, 'cached': len(self._cache), 'pending': len(self._pending)}
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+
+    def _count(self, result):
+        self.stats[result] += 1
+        ocr_requests.inc(result=result)
+
+    async def _run(self, stored):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="ocr")
+        loop = asyncio.get_event_loop()
+        started = time.monotonic()
+        try:
+            future = loop.run_in_executor(self._executor, self.ocr_func, stored.path, self.lang, self.timeout)
+            # ocr_func enforces the timeout on tesseract itself; this bounds time spent queued as well
+            text = (await asyncio.wait_for(future, self.timeout * 2)).strip()
+        except (asyncio.TimeoutError, TimeoutError):
+            self._count('timeout')
+            logger.warning(f"OCR timed out for image {stored.sha256[:12]}")
+            return None
+        except Exception as e:
+            self._count('error')
+            logger.error(f"OCR failed for image {stored.sha256[:12]}: {e}")
+            return None
+        finally:
+            self._pending.pop(stored.sha256, None)
+
+        ocr_latency.observe(time.monotonic() - started)
+        self._count('ok' if text else 'empty')
+        self._cache[stored.sha256] = text
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return text
+
+
+def test_image_ocr():
+    """Cache, shared runs and timeouts, with a stand-in for tesseract reading text files"""
+    import tempfile
+    import threading
+    from media_store import StoredMedia
+
+    calls = []
+    lock = threading.Lock()
+
+    def fake_ocr(path, lang, timeout):
+        with lock:
+            calls.append(path)
+        with open(path) as f:
+            text = f.read()
+        time.sleep(0.5 if text == "slow" else 0.02)
+        return text + "\n"
+
+    async def run(engine, images):
+        texts = await asyncio.gather(*(engine.extract_text(images[0]) for _ in range(3)))
+        assert texts == ["SENSEX 81400 PE ABV 50-60"] * 3 and len(calls) == 1
+        assert await engine.extract_text(images[0]) == texts[0] and len(calls) == 1
+        assert await engine.extract_text(images[1]) is None
+        assert await engine.extract_text(images[2]) == ""
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        images = []
+        for index, text in enumerate(["SENSEX 81400 PE ABV 50-60", "slow", ""]):
+            path = os.path.join(temp_dir, f"{index}.txt")
+            with open(path, 'w') as f:
+                f.write(text)
+            images.append(StoredMedia(f"{index:064x}", path, len(text)))
+
+        engine = OcrEngine(workers=2, timeout=0.1, ocr_func=fake_ocr)
+        asyncio.get_event_loop().run_until_complete(run(engine, images))
+        engine.close()
+        print(f"OCR engine: {engine.metrics()}")
+        assert engine.stats == {'cache_hit': 1, 'ok': 1, 'empty': 1, 'timeout': 1, 'error': 0}
+
+
+if __name__ == "__main__":
+    test_image_ocr()
@@ -0,0 +1,83 @@
+"""
+Multi-pattern keyword matcher for the message parser
+Aho-Corasick automaton that finds every keyword occurrence in one pass
+"""
+
+from collections import deque
+
+
+class KeywordMatcher:
+    """
+    Aho-Corasick automaton built once from the parser keyword tables.
+    A single pass over a message reports every keyword hit with its
+    position, replacing one substring scan per keyword.
+    """
+
+    def __init__(self, keywords):
+        self.keywords = list(dict.fromkeys(keyword for keyword in keywords if keyword))
+
+        # Trie of keyword characters; outputs[state] lists keywords ending there
+        transitions = [{}]
+        self._outputs = [()]
+        for keyword in self.keywords:
+            state = 0
+            for char in keyword:
+                if char not in transitions[state]:
+                    transitions.append({})
+                    self._outputs.append(())
+                    transitions[state][char] = len(transitions) - 1
+                state = transitions[state][char]
+            self._outputs[state] += (keyword,)
+
+        # Breadth-first pass to fill failure links and merge their outputs,
+        # then fold failure links into the transition table so matching is
+        # one dictionary lookup per character
+        failures = [0] * len(transitions)
+        self._transitions = [dict(transitions[0])]
+        self._transitions.extend({} for _ in range(len(transitions) - 1))
+        queue = deque(transitions[0].values())
+        while queue:
+            state = queue.popleft()
+            failure = failures[state]
+            self._outputs[state] += self._outputs[failure]
+            self._transitions[state] = dict(self._transitions[failure])
+            self._transitions[state].update(transitions[state])
+            for char, child in transitions[state].items():
+                failures[child] = self._transitions[failure].get(char, 0)
+                queue.append(child)
+
+    def find_all(self, text):
+        """
+        Scan text once and return every keyword hit.
+        Returns: dict of keyword -> list of start positions, in order of occurrence
+        """
+        hits = {}
+        transitions = self._transitions
+        outputs = self._outputs
+        state = 0
+
+        for end, char in enumerate(text, 1):
+            state = transitions[state].get(char, 0)
+            if outputs[state]:
+                for keyword in outputs[state]:
+                    hits.setdefault(keyword, []).append(end - len(keyword))
+
+        return hits
+
+    @staticmethod
+    def longest_matches(hits, keywords):
+        """
+        Keep hits of the given keywords that are not inside a longer hit,
+        so NIFTY is not reported inside BANKNIFTY or FINNIFTY
+        Returns: dict of keyword -> list of start positions
+        """
+        spans = [(start, start + len(keyword), keyword)
+                 for keyword in keywords for start in hits.get(keyword, ())]
+
+        longest = {}
+        for start, end, keyword in spans:
+            if any(other_start <= start and end <= other_end and other_end - other_start > end - start
+                   for other_start, other_end, _ in spans):
+                continue
+            longest.setdefault(keyword, []).append(start)
+        return longest
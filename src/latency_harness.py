@@ -0,0 +1,190 @@
+"""
+End-to-end latency harness for the production bot
+Feeds synthetic NewMessage events into the handlers in telegram_bot.py, with
+Telethon's client replaced by an in-process stand-in and TRADING_API_ENDPOINT
+pointed at a local stub API, and reports receipt-to-POST latency under load
+
+Usage:
+    python src/latency_harness.py --rate 200 --messages 2000
+    python src/latency_harness.py --check --max-p99-ms 250 --max-loop-lag-ms 100
+"""
+
+import argparse
+import asyncio
+import datetime
+import os
+import sys
+import tempfile
+import threading
+import time
+from types import SimpleNamespace
+
+import telethon
+from telethon.tl.types import MessageMediaPhoto
+
+from parser_benchmark import load_corpus
+from tip_dispatcher import start_stub_api
+
+
+class FakeTelegramClient:
+    """
+    In-process stand-in for TelegramClient: records handlers registered with
+    @client.on(events.NewMessage(chats=...)) and lets the harness emit events
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.handlers = []
+
+    def on(self, event_builder):
+        def register(handler):
+            self.handlers.append((event_builder.chats, handler))
+            return handler
+        return register
+
+    async def emit(self, chat_id, message):
+        event = SimpleNamespace(message=message, chat_id=chat_id)
+        for chats, handler in self.handlers:
+            if chats is None or chat_id == chats or (isinstance(chats, (list, tuple, set)) and chat_id in chats):
+                await handler(event)
+
+
+def load_bot(api_url):
+    """Import telegram_bot against the fake client and the stub API"""
+    os.environ.update({
+        'TELEGRAM_API_ID': os.getenv('TELEGRAM_API_ID', '1'),
+        'TELEGRAM_API_HASH': os.getenv('TELEGRAM_API_HASH', 'harness'),
+        'TELEGRAM_PHONE_NUMBER': os.getenv('TELEGRAM_PHONE_NUMBER', '+10000000000'),
+        'TELEGRAM_SESSION_NAME': os.path.join(tempfile.mkdtemp(), 'harness'),
+        'TRADING_API_ENDPOINT': api_url,
+        # Keep the file log like production, but not the console flood
+        'LOG_TO_CONSOLE': '0',
+        # Synthetic image messages have no file to download and read
+        'OCR_ENABLED': '0'
+    })
+    telethon.TelegramClient = FakeTelegramClient
+
+    import telegram_bot
+
+    # Outside market hours the ingest stage would drop everything
+    telegram_bot.is_trading_hours = lambda: True
+    return telegram_bot
+
+
+async def measure_loop_lag(samples, interval=0.01):
+    """Record how late the event loop wakes up; blocking calls show up here"""
+    loop = asyncio.get_event_loop()
+    while True:
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        samples.append(loop.time() - expected)
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+async def run_harness(rate=200.0, messages=2000, api_delay=0.0):
+    """Feed messages at rate per second and return latency and throughput figures"""
+    sent_at = {}
+    posted_at = {}
+    lock = threading.Lock()
+
+    def on_receive(key, tip):
+        with lock:
+            posted_at[key] = time.monotonic()
+
+    server, _ = start_stub_api(api_delay=api_delay, on_receive=on_receive)
+    bot = load_bot(f"http://127.0.0.1:{server.server_port}/")
+    channels = [(bot.daytrade_channel, 'DAY'), (bot.btst_channel, 'BTST'), (bot.univest_channel, 'UNIVEST')]
+
+    corpus = load_corpus()
+    bot.message_pipeline.start()
+    lag_samples = []
+    lag_task = asyncio.ensure_future(measure_loop_lag(lag_samples))
+    handler_latencies = []
+
+    started = time.monotonic()
+    for i in range(messages):
+        # Pace against the schedule rather than sleeping a fixed gap
+        delay = started + i / rate - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        record = corpus[i % len(corpus)]
+        chat_id, group = channels[i % len(channels)]
+        message = SimpleNamespace(
+            id=i + 1,
+            date=datetime.datetime.now(datetime.timezone.utc),
+            message=record.message,
+            text=record.message,
+            media=MessageMediaPhoto() if record.media else None
+        )
+        sent_at[f"{group}:{message.id}"] = time.monotonic()
+        handler_started = time.monotonic()
+        await bot.client.emit(chat_id, message)
+        handler_latencies.append(time.monotonic() - handler_started)
+
+    feed_seconds = time.monotonic() - started
+    await bot.message_pipeline.drain()
+    await bot.tip_dispatcher.drain()
+    elapsed = time.monotonic() - started
+
+    lag_task.cancel()
+    bot.message_pipeline.close()
+    bot.tip_dispatcher.close()
+    server.shutdown()
+
+    with lock:
+        latencies = [posted_at[key] - sent_at[key] for key in posted_at if key in sent_at]
+    return {
+        'messages': messages,
+        'target_rate': rate,
+        'achieved_rate': round(messages / feed_seconds, 1),
+        'tips_posted': len(latencies),
+        'tips_per_sec': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 0.5) * 1000, 2) if latencies else None,
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 2) if latencies else None,
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2) if latencies else None,
+        'max_ms': round(max(latencies) * 1000, 2) if latencies else None,
+        'handler_p99_ms': round(percentile(handler_latencies, 0.99) * 1000, 3),
+        'max_loop_lag_ms': round(max(lag_samples, default=0.0) * 1000, 2)
+    }
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Receipt-to-POST latency harness for telegram_bot.py")
+    parser.add_argument('--rate', type=float, default=200.0, help="messages per second to feed")
+    parser.add_argument('--messages', type=int, default=2000, help="number of messages to feed")
+    parser.add_argument('--api-delay', type=float, default=0.0, help="seconds the stub API waits per request")
+    parser.add_argument('--check', action='store_true', help="exit 1 if a threshold is exceeded")
+    parser.add_argument('--max-p99-ms', type=float, default=250.0)
+    parser.add_argument('--max-loop-lag-ms', type=float, default=100.0)
+    args = parser.parse_args(argv)
+
+    loop = asyncio.get_event_loop()
+    result = loop.run_until_complete(run_harness(args.rate, args.messages, args.api_delay))
+
+    print("=== END-TO-END LATENCY HARNESS ===\n")
+    for key, value in result.items():
+        print(f"  {key}: {value}")
+
+    if args.check:
+        problems = []
+        if not result['tips_posted']:
+            problems.append("no tips reached the stub API")
+        elif result['p99_ms'] > args.max_p99_ms:
+            problems.append(f"p99 receipt-to-POST {result['p99_ms']} ms > {args.max_p99_ms} ms")
+        if result['max_loop_lag_ms'] > args.max_loop_lag_ms:
+            problems.append(f"event loop blocked for {result['max_loop_lag_ms']} ms > {args.max_loop_lag_ms} ms")
+        if problems:
+            print("\n[REGRESSION] " + "\n[REGRESSION] ".join(problems))
+            return 1
+        print("\n[OK] Latency within thresholds")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,142 @@
+"""
+Queue-based logging for the bot
+Log calls on the event loop only enqueue records; a QueueListener thread
+formats them and writes JSON lines to a size-rotated file (and plain text to
+the console), so disk latency never reaches the message handlers
+"""
+
+import atexit
+import copy
+import datetime
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record; the fields of extra={'event': {...}} are merged in"""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage()
+        }
+        event = getattr(record, 'event', None)
+        if isinstance(event, dict):
+            entry.update(event)
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            # Formatted before the record was queued, see TracebackQueueHandler
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TracebackQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that keeps a record's traceback in exc_text, where the
+    file and console formatters find it. The stock prepare() appends it to
+    the message and drops exc_info, so the JSON log had no exception field.
+    """
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        # Traceback objects keep whole frames alive while the record waits in the queue
+        record.exc_info = None
+        return record
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keeps only a fraction of records logged with extra={'sampled': True}
+    (e.g. one line per non-call message); other records always pass
+    """
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if getattr(record, 'sampled', False):
+            return self.rate > 0 and (self.rate >= 1 or random.random() < self.rate)
+        return True
+
+
+def setup_logging(log_file='telegram_bot.log', level=logging.INFO, max_bytes=None, backup_count=None,
+                  sample_rate=None, console=None):
+    """
+    Route the root logger through a QueueHandler and start the QueueListener.
+    LOG_MAX_BYTES / LOG_BACKUP_COUNT control rotation, LOG_SAMPLE_RATE the
+    share of sampled records kept (default 0) and LOG_TO_CONSOLE=0 turns off
+    console output. Returns the listener, which is also stopped at exit.
+    """
+    if max_bytes is None:
+        max_bytes = int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+    if backup_count is None:
+        backup_count = int(os.getenv("LOG_BACKUP_COUNT", "5"))
+    if sample_rate is None:
+        sample_rate = float(os.getenv("LOG_SAMPLE_RATE", "0"))
+    if console is None:
+        console = os.getenv("LOG_TO_CONSOLE", "1") != "0"
+
+    file_handler = logging.handlers.RotatingFileHandler(log_file, maxBytes=max_bytes, backupCount=backup_count,
+                                                        encoding='utf-8')
+    file_handler.setFormatter(JsonFormatter())
+    handlers = [file_handler]
+    if console:
+        console_handler = logging.StreamHandler()
+        console_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+        handlers.append(console_handler)
+
+    log_queue = queue.Queue(-1)
+    queue_handler = TracebackQueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(sample_rate))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+
+def test_logging_setup():
+    """A logged exception reaches the JSON file with its traceback in the exception field"""
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        log_file = os.path.join(temp_dir, "test.log")
+        listener = setup_logging(log_file, console=False)
+        logger = logging.getLogger("logging_setup_test")
+        try:
+            raise ValueError("bad tip payload")
+        except ValueError:
+            logger.exception("Tip %s failed", "DAY:1", extra={'event': {'event': 'tip_failed'}})
+        atexit.unregister(listener.stop)
+        listener.stop()
+        for handler in listener.handlers:
+            handler.close()
+
+        with open(log_file, encoding='utf-8') as f:
+            entry = json.loads(f.readline())
+        print(f"JSON log entry: {entry['message']!r}, exception of {len(entry['exception'])} chars")
+        assert entry['message'] == "Tip DAY:1 failed" and entry['event'] == 'tip_failed'
+        assert entry['exception'].startswith("Traceback") and "ValueError: bad tip payload" in entry['exception']
+
+
+if __name__ == "__main__":
+    test_logging_setup()
@@ -0,0 +1,316 @@
+"""
+Shared media downloads for the message handlers
+Each Telegram file is downloaded at most once, by a bounded number of
+concurrent downloads, and stored on disk under its content hash so a
+screenshot reposted across channels is kept once. Handlers only fetch media
+when they need the bytes (archival, OCR/manual review), and can fetch a small
+preview size of a photo first to decide whether the full image is needed.
+"""
+
+import asyncio
+import hashlib
+import logging
+import mimetypes
+import os
+import shutil
+import tempfile
+from collections import OrderedDict, namedtuple
+
+from telethon.tl.types import DocumentAttributeImageSize, MessageMediaPhoto, PhotoSize, PhotoSizeProgressive
+
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+media_requests = registry.counter('media_requests_total', 'Media fetches by outcome', ['result'])
+
+DEFAULT_MEDIA_DIR = "src/test_data/media"
+
+# Previews are the smallest photo size at least this many pixels on its longer side
+# (Telegram's 's' size is about 100px; the inline stripped size is too blurred to classify)
+PREVIEW_MIN_SIDE = 90
+
+StoredMedia = namedtuple('StoredMedia', ['sha256', 'path', 'size'])
+
+
+def media_key(message_obj):
+    """Key shared by every message carrying the same Telegram file (forwards keep the file id)"""
+    media = message_obj.media
+    for kind in ('photo', 'document'):
+        file = getattr(media, kind, None)
+        if getattr(file, 'id', None) is not None:
+            return kind, file.id
+    return 'message', getattr(message_obj, 'chat_id', None), message_obj.id
+
+
+def _size_bytes(size):
+    return max(size.sizes) if isinstance(size, PhotoSizeProgressive) else size.size
+
+
+def _photo_sizes(message_obj):
+    """Downloadable sizes of a photo message (those with dimensions), smallest first"""
+    if not isinstance(message_obj.media, MessageMediaPhoto):
+        return []
+    sizes = getattr(message_obj.media.photo, 'sizes', None) or []
+    return sorted((size for size in sizes if isinstance(size, (PhotoSize, PhotoSizeProgressive))), key=_size_bytes)
+
+
+def preview_size(message_obj, min_side=PREVIEW_MIN_SIDE):
+    """Smallest photo size at least min_side pixels on its longer side, or None if that is the full image"""
+    sizes = _photo_sizes(message_obj)
+    for size in sizes[:-1]:
+        if max(size.w, size.h) >= min_side:
+            return size
+    return None
+
+
+def media_dimensions(message_obj):
+    """(width, height) of the full image in a message, from its metadata, or None"""
+    sizes = _photo_sizes(message_obj)
+    if sizes:
+        return sizes[-1].w, sizes[-1].h
+    for attribute in getattr(getattr(message_obj.media, 'document', None), 'attributes', None) or []:
+        if isinstance(attribute, DocumentAttributeImageSize):
+            return attribute.w, attribute.h
+    return None
+
+
+def media_extension(message_obj):
+    if isinstance(message_obj.media, MessageMediaPhoto):
+        return ".jpg"
+    mime_type = getattr(getattr(message_obj.media, 'document', None), 'mime_type', None)
+    return (mimetypes.guess_extension(mime_type) if mime_type else None) or ".bin"
+
+
+class MediaStore:
+    """
+    Content-addressed media cache in front of client.download_media.
+    fetch() returns an awaitable StoredMedia (None on failure); concurrent and
+    repeated fetches of the same file share one download, and files are laid
+    out as <directory>/<sha256[:2]>/<sha256><ext>.
+    """
+
+    def __init__(self, client, directory=None, workers=None, recent_size=1024):
+        self.client = client
+        self.directory = directory or os.getenv("MEDIA_DIR", DEFAULT_MEDIA_DIR)
+        self.workers = workers or int(os.getenv("MEDIA_DOWNLOAD_WORKERS", "4"))
+        self.recent_size = recent_size
+        self.stats = {'downloaded': 0, 'shared': 0, 'duplicate_content': 0, 'preview': 0, 'failed': 0,
+                      'bytes': 0, 'preview_bytes': 0}
+        self._slots = None
+        self._pending = {}
+        self._recent = OrderedDict()
+
+    def fetch(self, message_obj):
+        """
+        Awaitable for the message's StoredMedia, starting the download unless
+        the file is already being fetched or was fetched recently. The download
+        runs in the background, so callers that only want the file archived
+        need not await it.
+        """
+        return self._fetch(media_key(message_obj), message_obj)
+
+    def fetch_preview(self, message_obj):
+        """
+        Like fetch(), for the smallest preview size of a photo (see
+        preview_size). Media without a smaller size fetches the full file,
+        which a later fetch() of the same message then shares.
+        """
+        size = preview_size(message_obj)
+        if size is None:
+            return self.fetch(message_obj)
+        return self._fetch(media_key(message_obj) + ('preview', size.type), message_obj, size)
+
+    def _fetch(self, key, message_obj, thumb=None):
+        loop = asyncio.get_event_loop()
+
+        stored = self._recent.get(key)
+        if stored is not None:
+            self._recent.move_to_end(key)
+            self._count('shared')
+            future = loop.create_future()
+            future.set_result(stored)
+            return future
+
+        task = self._pending.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._download(key, message_obj, thumb))
+            self._pending[key] = task
+        else:
+            self._count('shared')
+        # One caller being cancelled must not cancel the download for the others
+        return asyncio.shield(task)
+
+    async def link(self, stored, path):
+        """Expose a stored file under another name (hard link, copied if linking fails)"""
+        await asyncio.get_event_loop().run_in_executor(None, _link_or_copy, stored.path, path)
+        return path
+
+    async def drain(self):
+        """Wait for every download in progress"""
+        while self._pending:
+            await asyncio.gather(*list(self._pending.values()), return_exceptions=True)
+
+    def metrics(self):
+        return {**self.stats, 'pending': len(self._pending), 'recent': len(self._recent)}
+
+    def _count(self, result):
+        self.stats[result] += 1
+        media_requests.inc(result=result)
+
+    async def _download(self, key, message_obj, thumb=None):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.workers)
+        try:
+            async with self._slots:
+                data = await self.client.download_media(message_obj, file=bytes, thumb=thumb)
+            if not data:
+                self._count('failed')
+                return None
+
+            stored, is_new = await asyncio.get_event_loop().run_in_executor(
+                None, self._store, data, ".jpg" if thumb is not None else media_extension(message_obj))
+            if thumb is not None:
+                self._count('preview')
+                self.stats['preview_bytes'] += len(data)
+            else:
+                self._count('downloaded' if is_new else 'duplicate_content')
+                self.stats['bytes'] += len(data)
+
+            self._recent[key] = stored
+            while len(self._recent) > self.recent_size:
+                self._recent.popitem(last=False)
+            return stored
+        except Exception as e:
+            self._count('failed')
+            logger.error(f"Media download failed for message {message_obj.id}: {e}")
+            return None
+        finally:
+            self._pending.pop(key, None)
+
+    def _store(self, data, extension):
+        """Write data under its hash unless an identical file is already stored; returns (StoredMedia, is_new)"""
+        sha256 = hashlib.sha256(data).hexdigest()
+        path = os.path.join(self.directory, sha256[:2], sha256 + extension)
+        if os.path.exists(path):
+            return StoredMedia(sha256, path, len(data)), False
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Identical bytes from two channels may be stored concurrently; each writes its own temp file
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+        return StoredMedia(sha256, path, len(data)), True
+
+
+def _link_or_copy(source, path):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    if os.path.exists(path):
+        os.remove(path)
+    try:
+        os.link(source, path)
+    except OSError:
+        shutil.copyfile(source, path)
+
+
+def test_media_store():
+    """Concurrent and repeated fetches share one download; identical bytes are stored once"""
+    from types import SimpleNamespace
+
+    class FakeClient:
+        def __init__(self):
+            self.downloads = 0
+            self.active = 0
+            self.max_active = 0
+
+        async def download_media(self, message_obj, file=None, thumb=None):
+            self.downloads += 1
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+            await asyncio.sleep(0.01)
+            self.active -= 1
+            # Messages 1-3 carry the same screenshot under different file ids
+            return b"screenshot" if message_obj.id <= 3 else f"image {message_obj.id}".encode()
+
+    def message(message_id, photo_id):
+        return SimpleNamespace(id=message_id, chat_id=-100, media=MessageMediaPhoto(photo=SimpleNamespace(id=photo_id)))
+
+    async def run(store, client):
+        first = message(1, 501)
+        forwarded = message(9, 501)
+        results = await asyncio.gather(store.fetch(first), store.fetch(first), store.fetch(forwarded))
+        assert client.downloads == 1 and len({r.path for r in results}) == 1
+
+        again = await store.fetch(first)
+        assert client.downloads == 1 and again == results[0]
+
+        reposts = await asyncio.gather(store.fetch(message(2, 502)), store.fetch(message(3, 503)))
+        assert client.downloads == 3 and {r.path for r in reposts} == {results[0].path}
+
+        others = await asyncio.gather(*(store.fetch(message(i, 600 + i)) for i in range(4, 24)))
+        assert client.max_active <= store.workers
+        assert len({r.sha256 for r in others}) == 20
+
+        linked = await store.link(others[0], os.path.join(store.directory, "named", "call_4_day.jpg"))
+        with open(linked, 'rb') as f:
+            assert f.read() == b"image 4"
+        await store.drain()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        client = FakeClient()
+        store = MediaStore(client, directory=temp_dir, workers=3)
+        asyncio.get_event_loop().run_until_complete(run(store, client))
+        stored_files = sum(len(files) for root, _, files in os.walk(temp_dir) if 'named' not in root)
+        print(f"{client.downloads} downloads for 26 fetches, {stored_files} files stored: {store.metrics()}")
+        assert stored_files == 21 and store.stats['duplicate_content'] == 2
+
+
+def test_media_previews():
+    """Previews use the smallest usable photo size, and media without one falls back to the shared full file"""
+    from types import SimpleNamespace
+    from telethon.tl.types import MessageMediaDocument, PhotoStrippedSize
+
+    class FakeClient:
+        def __init__(self):
+            self.requests = []
+
+        async def download_media(self, message_obj, file=None, thumb=None):
+            self.requests.append((message_obj.id, thumb.type if thumb else None))
+            return f"{message_obj.id} {thumb.type if thumb else 'full'}".encode()
+
+    sizes = [PhotoSize('x', 800, 1731, 90000), PhotoStrippedSize('i', b"tiny"),
+             PhotoSize('m', 148, 320, 9000), PhotoSize('s', 42, 90, 2000), PhotoSize('y', 1080, 2340, 180000)]
+    photo = SimpleNamespace(id=801, sizes=sizes)
+    call_image = SimpleNamespace(id=1, chat_id=-100, media=MessageMediaPhoto(photo=photo))
+    single_size = SimpleNamespace(id=2, chat_id=-100, media=MessageMediaPhoto(
+        photo=SimpleNamespace(id=802, sizes=[PhotoSize('x', 800, 600, 50000)])))
+    document = SimpleNamespace(id=3, chat_id=-100, media=MessageMediaDocument(document=SimpleNamespace(
+        id=803, mime_type='image/png', attributes=[DocumentAttributeImageSize(1200, 300)])))
+
+    assert preview_size(call_image).type == 's' and preview_size(single_size) is None
+    assert media_dimensions(call_image) == (1080, 2340) and media_dimensions(document) == (1200, 300)
+
+    async def run(store, client):
+        preview = await store.fetch_preview(call_image)
+        full = await store.fetch(call_image)
+        assert preview.path != full.path and client.requests == [(1, 's'), (1, None)]
+        assert await store.fetch_preview(call_image) == preview and len(client.requests) == 2
+
+        for message_obj in (single_size, document):
+            assert await store.fetch_preview(message_obj) == await store.fetch(message_obj)
+        assert client.requests[2:] == [(2, None), (3, None)]
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        client = FakeClient()
+        store = MediaStore(client, directory=temp_dir)
+        asyncio.get_event_loop().run_until_complete(run(store, client))
+        print(f"Previews: {store.metrics()}")
+        assert store.stats['preview'] == 1 and store.stats['preview_bytes'] == len(b"1 s")
+
+
+if __name__ == "__main__":
+    test_media_store()
+    test_media_previews()
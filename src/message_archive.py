@@ -0,0 +1,203 @@
+"""
+Append-only message archive
+Each raw message and its parse result are stored as one JSON line in
+size-rotated segment files, written by a background thread so the event loop
+never blocks on disk I/O
+"""
+
+import datetime
+import gzip
+import json
+import logging
+import os
+import queue
+import re
+import shutil
+import threading
+
+import serializer
+from message_parser import get_parser
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ARCHIVE_DIR = "src/test_data/archive"
+SEGMENT_PREFIX = "messages-"
+SEGMENT_SUFFIX = ".jsonl"
+SEGMENT_PATTERN = re.compile(r'^messages-(\d{6})\.jsonl(\.gz)?$')
+
+
+def archive_record(message_obj, group, call_data):
+    """Build the archive record for a message and its parse result (None if not a call)"""
+    return {
+        'id': message_obj.id,
+        'date': message_obj.date.isoformat() if message_obj.date else None,
+        'text': message_obj.message,
+        'has_media': bool(message_obj.media),
+        'media_type': type(message_obj.media).__name__ if message_obj.media else None,
+        'has_image': bool(message_obj.media) and get_parser()._has_image_media(message_obj),
+        'group': group,
+        'channel_id': getattr(message_obj.peer_id, 'channel_id', None),
+        'parsing_result': call_data,
+        'is_trading_call': bool(call_data),
+        'confidence': call_data.get('confidence', 0) if call_data else 0,
+        'archived_at': datetime.datetime.now().isoformat()
+    }
+
+
+def list_segments(directory):
+    """Segment paths in the archive directory, oldest first"""
+    if not os.path.isdir(directory):
+        return []
+
+    segments = []
+    for name in os.listdir(directory):
+        match = SEGMENT_PATTERN.match(name)
+        if match:
+            segments.append((int(match.group(1)), os.path.join(directory, name)))
+    return [path for _, path in sorted(segments)]
+
+
+class MessageArchive:
+    """
+    Background writer for the JSON-lines archive.
+    append() only enqueues; a writer thread serialises records, appends them
+    to the current segment and starts a new one after max_segment_bytes.
+    With compress=True, finished segments are gzipped in place.
+    """
+
+    def __init__(self, directory=None, max_segment_bytes=None, compress=None, queue_size=10000):
+        self.directory = directory or os.getenv("MESSAGE_ARCHIVE_DIR", DEFAULT_ARCHIVE_DIR)
+        if max_segment_bytes is None:
+            max_segment_bytes = int(float(os.getenv("MESSAGE_ARCHIVE_SEGMENT_MB", "64")) * 1024 * 1024)
+        if compress is None:
+            compress = os.getenv("MESSAGE_ARCHIVE_COMPRESS", "0") == "1"
+        self.max_segment_bytes = max_segment_bytes
+        self.compress = compress
+        self.stats = {'archived': 0, 'dropped': 0, 'segments': 0, 'errors': 0}
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._file = None
+        self._segment_path = None
+        self._segment_bytes = 0
+        self._next_segment = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def append(self, record):
+        """Queue a record for writing; returns False if the writer is saturated"""
+        self._ensure_writer()
+        try:
+            self._queue.put_nowait(record)
+            return True
+        except queue.Full:
+            self.stats['dropped'] += 1
+            logger.warning("Message archive queue full, record dropped")
+            return False
+
+    def _ensure_writer(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                os.makedirs(self.directory, exist_ok=True)
+                existing = list_segments(self.directory)
+                # Never reopen an old segment; a crash may have left it mid-line
+                self._next_segment = int(SEGMENT_PATTERN.match(os.path.basename(existing[-1])).group(1)) + 1 if existing else 0
+                self._thread = threading.Thread(target=self._writer, name="message-archive", daemon=True)
+                self._thread.start()
+
+    def _writer(self):
+        stopping = False
+        while not stopping:
+            record = self._queue.get()
+            batch = [] if record is None else [record]
+            stopping = record is None
+
+            # Write whatever else is already queued before flushing once
+            while not stopping and len(batch) < 500:
+                try:
+                    record = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if record is None:
+                    stopping = True
+                else:
+                    batch.append(record)
+
+            try:
+                if batch:
+                    self._write_batch(batch)
+                if stopping:
+                    self._close_segment()
+            except Exception as e:
+                self.stats['errors'] += 1
+                logger.error(f"Failed to write message archive batch: {e}")
+            finally:
+                for _ in range(len(batch) + stopping):
+                    self._queue.task_done()
+
+    def _write_batch(self, batch):
+        for record in batch:
+            line = serializer.dumps(record) + b"\n"
+            if self._file is None or self._segment_bytes >= self.max_segment_bytes:
+                self._open_segment()
+            self._file.write(line)
+            self._segment_bytes += len(line)
+            self.stats['archived'] += 1
+        self._file.flush()
+
+    def _open_segment(self):
+        self._close_segment()
+        self._segment_path = os.path.join(self.directory, f"{SEGMENT_PREFIX}{self._next_segment:06d}{SEGMENT_SUFFIX}")
+        self._next_segment += 1
+        self._file = open(self._segment_path, 'ab')
+        self._segment_bytes = 0
+        self.stats['segments'] += 1
+
+    def _close_segment(self):
+        if self._file is None:
+            return
+
+        self._file.close()
+        self._file = None
+        if self.compress:
+            with open(self._segment_path, 'rb') as src, gzip.open(self._segment_path + ".gz", 'wb') as dst:
+                shutil.copyfileobj(src, dst)
+            os.remove(self._segment_path)
+
+    def flush(self):
+        """Block until every record appended so far has been written"""
+        if self._thread is not None:
+            self._queue.join()
+
+    def close(self):
+        """Write pending records, close (and compress) the current segment and stop the writer"""
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+
+
+def test_message_archive():
+    """Archive a few thousand records across several segments and read them back"""
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        archive = MessageArchive(temp_dir, max_segment_bytes=64 * 1024, compress=True)
+        for i in range(5000):
+            archive.append({'id': i, 'group': 'DAY', 'text': f"NIFTY {24000 + i} CE ABOVE 120", 'parsing_result': None})
+        archive.close()
+
+        segments = list_segments(temp_dir)
+        ids = []
+        for path in segments:
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                ids.extend(json.loads(line)['id'] for line in f)
+        print(f"Archived {archive.stats['archived']} records in {len(segments)} compressed segments")
+        assert ids == list(range(5000))
+        assert all(path.endswith(".gz") for path in segments)
+
+
+if __name__ == "__main__":
+    test_message_archive()
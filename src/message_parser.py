@@ -4,9 +4,69 @@ Supports both text and image-based trading call detection and parsing
 """
 
 import re
+import sys
 import datetime
+import threading
+import timeit
 from telethon.tl.types import MessageMediaPhoto, MessageMediaDocument
 
+from keyword_matcher import KeywordMatcher
+from metrics import messages_filtered, parse_latency
+from parse_cache import ParseCache
+from trading_call import TradingCall, parse_price, serialize_tip
+
+
+# Option type token with word boundaries to prevent CE/PE confusion
+OPTION_TOKEN = r'(?:\bCE\b|\bPE\b|\bCALL\b|\bPUT\b)'
+
+# Entry, stop loss and target patterns in priority order. Each one starts with a
+# literal character and captures the value in group 1
+FIELD_PATTERNS = {
+    'trigger_price': [
+        r'ABV\s+(\d+(?:\.\d+)?(?:-\d+(?:\.\d+)?)?)',  # ABV 50-60 or ABV 2
+        r'ABOVE\s+PRICE\s+(\d+(?:\.\d+)?)',           # ABOVE PRICE 340
+        r'ABOVE\s+(\d+(?:\.\d+)?)',                   # ABOVE 20
+        r'PRICE\s+(\d+(?:\.\d+)?)',                   # PRICE 340
+        r'@\s*(\d+(?:\.\d+)?)',                       # @ 50
+        r'AT\s+(\d+(?:\.\d+)?)'                       # AT 25
+    ],
+    'stop_loss': [
+        r'SL\s+(\d+(?:\.\d+)?)',
+        r'STOPLOSS\s+(\d+(?:\.\d+)?)',
+        r'STOP\s+LOSS\s+(\d+(?:\.\d+)?)'
+    ],
+    'target': [
+        r'TARGET\s+([\d+/\.\+\-]+)',
+        r'TGT\s+([\d+/\.\+\-]+)',
+        r'TARGET:\s*([\d+/\.\+\-]+)'
+    ]
+}
+
+# Keywords checked by the spam filter and the confidence score
+PROFIT_BOOKING_PHRASES = ['KARA DIYA', 'PARTY KARO']
+ENTRY_KEYWORDS = ['ABV', 'ABOVE', 'AT', '@']
+OPTION_KEYWORDS = ['CE', 'PE', 'CALL', 'PUT']
+
+# Pre-filter: a call needs an option type and a number (strike or entry), and
+# the shortest text with both ("9 PE") is four characters long
+PREFILTER_DIGITS = frozenset('0123456789')
+PREFILTER_MIN_LENGTH = 4
+SPECIAL_CALL_KEYWORDS = ['ZERO HERO', 'SURESHOT', '100%']
+
+# Promotional caption patterns for image messages
+PROMOTIONAL_PATTERNS = [
+    r'ZERO.*HERO',
+    r'PROFIT.*\d+.*TIMES',
+    r'MAHA.*JACKPOT',
+    r'SURESHOT.*CALL',
+    r'HIGH OF \d+',
+    r'BOOK PROFIT.*:',
+    r'RETURN.*\d+%',
+    r'DURATION.*MINUTES?',
+    r'ENTRY.*DATE.*EXIT.*DATE',
+    r'TAP TO SEE'
+]
+
 
 class TradingCallParser:
     """
@@ -14,9 +74,10 @@ class TradingCallParser:
     from Telegram messages (both text and image-based)
     """
     
-    def __init__(self):
+    def __init__(self, instruments=None, spam_indicators=None, image_spam_indicators=None, max_message_length=None,
+                 parse_cache=None):
         # Expanded instrument list
-        self.instruments = [
+        self.instruments = list(instruments) if instruments is not None else [
             # Major Indices
             'BANKNIFTY', 'NIFTY', 'SENSEX', 'FINNIFTY',
             # Individual Stocks
@@ -27,20 +88,67 @@ class TradingCallParser:
         ]
         
         # Spam/promotional keywords to filter out
-        self.spam_indicators = [
+        self.spam_indicators = list(spam_indicators) if spam_indicators is not None else [
             'OFFER', 'LIFETIME', 'JOIN', 'PREMIUM', 'COURSE',
             'QUERY', 'CONTACT', 'HTTPS://', 'HTTP://', '@',
             'SUBSCRIBE', 'MEMBER', 'PAYMENT', 'DISCOUNT'
         ]
         
         # Image-specific promotional/spam indicators
-        self.image_spam_indicators = [
+        self.image_spam_indicators = list(image_spam_indicators) if image_spam_indicators is not None else [
             'ZERO TO HERO', 'PROFIT', 'TIMES', 'JACKPOT', 'SURESHOT',
             'MAHA', 'HIGH OF', '🔥', '💎', '🚀', 'HERO', 'BIG',
             'WAIT FOR TRIGGER', 'BOOK PROFIT', 'RETURN', 'DURATION',
             'ENTRY DATE', 'EXIT DATE', 'ENTRY PRICE', 'EXIT PRICE',
             'TAP TO SEE', 'STOCK DETAILS', 'NEW SHORT TERM', 'RECOMMENDATION'
         ]
+        
+        # Messages longer than this are rejected by the pre-filter (None = no limit)
+        self.max_message_length = max_message_length
+        
+        # Optional ParseCache of results by normalised text (None disables caching)
+        self.parse_cache = parse_cache
+        
+        self._compile_patterns()
+    
+    def _compile_patterns(self):
+        """
+        Build the extraction engine once per parser instance.
+        
+        Every keyword table feeds one Aho-Corasick automaton, and option type
+        tokens plus the entry/SL/target patterns are combined into one
+        alternation, so a message is scanned once for keywords and once for
+        field values.
+        """
+        self._keyword_matcher = KeywordMatcher(
+            self.instruments + self.spam_indicators + self.image_spam_indicators
+            + ['PROFIT'] + PROFIT_BOOKING_PHRASES + ENTRY_KEYWORDS + OPTION_KEYWORDS + SPECIAL_CALL_KEYWORDS
+        )
+        
+        alternatives = [
+            # Option type, optionally followed by a strike (e.g. "CE 48000")
+            r'(\b(PE|PUT|CE|CALL)\b(?:\s+(\d{1,6}))?)'
+        ]
+        self._field_groups = {1: ('option_type', 0)}
+        # Groups 2 and 3 hold the option token and trailing strike
+        group = 4
+        
+        for field, patterns in FIELD_PATTERNS.items():
+            for priority, pattern in enumerate(patterns):
+                alternatives.append(f'({pattern})')
+                self._field_groups[group] = (field, priority)
+                group += 2
+        
+        # Only positions starting with one of these characters can begin a hit
+        first_chars = set('PC')
+        first_chars.update(pattern[0] for patterns in FIELD_PATTERNS.values() for pattern in patterns)
+        first_char_class = ''.join(re.escape(char) for char in sorted(first_chars))
+        
+        self._field_regex = re.compile(f'(?=[{first_char_class}])(?:' + '|'.join(alternatives) + ')')
+        self._instrument_strike_regex = re.compile(rf'\s+(\d{{1,6}})\s*{OPTION_TOKEN}')
+        self._wide_strike_regex = re.compile(r'\b(\d{4,6})\b')
+        self._price_update_regex = re.compile(r'^\d+[🔥💥🎉]+$')
+        self._promotional_regex = re.compile('|'.join(PROMOTIONAL_PATTERNS))
     
     def is_trading_call(self, message_obj):
         """
@@ -48,20 +156,48 @@ class TradingCallParser:
         Returns: (is_call, parsed_data, call_type)
         """
         try:
-            # Check if message has media (image)
-            if self._has_image_media(message_obj):
-                return self._analyze_image_call(message_obj)
+            has_image = self._has_image_media(message_obj)
             
+            # Reposted text gets the cached result, patched for this message
+            cache_key = None
+            if self.parse_cache is not None and message_obj.message:
+                cache_key = ParseCache.key(message_obj.message.upper().strip(), has_image)
+                cached = self.parse_cache.get(cache_key)
+                if cached is not None:
+                    return self._patch_cached_result(cached, message_obj)
+            
+            # Check if message has media (image)
+            if has_image:
+                result = self._analyze_image_call(message_obj)
             # If text message, analyze text content
-            if message_obj.message:
-                return self._analyze_text_call(message_obj.message, message_obj)
+            elif message_obj.message:
+                result = self._analyze_text_call(message_obj.message, message_obj)
+            else:
+                return False, None, None
             
-            return False, None, None
+            if cache_key is not None:
+                is_call, parsed_data, call_type = result
+                # Store a copy; callers add fields such as smart_sl to parsed_data
+                self.parse_cache.put(cache_key, (is_call, parsed_data.copy() if parsed_data else None, call_type))
+            return result
             
         except Exception as e:
             print(f"Error parsing message: {e}")
             return False, None, None
     
+    def _patch_cached_result(self, cached, message_obj):
+        """Copy a cached result, replacing the fields that belong to one message"""
+        is_call, parsed_data, call_type = cached
+        if parsed_data is None:
+            return is_call, None, call_type
+        
+        parsed_data = parsed_data.copy()
+        parsed_data.message_id = message_obj.id
+        parsed_data.timestamp = message_obj.date
+        if parsed_data.caption is not None:
+            parsed_data.caption = message_obj.message
+        return is_call, parsed_data, call_type
+    
     def _has_image_media(self, message_obj):
         """Check if message contains image media"""
         if not message_obj.media:
@@ -77,37 +213,25 @@ class TradingCallParser:
         
         return False
     
+    def image_spam_hits(self, caption):
+        """Number of image-specific spam indicators in a caption"""
+        if not caption:
+            return 0
+        keywords = self._keyword_matcher.find_all(caption.upper())
+        return sum(1 for indicator in self.image_spam_indicators if indicator in keywords)
+
     def _is_image_spam(self, caption):
         """Check if image caption contains promotional/spam content"""
         if not caption:
             return False
-            
-        caption_upper = caption.upper()
-        
-        # Check for image-specific spam indicators
-        spam_count = sum(1 for indicator in self.image_spam_indicators if indicator in caption_upper)
         
         # If multiple spam indicators found, it's likely promotional
-        if spam_count >= 2:
+        if self.image_spam_hits(caption) >= 2:
             return True
-            
-        # Check for specific promotional patterns
-        promotional_patterns = [
-            r'ZERO.*HERO',
-            r'PROFIT.*\d+.*TIMES',
-            r'MAHA.*JACKPOT',
-            r'SURESHOT.*CALL',
-            r'HIGH OF \d+',
-            r'BOOK PROFIT.*:',
-            r'RETURN.*\d+%',
-            r'DURATION.*MINUTES?',
-            r'ENTRY.*DATE.*EXIT.*DATE',
-            r'TAP TO SEE'
-        ]
         
-        for pattern in promotional_patterns:
-            if re.search(pattern, caption_upper):
-                return True
+        # Check for specific promotional patterns
+        if self._promotional_regex.search(caption.upper()):
+            return True
         
         return False
     
@@ -117,34 +241,42 @@ class TradingCallParser:
         
         # Check if image caption is promotional/spam
         if self._is_image_spam(caption):
+            messages_filtered.inc(reason='image_spam')
             return False, None, None
         
-        parsed_data = {
-            'call_type': 'IMAGE',
-            'confidence': 40,  # Start with low confidence for images
-            'has_media': True,
-            'caption': caption,
-            'timestamp': message_obj.date,
-            'message_id': message_obj.id,
-            'requires_ocr': True
-        }
-        
         # If caption exists, try to extract info from it
         if caption:
             text_result = self._analyze_text_call(caption, message_obj)
-            if text_result[0]:  # If text analysis found patterns
-                parsed_data.update(text_result[1])
-                parsed_data['confidence'] = min(85, text_result[1].get('confidence', 40) + 10)
-                parsed_data['requires_ocr'] = False
-            else:
+            if not text_result[0]:
                 # No trading data found in caption - likely not a valid call
                 return False, None, None
+            parsed_data = text_result[1]
+            parsed_data.caption = caption
+            parsed_data.confidence = min(85, parsed_data.confidence + 10)
         else:
             # No caption - requires OCR but start with very low confidence
-            parsed_data['confidence'] = 30
+            parsed_data = TradingCall('IMAGE', confidence=30, has_media=True, requires_ocr=True, caption=caption,
+                                      timestamp=message_obj.date, message_id=message_obj.id)
         
         return True, parsed_data, 'IMAGE_CALL'
     
+    def analyze_image_text(self, image_text, message_obj):
+        """
+        Parse text extracted from a call image (OCR) the same way as a text
+        call. Returns (is_call, parsed_data, 'IMAGE_CALL'); parsed_data keeps
+        the caption and no longer requires OCR.
+        """
+        text_result = self._analyze_text_call(image_text, message_obj)
+        if not text_result[0]:
+            return False, None, None
+        
+        parsed_data = text_result[1]
+        parsed_data.has_media = True
+        parsed_data.caption = message_obj.message or ""
+        # OCR misreads are possible, so an image alone never counts as fully certain
+        parsed_data.confidence = min(85, parsed_data.confidence)
+        return True, parsed_data, 'IMAGE_CALL'
+    
     def _analyze_text_call(self, message_text, message_obj):
         """Enhanced text analysis with comprehensive pattern matching"""
         if not message_text:
@@ -152,166 +284,173 @@ class TradingCallParser:
             
         msg = message_text.upper().strip()
         
+        # Cheap rejection of chatter before any keyword or regex work
+        reject_reason = self._prefilter(msg)
+        if reject_reason:
+            messages_filtered.inc(reason=reject_reason)
+            return False, None, None
+        
+        # Find every keyword (spam, instrument, confidence) in one pass
+        keywords = self._keyword_matcher.find_all(msg)
+        
         # Step 1: Filter out promotional/spam messages
-        if self._is_spam_message(msg):
+        if self._is_spam_message(msg, keywords):
+            messages_filtered.inc(reason='spam')
             return False, None, None
         
-        # Step 2: Check for option type indicators
-        option_type = self._extract_option_type(msg)
+        # Step 2: Extract option type, instrument, strike, trigger, SL and target in one scan
+        fields = self._scan_fields(msg, keywords)
+        option_type = fields['option_type']
         if not option_type:
             return False, None, None
         
-        # Step 3: Extract instrument name
-        instrument = self._extract_instrument(msg)
-        
-        # Step 4: Extract strike price
-        strike_price = self._extract_strike_price(msg, option_type)
-        
-        # Step 5: Extract entry conditions and trigger price
-        trigger_price = self._extract_trigger_price(msg)
+        instrument = fields['instrument']
+        strike_price = fields['strike']
+        trigger_price = fields['trigger_price']
+        stop_loss = fields['stop_loss']
+        target = fields['target']
         
-        # Step 6: Extract stop loss and target
-        stop_loss = self._extract_stop_loss(msg)
-        target = self._extract_target(msg)
-        
-        # Step 7: Calculate confidence score
-        confidence = self._calculate_confidence(msg, instrument, strike_price, 
+        # Step 3: Calculate confidence score
+        confidence = self._calculate_confidence(msg, keywords, instrument, strike_price,
                                                trigger_price, stop_loss, target)
         
-        # Step 8: Validate as trading call
+        # Step 4: Validate as trading call
         is_valid_call = confidence >= 40
         
         if is_valid_call:
-            parsed_data = {
-                'call_type': 'TEXT',
-                'instrument': instrument,
-                'strike': strike_price,
-                'option_type': option_type,
-                'trigger_price': trigger_price,
-                'stop_loss': stop_loss,
-                'target': target,
-                'confidence': confidence,
-                'raw_message': message_text,
-                'has_media': False,
-                'timestamp': message_obj.date,
-                'message_id': message_obj.id
-            }
+            parsed_data = TradingCall.from_fields(instrument, strike_price, option_type, trigger_price,
+                                                  stop_loss, target, confidence,
+                                                  timestamp=message_obj.date, message_id=message_obj.id)
             return True, parsed_data, 'TEXT_CALL'
         
         return False, None, None
     
-    def _is_spam_message(self, msg):
+    def _prefilter(self, msg):
+        """
+        Substring and character-set checks that every call passes: an option
+        token (CE/PE/CALL/PUT, boundaries checked later), a digit and sane length.
+        Returns the rejection reason, or None if the message needs full parsing.
+        """
+        if len(msg) < PREFILTER_MIN_LENGTH:
+            return 'prefilter_length'
+        if self.max_message_length and len(msg) > self.max_message_length:
+            return 'prefilter_length'
+        if 'CE' not in msg and 'PE' not in msg and 'CALL' not in msg and 'PUT' not in msg:
+            return 'prefilter_no_option'
+        if PREFILTER_DIGITS.isdisjoint(msg):
+            return 'prefilter_no_digit'
+        return None
+    
+    def _is_spam_message(self, msg, keywords):
         """Check if message is promotional/spam"""
-        for indicator in self.spam_indicators:
-            if indicator in msg:
-                return True
+        if any(indicator in keywords for indicator in self.spam_indicators):
+            return True
         
         # Check for profit booking messages
-        if 'PROFIT' in msg and any(x in msg for x in ['KARA DIYA', 'PARTY KARO']):
+        if 'PROFIT' in keywords and any(x in keywords for x in PROFIT_BOOKING_PHRASES):
             return True
         
         # Check for simple price updates (just numbers with emojis)
-        if re.match(r'^\d+[🔥💥🎉]+$', msg.strip()):
+        if self._price_update_regex.match(msg.strip()):
             return True
             
         return False
     
-    def _extract_option_type(self, msg):
-        """Extract option type (CE/PE) using word boundaries to prevent CE/PE confusion"""
-        # Use word boundaries and explicit patterns to avoid substring matching issues
-        # Check for PE first to avoid CE being found in PE
-        if re.search(r'\bPE\b', msg) or re.search(r'\bPUT\b', msg):
-            return 'PE'
-        elif re.search(r'\bCE\b', msg) or re.search(r'\bCALL\b', msg):
-            return 'CE'
-        return None
+    def _scan_fields(self, msg, keywords):
+        """
+        Extract option type, instrument, strike, trigger, SL and target in a
+        single pass of the precompiled field pattern over the uppercased message
+        """
+        first_hits = {}
+        option_hits = []
+        
+        for match in self._field_regex.finditer(msg):
+            group = match.lastindex
+            field, priority = self._field_groups[group]
+            
+            if field == 'option_type':
+                option_hits.append(match)
+            else:
+                first_hits.setdefault((field, priority), match.group(group + 1))
+        
+        tokens = {match.group(2) for match in option_hits}
+        if 'PE' in tokens or 'PUT' in tokens:
+            # PE is checked first to avoid CE being found in PE
+            option_type = 'PE'
+        elif tokens:
+            option_type = 'CE'
+        else:
+            option_type = None
+        
+        instruments = self._extract_instruments(keywords)
+        instrument = next(iter(instruments), None)
+        
+        return {
+            'option_type': option_type,
+            'instrument': instrument,
+            'strike': self._resolve_strike(msg, instruments, option_hits) if option_type else None,
+            'trigger_price': self._first_by_priority(first_hits, 'trigger_price'),
+            'stop_loss': self._first_by_priority(first_hits, 'stop_loss'),
+            'target': self._first_by_priority(first_hits, 'target')
+        }
     
-    def _extract_instrument(self, msg):
-        """Extract instrument name from message"""
-        for instrument in self.instruments:
-            if instrument in msg:
-                return instrument
-        return None
+    def _extract_instruments(self, keywords):
+        """
+        Extract instrument names from the keyword hits, preferring the longest
+        match so NIFTY is not reported inside BANKNIFTY or FINNIFTY
+        Returns: dict of instrument -> start positions, ranked by self.instruments
+        """
+        hits = KeywordMatcher.longest_matches(keywords, self.instruments)
+        return {name: hits[name] for name in self.instruments if name in hits}
     
-    def _extract_strike_price(self, msg, option_type):
-        """Extract strike price using multiple patterns with word boundaries"""
-        # First try to find instrument + strike + option pattern with word boundaries
-        for instrument in self.instruments:
-            pattern = rf'{instrument}\s+(\d{{1,6}})\s*(?:\bCE\b|\bPE\b|\bCALL\b|\bPUT\b)'
-            match = re.search(pattern, msg)
-            if match:
-                return match.group(1)
-        
-        patterns = [
-            # Pattern 1: Number directly before option type (CE/PE/CALL/PUT) with word boundaries
-            r'(\d{1,6})\s*(?:\bCE\b|\bPE\b|\bCALL\b|\bPUT\b)',
-            # Pattern 2: Option type followed by number with word boundaries  
-            r'(?:\bCE\b|\bPE\b|\bCALL\b|\bPUT\b)\s+(\d{1,6})',
-            # Pattern 3: Any 4-6 digit number that's likely a strike
-            r'\b(\d{4,6})\b'
-        ]
-        
-        for pattern in patterns:
-            matches = re.findall(pattern, msg)
-            if matches:
-                # Return the first reasonable strike price
-                for match in matches:
-                    strike = int(match)
-                    # Basic validation - strike prices should be reasonable
-                    if 1 <= strike <= 999999:
-                        return str(strike)
-        
-        return None
+    def _resolve_strike(self, msg, instruments, option_hits):
+        """Pick the strike price using the pattern priorities of the field scan"""
+        # First try instrument + strike + option type
+        for name, starts in instruments.items():
+            for start in starts:
+                match = self._instrument_strike_regex.match(msg, start + len(name))
+                if match:
+                    return match.group(1)
+        
+        # Number directly before the option type, then option type followed by number
+        strike = self._first_valid_strike(self._strike_before(msg, match.start()) for match in option_hits)
+        if strike is None:
+            strike = self._first_valid_strike(match.group(3) for match in option_hits)
+        if strike is None:
+            # Any 4-6 digit number that's likely a strike
+            strike = self._first_valid_strike(self._wide_strike_regex.findall(msg))
+        return strike
     
-    def _extract_trigger_price(self, msg):
-        """Extract trigger/entry price from message"""
-        patterns = [
-            r'ABV\s+(\d+(?:\.\d+)?(?:-\d+(?:\.\d+)?)?)',  # ABV 50-60 or ABV 2
-            r'ABOVE\s+PRICE\s+(\d+(?:\.\d+)?)',           # ABOVE PRICE 340
-            r'ABOVE\s+(\d+(?:\.\d+)?)',                   # ABOVE 20
-            r'PRICE\s+(\d+(?:\.\d+)?)',                   # PRICE 340
-            r'@\s*(\d+(?:\.\d+)?)',                       # @ 50
-            r'AT\s+(\d+(?:\.\d+)?)'                       # AT 25
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, msg)
-            if match:
-                return match.group(1)
-        
-        return None
+    def _strike_before(self, msg, pos):
+        """Return up to 6 digits separated from the option type at pos by whitespace"""
+        end = pos
+        while end > 0 and msg[end - 1].isspace():
+            end -= 1
+        start = end
+        while start > 0 and end - start < 6 and msg[start - 1].isdecimal():
+            start -= 1
+        return msg[start:end] if start < end else None
     
-    def _extract_stop_loss(self, msg):
-        """Extract stop loss from message"""
-        patterns = [
-            r'SL\s+(\d+(?:\.\d+)?)',
-            r'STOPLOSS\s+(\d+(?:\.\d+)?)',
-            r'STOP\s+LOSS\s+(\d+(?:\.\d+)?)'
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, msg)
-            if match:
-                return match.group(1)
-        
+    def _first_valid_strike(self, candidates):
+        """Return the first reasonable strike price among candidates"""
+        for candidate in candidates:
+            if candidate is None:
+                continue
+            strike = int(candidate)
+            # Basic validation - strike prices should be reasonable
+            if 1 <= strike <= 999999:
+                return str(strike)
         return None
     
-    def _extract_target(self, msg):
-        """Extract target price from message"""
-        patterns = [
-            r'TARGET\s+([\d+/\.\+\-]+)',
-            r'TGT\s+([\d+/\.\+\-]+)',
-            r'TARGET:\s*([\d+/\.\+\-]+)'
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, msg)
-            if match:
-                return match.group(1)
-        
+    def _first_by_priority(self, first_hits, field):
+        """Return the hit of the highest priority pattern for a field"""
+        for priority in range(len(FIELD_PATTERNS[field])):
+            value = first_hits.get((field, priority))
+            if value is not None:
+                return value
         return None
     
-    def _calculate_confidence(self, msg, instrument, strike, trigger, stop_loss, target):
+    def _calculate_confidence(self, msg, keywords, instrument, strike, trigger, stop_loss, target):
         """Calculate confidence score for the trading call with enhanced validation"""
         confidence = 0
         
@@ -338,23 +477,23 @@ class TradingCallParser:
             confidence += 8
         
         # Entry pattern validation
-        if any(keyword in msg for keyword in ['ABV', 'ABOVE', 'AT', '@']):
+        if any(keyword in keywords for keyword in ENTRY_KEYWORDS):
             confidence += 12
         
         # Option type validation
-        if any(opt in msg for opt in ['CE', 'PE', 'CALL', 'PUT']):
+        if any(opt in keywords for opt in OPTION_KEYWORDS):
             confidence += 10
         
         # Special call indicators (but reduce their impact to prevent false positives)
-        if 'ZERO HERO' in msg:
+        if 'ZERO HERO' in keywords:
             confidence += 15  # Reduced from 20
-        if 'SURESHOT' in msg or '100%' in msg:
+        if 'SURESHOT' in keywords or '100%' in keywords:
             confidence += 8   # Reduced from 15
         
         # Negative factors (stronger penalties for incomplete calls)
         if len(msg.strip()) < 15:  # Increased minimum length
             confidence -= 25
-        if not any(opt in msg for opt in ['CE', 'PE', 'CALL', 'PUT']):
+        if not any(opt in keywords for opt in OPTION_KEYWORDS):
             confidence -= 35  # Increased penalty
         if essential_count < 2:  # Missing too many essential params
             confidence -= 20
@@ -366,14 +505,16 @@ class TradingCallParser:
         return max(0, min(100, confidence))
     
     def calculate_smart_sl_target(self, trigger_price, option_type='PE'):
-        """Calculate smart stop loss and target based on price level"""
-        if not trigger_price:
+        """
+        Calculate smart stop loss and target based on price level
+        trigger_price is a number, or price text such as "50-60" (low end used)
+        """
+        if trigger_price is None or trigger_price == '':
             return None, None
             
         try:
-            # Handle range prices (e.g., "50-60")
-            if '-' in trigger_price:
-                trigger = float(trigger_price.split('-')[0])
+            if isinstance(trigger_price, str):
+                trigger = parse_price(trigger_price)[0]
             else:
                 trigger = float(trigger_price)
             
@@ -398,47 +539,109 @@ class TradingCallParser:
             return None, None
 
 
+# Shared parser instance, built lazily and reused for every message
+_shared_parser = None
+_shared_parser_lock = threading.Lock()
+
+
+def get_parser():
+    """
+    Return the shared TradingCallParser, building it on first use.
+    Parsing only touches the lock-protected parse cache, so one instance is
+    safe to share across threads and event loop callbacks.
+    """
+    global _shared_parser
+    
+    parser = _shared_parser
+    if parser is None:
+        with _shared_parser_lock:
+            if _shared_parser is None:
+                _shared_parser = TradingCallParser(parse_cache=ParseCache.from_env())
+            parser = _shared_parser
+    return parser
+
+
+def reload_parser(instruments=None, spam_indicators=None, image_spam_indicators=None, max_message_length=None):
+    """
+    Rebuild the shared parser, e.g. after the instrument or spam lists change.
+    The new instance is fully built before it is swapped in, so messages
+    being parsed concurrently keep using the previous one. It starts with an
+    empty parse cache, since cached results reflect the old lists.
+    """
+    global _shared_parser
+    
+    parser = TradingCallParser(instruments, spam_indicators, image_spam_indicators, max_message_length,
+                               parse_cache=ParseCache.from_env())
+    with _shared_parser_lock:
+        _shared_parser = parser
+    return parser
+
+
+def warm_up_parser(groups=()):
+    """
+    Build the shared parser and run a sample call through extraction,
+    enrichment and tip encoding (for each group name), so the first real
+    message does not pay for building the keyword automaton and other
+    first-use costs. Bypasses the parse cache.
+    """
+    parser = get_parser()
+    sample = MockMessage("NIFTY 25100 PE ABOVE 20 SL 10 TARGET 40")
+    is_call, parsed_data, call_type = parser._analyze_text_call(sample.message, sample)
+    call_data = enrich_call_data(parsed_data, call_type)
+    for group in groups:
+        serialize_tip(call_data['data'].to_tip(group))
+    return parser
+
+
 def enhanced_message_processor(message_obj):
     """
     Main function to process messages using the enhanced parser
     """
-    parser = TradingCallParser()
-    is_call, parsed_data, call_type = parser.is_trading_call(message_obj)
+    with parse_latency.time():
+        is_call, parsed_data, call_type = get_parser().is_trading_call(message_obj)
     
     if not is_call:
         return None
     
+    return enrich_call_data(parsed_data, call_type)
+
+
+def enrich_call_data(parsed_data, call_type):
+    """
+    Add smart stop loss and target to a parsed call and wrap it in the
+    call_data dict used by the message handlers
+    """
     # Add smart stop loss and target calculation for text calls
-    if call_type == 'TEXT_CALL' and parsed_data.get('trigger_price'):
-        smart_sl, smart_target = parser.calculate_smart_sl_target(
-            parsed_data['trigger_price'], 
-            parsed_data.get('option_type', 'PE')
-        )
+    if call_type == 'TEXT_CALL' and parsed_data.trigger is not None:
+        smart_sl, smart_target = get_parser().calculate_smart_sl_target(parsed_data.trigger, parsed_data.option_type)
         if smart_sl:
-            parsed_data['smart_sl'] = smart_sl
+            parsed_data.smart_sl = smart_sl
         if smart_target:
-            parsed_data['smart_target'] = smart_target
+            parsed_data.smart_target = smart_target
     
     return {
         'type': call_type.lower().replace('_call', ''),
         'data': parsed_data,
-        'confidence': parsed_data.get('confidence', 0),
-        'timestamp': parsed_data.get('timestamp'),
-        'message_id': parsed_data.get('message_id')
+        'confidence': parsed_data.confidence,
+        'timestamp': parsed_data.timestamp,
+        'message_id': parsed_data.message_id
     }
 
 
+class MockMessage:
+    """Minimal stand-in for a Telethon message used by the development helpers"""
+    
+    def __init__(self, text, media=None):
+        self.message = text
+        self.media = media
+        self.date = datetime.datetime.now()
+        self.id = 12345
+
+
 # Test function for development
 def test_parser():
     """Test function to validate parser with sample messages"""
     
-    class MockMessage:
-        def __init__(self, text, media=None):
-            self.message = text
-            self.media = media
-            self.date = datetime.datetime.now()
-            self.id = 12345
-    
     test_messages = [
         "BANKNIFTY 55600 PUT ABOVE 340",
         "SENSEX 81400 PE ABV 50-60",
@@ -475,5 +678,40 @@ def test_parser():
         print("-" * 50)
 
 
+# Benchmark function for development
+def benchmark_parser_reuse(number=2000, repeat=5):
+    """
+    Compare per-message cost of building a TradingCallParser for every
+    message against reusing the shared parser instance
+    """
+    messages = [MockMessage(text) for text in (
+        "BANKNIFTY 55600 PUT ABOVE 340",
+        "SENSEX 81400 PE ABV 50-60 SL 40 TARGET 80/100",
+        "KARA DIYA 80,000 PROFIT",
+        "Good morning traders, market opens flat today"
+    )]
+    
+    def per_message_parser():
+        for message_obj in messages:
+            TradingCallParser().is_trading_call(message_obj)
+    
+    def shared_parser():
+        for message_obj in messages:
+            get_parser().is_trading_call(message_obj)
+    
+    print("=== PARSER REUSE BENCHMARK ===\n")
+    results = {}
+    for name, func in (("New parser per message", per_message_parser), ("Shared parser", shared_parser)):
+        best = min(timeit.repeat(func, number=number, repeat=repeat))
+        results[name] = best / (number * len(messages)) * 1e6
+        print(f"  {name}: {results[name]:.1f} us/message")
+    
+    print(f"  Construction overhead removed: {results['New parser per message'] - results['Shared parser']:.1f} us/message")
+    return results
+
+
 if __name__ == "__main__":
-    test_parser()
\ No newline at end of file
+    if "--benchmark" in sys.argv:
+        benchmark_parser_reuse()
+    else:
+        test_parser()
\ No newline at end of file
@@ -0,0 +1,123 @@
+"""
+Staged asyncio pipeline for incoming Telegram messages
+Stages are connected by bounded queues so a slow stage applies backpressure
+instead of stalling the Telethon update loop
+"""
+
+import asyncio
+import inspect
+import logging
+import time
+
+from metrics import LatencyHistogram
+
+logger = logging.getLogger(__name__)
+
+
+class PipelineStage:
+    """
+    One pipeline stage: a handler taking an item and returning the item for
+    the next stage, or None to drop it. Sync and async handlers are both
+    accepted; concurrency is the number of worker tasks for the stage.
+    """
+
+    def __init__(self, name, handler, concurrency=1, queue_size=100):
+        self.name = name
+        self.handler = handler
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.latency = LatencyHistogram()
+        self.processed = 0
+        self.dropped = 0
+        self.errors = 0
+
+
+class MessagePipeline:
+    """
+    Runs items through a list of PipelineStage objects in order.
+    Each stage reads from its own bounded queue; when a queue is full the
+    previous stage waits, so backpressure propagates up to put().
+    """
+
+    def __init__(self, stages):
+        self.stages = list(stages)
+        self.total_latency = LatencyHistogram()
+        self._queues = None
+        self._workers = []
+
+    def start(self):
+        """Create the stage queues and workers on the running event loop"""
+        if self._queues is not None:
+            return
+
+        self._queues = [asyncio.Queue(maxsize=stage.queue_size) for stage in self.stages]
+        for index, stage in enumerate(self.stages):
+            self._workers.extend(asyncio.ensure_future(self._worker(index)) for _ in range(stage.concurrency))
+
+    async def put(self, item):
+        """Hand an item to the first stage, waiting if that stage is saturated"""
+        self.start()
+        await self._queues[0].put((item, time.monotonic()))
+
+    def try_put(self, item):
+        """Hand an item to the first stage without waiting; False if that stage's queue is full"""
+        self.start()
+        try:
+            self._queues[0].put_nowait((item, time.monotonic()))
+        except asyncio.QueueFull:
+            return False
+        return True
+
+    async def _worker(self, index):
+        stage = self.stages[index]
+        queue = self._queues[index]
+        next_queue = self._queues[index + 1] if index + 1 < len(self._queues) else None
+
+        while True:
+            item, received_at = await queue.get()
+            started = time.monotonic()
+            try:
+                result = stage.handler(item)
+                if inspect.isawaitable(result):
+                    result = await result
+            except Exception as e:
+                stage.errors += 1
+                logger.error(f"Error in pipeline stage {stage.name}: {e}")
+                result = None
+
+            finished = time.monotonic()
+            stage.latency.observe(finished - started)
+            stage.processed += 1
+
+            try:
+                if result is None:
+                    stage.dropped += 1
+                elif next_queue is not None:
+                    await next_queue.put((result, received_at))
+                else:
+                    self.total_latency.observe(finished - received_at)
+            finally:
+                queue.task_done()
+
+    async def drain(self):
+        """Wait until every item put so far has left the pipeline"""
+        if self._queues is not None:
+            for queue in self._queues:
+                await queue.join()
+
+    def metrics(self):
+        """Per-stage queue depth, counters and latency histograms"""
+        stages = {}
+        for index, stage in enumerate(self.stages):
+            stages[stage.name] = {
+                'queue_depth': self._queues[index].qsize() if self._queues is not None else 0,
+                'processed': stage.processed,
+                'dropped': stage.dropped,
+                'errors': stage.errors,
+                'latency': stage.latency.snapshot()
+            }
+        return {'stages': stages, 'total_latency': self.total_latency.snapshot()}
+
+    def close(self):
+        for worker in self._workers:
+            worker.cancel()
@@ -0,0 +1,275 @@
+"""
+Lightweight in-process metrics for the trading bot
+Counters and latency histograms with fixed buckets, cheap enough for the
+message hot path, exposed in the Prometheus text format on a local HTTP port
+"""
+
+import asyncio
+import bisect
+import functools
+import inspect
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Bucket upper bounds in seconds, from sub-millisecond parsing to slow API calls
+DEFAULT_LATENCY_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+    0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+
+
+class LatencyHistogram:
+    """
+    Cumulative latency histogram with fixed bucket bounds (seconds).
+    Observing is a bisect and two additions, so it can run per message.
+    """
+
+    def __init__(self, buckets=DEFAULT_LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-th quantile (None if empty)"""
+        if not self.count:
+            return None
+
+        rank = q * self.count
+        seen = 0
+        for bound, bucket_count in zip(self.buckets, self.counts):
+            seen += bucket_count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+    def snapshot(self):
+        """Cumulative bucket counts plus count, sum and p50/p99 estimates"""
+        cumulative = {}
+        seen = 0
+        for bound, bucket_count in zip(self.buckets, self.counts):
+            seen += bucket_count
+            cumulative[bound] = seen
+        cumulative[float('inf')] = self.count
+
+        return {
+            'buckets': cumulative,
+            'count': self.count,
+            'sum': self.sum,
+            'p50': self.quantile(0.5),
+            'p99': self.quantile(0.99)
+        }
+
+
+class Counter:
+    """Monotonic counter with optional labels; inc() is a dict update"""
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(label, '')) for label in self.labelnames)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self.values.get(tuple(str(labels.get(label, '')) for label in self.labelnames), 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(list(self.values.items())):
+            lines.append(f"{self.name}{_format_labels(zip(self.labelnames, key))} {value}")
+        return lines
+
+
+class Histogram(LatencyHistogram):
+    """LatencyHistogram with a metric name, plus time() for with-blocks"""
+
+    def __init__(self, name, help_text, buckets=DEFAULT_LATENCY_BUCKETS):
+        super().__init__(buckets)
+        self.name = name
+        self.help_text = help_text
+
+    def time(self):
+        return _Timer(self)
+
+    def timed(self, func):
+        """Decorator observing the duration of each call (sync or async functions)"""
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with self.time():
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with self.time():
+                return func(*args, **kwargs)
+        return wrapper
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for bound, count in self.snapshot()['buckets'].items():
+            le = "+Inf" if bound == float('inf') else repr(bound)
+            lines.append(f'{self.name}_bucket{{le="{le}"}} {count}')
+        lines.append(f"{self.name}_sum {self.sum}")
+        lines.append(f"{self.name}_count {self.count}")
+        return lines
+
+
+class Gauge:
+    """Value read from a callback at scrape time (queue depths and the like)"""
+
+    def __init__(self, name, help_text, func):
+        self.name = name
+        self.help_text = help_text
+        self.func = func
+
+    def render(self):
+        try:
+            value = self.func()
+        except Exception as e:
+            logger.warning(f"Gauge {self.name} failed: {e}")
+            return []
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} gauge", f"{self.name} {value}"]
+
+
+class _Timer:
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started)
+        return False
+
+
+def _escape_label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(pairs):
+    rendered = ",".join(f'{name}="{_escape_label(value)}"' for name, value in pairs)
+    return "{" + rendered + "}" if rendered else ""
+
+
+class MetricsRegistry:
+    """Named metrics rendered together for the /metrics endpoint"""
+
+    def __init__(self):
+        self.metrics = {}
+        self.last_heartbeat = None
+
+    def _register(self, metric):
+        self.metrics.setdefault(metric.name, metric)
+        return self.metrics[metric.name]
+
+    def counter(self, name, help_text, labelnames=()):
+        return self._register(Counter(name, help_text, labelnames))
+
+    def histogram(self, name, help_text, buckets=DEFAULT_LATENCY_BUCKETS):
+        return self._register(Histogram(name, help_text, buckets))
+
+    def gauge(self, name, help_text, func):
+        # Re-registering replaces the callback (e.g. a new dispatcher instance)
+        self.metrics[name] = Gauge(name, help_text, func)
+        return self.metrics[name]
+
+    def render(self):
+        lines = []
+        for metric in list(self.metrics.values()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def is_healthy(self, max_heartbeat_age=120):
+        """False once a started heartbeat stops, i.e. the event loop is stuck"""
+        return self.last_heartbeat is None or time.monotonic() - self.last_heartbeat <= max_heartbeat_age
+
+
+def confidence_band(confidence):
+    """Confidence band label matching the high/medium thresholds of the call handlers"""
+    if confidence >= 70:
+        return 'high'
+    if confidence >= 50:
+        return 'medium'
+    return 'low'
+
+
+# Shared registry and the bot's hot-path metrics
+registry = MetricsRegistry()
+messages_seen = registry.counter('telegram_messages_seen_total', 'Messages received per channel', ['channel'])
+calls_detected = registry.counter('trading_calls_detected_total', 'Trading calls detected per channel and confidence band',
+                                  ['channel', 'confidence_band'])
+messages_filtered = registry.counter('messages_filtered_total', 'Messages rejected by the parser as spam or promotions',
+                                     ['reason'])
+tip_api_errors = registry.counter('tip_api_errors_total', 'Failed trading API attempts by status code or error', ['reason'])
+tips_failed = registry.counter('tips_failed_total', 'Tips given up on after all retries')
+parse_latency = registry.histogram('message_parse_seconds', 'Time spent parsing one message (enhanced_message_processor)')
+process_trading_data_latency = registry.histogram('process_trading_data_seconds', 'Time spent in process_trading_data')
+
+
+async def heartbeat(interval=15):
+    """Mark the event loop alive for /healthz; a blocked loop stops updating it"""
+    while True:
+        registry.last_heartbeat = time.monotonic()
+        await asyncio.sleep(interval)
+
+
+def start_metrics_server(port=None, host=None):
+    """
+    Serve /metrics (Prometheus text format) and /healthz from a daemon thread.
+    METRICS_PORT (default 9100, 0 disables) and METRICS_HOST (default
+    127.0.0.1) configure it. Returns the server, or None if not started.
+    """
+    port = int(os.getenv("METRICS_PORT", "9100")) if port is None else port
+    host = host or os.getenv("METRICS_HOST", "127.0.0.1")
+    if not port:
+        return None
+
+    # Imported here: http.server is only needed when the endpoint is enabled
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.startswith("/metrics"):
+                self._reply(200, registry.render(), "text/plain; version=0.0.4")
+            elif self.path.startswith("/healthz"):
+                healthy = registry.is_healthy()
+                self._reply(200 if healthy else 503, "ok\n" if healthy else "event loop stalled\n", "text/plain")
+            else:
+                self._reply(404, "not found\n", "text/plain")
+
+        def _reply(self, status, body, content_type):
+            body = body.encode('utf-8')
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    try:
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+    except OSError as e:
+        logger.warning(f"Metrics endpoint not started on {host}:{port}: {e}")
+        return None
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    logger.info(f"Metrics endpoint listening on http://{host}:{server.server_port}/metrics")
+    return server
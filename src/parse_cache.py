@@ -0,0 +1,81 @@
+"""
+Bounded LRU/TTL cache of parse results
+Reposted and forwarded calls repeat the same text across channels, so the
+parser result for a (normalised text, image flag) pair is reused instead of
+being recomputed
+"""
+
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from metrics import registry
+
+parse_cache_lookups = registry.counter('parse_cache_lookups_total', 'Parse cache lookups by result', ['result'])
+
+
+class ParseCache:
+    """
+    LRU cache with a per-entry time to live. Keys are a 16-byte BLAKE2b
+    digest of the normalised text plus the image flag, so long messages do
+    not stay in memory as keys. Values are stored and returned as copies.
+    """
+
+    def __init__(self, max_size=2048, ttl=600.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.stats = {'hits': 0, 'misses': 0, 'expired': 0, 'evictions': 0}
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """Cache sized by PARSE_CACHE_SIZE / PARSE_CACHE_TTL; None when the size is 0"""
+        max_size = int(os.getenv("PARSE_CACHE_SIZE", "2048"))
+        if max_size <= 0:
+            return None
+        return cls(max_size, float(os.getenv("PARSE_CACHE_TTL", "600")))
+
+    @staticmethod
+    def key(normalised_text, has_image):
+        digest = hashlib.blake2b(normalised_text.encode('utf-8'), digest_size=16).digest()
+        return digest + (b'\x01' if has_image else b'\x00')
+
+    def get(self, key):
+        """Cached value for key, or None on a miss or an expired entry"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[0] > self.ttl:
+                del self._entries[key]
+                self.stats['expired'] += 1
+                entry = None
+            if entry is None:
+                self.stats['misses'] += 1
+                parse_cache_lookups.inc(result='miss')
+                return None
+            self._entries.move_to_end(key)
+            self.stats['hits'] += 1
+        parse_cache_lookups.inc(result='hit')
+        return entry[1]
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.stats['evictions'] += 1
+
+    def hit_rate(self):
+        lookups = self.stats['hits'] + self.stats['misses']
+        return self.stats['hits'] / lookups if lookups else 0.0
+
+    def metrics(self):
+        return {**self.stats, 'size': len(self._entries), 'hit_rate': round(self.hit_rate(), 4)}
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,268 @@
+"""
+Replay benchmark for the message parser
+Runs enhanced_message_processor over a committed synthetic corpus of channel
+messages and reports throughput, per-message latency percentiles and
+allocations, failing when the result regresses against the baseline stored
+for the running Python version (major.minor)
+
+Usage:
+    python src/parser_benchmark.py                    # report only
+    python src/parser_benchmark.py --check            # exit 1 on regression
+    python src/parser_benchmark.py --update-baseline  # store the median of 5 runs for this Python
+    python src/parser_benchmark.py --generate-corpus  # rewrite the corpus
+    python src/parser_benchmark.py --with-cache       # keep the parse cache on
+"""
+
+import datetime
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+
+from backtest import MessageRecord
+from message_parser import enhanced_message_processor, get_parser
+
+BENCHMARK_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "test_data")
+CORPUS_FILE = os.path.join(BENCHMARK_DIR, "parser_corpus.jsonl")
+BASELINE_FILE = os.path.join(BENCHMARK_DIR, "parser_benchmark_baseline.json")
+
+# Allowed slowdown of the normalised score before --check fails; single runs have
+# landed up to about 15% below the median baseline on a shared machine
+DEFAULT_TOLERANCE = float(os.getenv("PARSER_BENCH_TOLERANCE", "0.25"))
+# Benchmark runs whose median becomes the baseline
+BASELINE_RUNS = 5
+
+
+def generate_corpus(path=CORPUS_FILE, size=3000, seed=7):
+    """
+    Write a deterministic, anonymised corpus in the message archive record
+    format: text calls in the formats the channels use, spam and promotions,
+    profit updates, image captions and emoji-only updates
+    """
+    rng = random.Random(seed)
+    instruments = [('NIFTY', 24000, 50), ('BANKNIFTY', 52000, 100), ('SENSEX', 81000, 100),
+                   ('FINNIFTY', 23000, 50), ('MIDCPNIFTY', 12000, 25), ('IDEA', 9, 1), ('RELIANCE', 2900, 20)]
+
+    def text_call():
+        name, base, step = rng.choice(instruments)
+        strike = base + rng.randint(-20, 20) * step
+        option = rng.choice(['CE', 'PE', 'CALL', 'PUT'])
+        entry = rng.randint(5, 400)
+        template = rng.choice([
+            "{name} {strike} {option} ABOVE {entry}",
+            "{name} {strike} {option} ABV {entry}-{entry_hi}",
+            "BUY {name} {strike} {option} @ {entry} SL {sl} TARGET {tgt}/{tgt2}",
+            "{name} {strike} {option}\nABOVE {entry}\nSL {sl}\nTARGET {tgt}",
+            "BUY ZERO HERO {name} {strike} {option} ABV {entry}",
+            "SURESHOT {name} {strike} {option} AT {entry} STOPLOSS {sl} TGT {tgt}",
+            "{name} {option} {strike} ABOVE {entry} 🚀🚀",
+        ])
+        return template.format(name=name, strike=strike, option=option, entry=entry, entry_hi=entry + rng.randint(5, 20),
+                               sl=max(1, entry - rng.randint(5, 40)), tgt=entry + rng.randint(10, 80), tgt2=entry + rng.randint(80, 150))
+
+    generators = [
+        (40, text_call, False),
+        (15, lambda: rng.choice([
+            "JOIN PREMIUM NOW LIFETIME OFFER 50% DISCOUNT https://t.me/xyz",
+            "LIMITED SEATS IN OUR OPTIONS COURSE, CONTACT @admin FOR PAYMENT",
+            "SUBSCRIBE FOR 100% ACCURATE CALLS, QUERY? CONTACT US",
+        ]), False),
+        (12, lambda: rng.choice([
+            "{} DONE ✅", "KARA DIYA {},000 PROFIT", "{} FIRE 🔥🔥", "TARGET {} ACHIEVED", "BOOK PROFIT AT {}",
+        ]).format(rng.randint(20, 400)), False),
+        (10, lambda: rng.choice(["🎯🎯🎯", "🔥🔥", "🚀", "💰💰💰💰", "✅✅"]), False),
+        (10, lambda: rng.choice([
+            "Good morning traders, market opens flat today",
+            "Nifty weekly expiry today, trade with strict stop loss",
+            "Stay away from overtrading. Volatility is high after the RBI policy",
+        ]), False),
+        (8, lambda: rng.choice(["", "CHART FOR TOMORROW", text_call(), "HUGE PROFIT TODAY JOIN PREMIUM"]), True),
+        (5, lambda: "BANK NIFTY LOOKS STRONG ABOVE {} LEVEL, WAIT FOR CONFIRMATION".format(52000 + rng.randint(0, 40) * 50), False),
+    ]
+    weights = [weight for weight, _, _ in generators]
+
+    start = datetime.datetime(2024, 7, 1, 9, 15, tzinfo=datetime.timezone.utc)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        for i in range(size):
+            _, make_text, has_image = rng.choices(generators, weights)[0]
+            record = {
+                'id': 100000 + i,
+                'date': (start + datetime.timedelta(seconds=37 * i)).isoformat(),
+                'text': make_text(),
+                'has_media': has_image,
+                'media_type': 'MessageMediaPhoto' if has_image else None,
+                'has_image': has_image,
+                'group': rng.choice(['DAY', 'BTST', 'UNIVEST'])
+            }
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def load_corpus(path=CORPUS_FILE):
+    """Corpus as MessageRecord objects, the same shape replay_archive feeds the parser"""
+    from telethon.tl.types import MessageMediaPhoto
+
+    records = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            record = json.loads(line)
+            records.append(MessageRecord(
+                id=record['id'],
+                date=datetime.datetime.fromisoformat(record['date']),
+                message=record['text'],
+                media=MessageMediaPhoto() if record['has_image'] else None,
+                has_media=record['has_media'],
+                group=record['group']
+            ))
+    return records
+
+
+def calibrate(rounds=50000, repeat=3):
+    """
+    Seconds for a fixed pure-Python workload (fastest of repeat runs), used
+    to normalise across machines
+    """
+    text = "NIFTY 24000 CE ABOVE 120"
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        total = 0
+        for i in range(rounds):
+            total += len(text.upper().split()) + (i & 7)
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def run_benchmark(records, repeat=7):
+    """Throughput, latency percentiles and allocation figures for one corpus"""
+    get_parser()  # build outside the timed region
+
+    # Throughput: median of several full passes, each paired with reference
+    # runs before and after it so the normalised score compares like with like.
+    # The median is steadier than the best pass on shared CI runners
+    timings = []
+    scores = []
+    for _ in range(repeat):
+        reference = calibrate()
+        started = time.perf_counter()
+        for record in records:
+            enhanced_message_processor(record)
+        elapsed = time.perf_counter() - started
+        reference = min(reference, calibrate())
+        timings.append(elapsed)
+        scores.append(len(records) / elapsed * reference)
+
+    # Per-message latency from a separate timed pass
+    latencies = []
+    for record in records:
+        started = time.perf_counter()
+        enhanced_message_processor(record)
+        latencies.append(time.perf_counter() - started)
+    latencies.sort()
+
+    # Peak traced memory and blocks still held afterwards, from a traced pass
+    # (slower, so kept out of the timings)
+    tracemalloc.start()
+    before_size, _ = tracemalloc.get_traced_memory()
+    snapshot_before = tracemalloc.take_snapshot()
+    for record in records:
+        enhanced_message_processor(record)
+    snapshot_after = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    retained_blocks = sum(stat.count_diff for stat in snapshot_after.compare_to(snapshot_before, 'filename') if stat.count_diff > 0)
+
+    calls = sum(1 for record in records if enhanced_message_processor(record))
+    messages_per_sec = len(records) / statistics.median(timings)
+
+    return {
+        'python': platform.python_version(),
+        'messages': len(records),
+        'trading_calls': calls,
+        'messages_per_sec': round(messages_per_sec, 1),
+        'p50_us': round(latencies[len(latencies) // 2] * 1e6, 2),
+        'p99_us': round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1e6, 2),
+        'peak_kib': round((peak - before_size) / 1024, 1),
+        'retained_blocks': retained_blocks,
+        # Messages parsed in the time a fixed reference workload takes, so
+        # results from different machines can be compared
+        'normalised_score': round(statistics.median(scores), 1),
+        'score_spread': round((max(scores) - min(scores)) / statistics.median(scores), 3)
+    }
+
+
+def python_version(version=None):
+    """Baseline key for a Python version: major.minor"""
+    return ".".join((version or platform.python_version()).split(".")[:2])
+
+
+def load_baselines(path=BASELINE_FILE):
+    """Stored results keyed by Python version; the score is only comparable within one version"""
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def check_regression(result, baseline, tolerance=DEFAULT_TOLERANCE):
+    """List of human-readable regressions of result against baseline"""
+    problems = []
+    if result['normalised_score'] < baseline['normalised_score'] * (1 - tolerance):
+        problems.append(f"normalised score {result['normalised_score']} < {baseline['normalised_score']} - {tolerance:.0%}")
+    if result['trading_calls'] != baseline['trading_calls']:
+        problems.append(f"trading calls detected changed: {baseline['trading_calls']} -> {result['trading_calls']}")
+    return problems
+
+
+def main(argv):
+    # Repeated passes over one corpus would only measure the parse cache
+    if "--with-cache" not in argv:
+        os.environ["PARSE_CACHE_SIZE"] = "0"
+
+    if "--generate-corpus" in argv or not os.path.exists(CORPUS_FILE):
+        generate_corpus()
+        print(f"Corpus written to {CORPUS_FILE}")
+
+    records = load_corpus()
+    result = run_benchmark(records)
+
+    print("=== PARSER REPLAY BENCHMARK ===\n")
+    for key, value in result.items():
+        print(f"  {key}: {value}")
+    if get_parser().parse_cache is not None:
+        print(f"  parse_cache: {get_parser().parse_cache.metrics()}")
+
+    baselines = load_baselines(BASELINE_FILE)
+    version = python_version(result['python'])
+
+    if "--update-baseline" in argv:
+        # One run can land anywhere in the runner's noise; store the median of several
+        runs = sorted([result] + [run_benchmark(records) for _ in range(BASELINE_RUNS - 1)],
+                      key=lambda run: run['normalised_score'])
+        baselines[version] = {**runs[len(runs) // 2], 'baseline_scores': [run['normalised_score'] for run in runs]}
+        with open(BASELINE_FILE, 'w', encoding='utf-8') as f:
+            json.dump(dict(sorted(baselines.items())), f, indent=2)
+            f.write("\n")
+        print(f"\nBaseline for Python {version} written to {BASELINE_FILE}")
+        return 0
+
+    if "--check" in argv:
+        baseline = baselines.get(version)
+        if baseline is None:
+            print(f"\n[REGRESSION] No baseline for Python {version} in {BASELINE_FILE}; "
+                  f"record one with --update-baseline on that version")
+            return 1
+        problems = check_regression(result, baseline)
+        if problems:
+            print("\n[REGRESSION] " + "\n[REGRESSION] ".join(problems))
+            return 1
+        print(f"\n[OK] Within {DEFAULT_TOLERANCE:.0%} of the Python {version} baseline score {baseline['normalised_score']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
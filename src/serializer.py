@@ -0,0 +1,169 @@
+"""
+Pluggable JSON encoding for tip payloads, archive records and reports
+Uses orjson or msgspec when installed and falls back to the stdlib json
+module; JSON_SERIALIZER=auto|orjson|msgspec|json picks one explicitly
+"""
+
+import datetime
+import functools
+import json
+import logging
+import os
+import timeit
+from json.encoder import encode_basestring
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ('orjson', 'msgspec', 'json')
+
+
+def _default(obj):
+    """Encoding for types JSON has no form for: records via as_dict(), the rest as text"""
+    if isinstance(obj, (datetime.datetime, datetime.date, datetime.time)):
+        return obj.isoformat()
+    as_dict = getattr(obj, 'as_dict', None)
+    if as_dict is not None:
+        return as_dict()
+    return str(obj)
+
+
+def _stdlib_backend():
+    encoder = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'), default=_default)
+
+    def dumps(obj):
+        return encoder.encode(obj).encode('utf-8')
+
+    def loads(data):
+        return json.loads(bytes(data) if isinstance(data, memoryview) else data)
+
+    return dumps, loads
+
+
+def _orjson_backend():
+    import orjson
+
+    def dumps(obj):
+        return orjson.dumps(obj, default=_default)
+
+    return dumps, orjson.loads
+
+
+def _msgspec_backend():
+    import msgspec
+
+    encoder = msgspec.json.Encoder(enc_hook=_default)
+    decoder = msgspec.json.Decoder()
+
+    def loads(data):
+        try:
+            return decoder.decode(data)
+        except msgspec.DecodeError as e:
+            # Callers handle malformed JSON as ValueError, like json.loads
+            raise ValueError(str(e)) from e
+
+    return encoder.encode, loads
+
+
+_BUILDERS = {'orjson': _orjson_backend, 'msgspec': _msgspec_backend, 'json': _stdlib_backend}
+
+
+def load_backend(name=None):
+    """
+    Return (backend name, dumps, loads) for JSON_SERIALIZER (default auto:
+    the first installed of orjson, msgspec, json). dumps returns compact
+    UTF-8 bytes; loads accepts bytes, str or memoryview.
+    """
+    name = (name or os.getenv("JSON_SERIALIZER", "auto")).lower()
+    candidates = BACKENDS if name == 'auto' else (name, 'json')
+    for candidate in candidates:
+        builder = _BUILDERS.get(candidate)
+        if builder is None:
+            logger.warning(f"Unknown JSON_SERIALIZER {candidate!r}, using the stdlib json module")
+            continue
+        try:
+            return (candidate,) + builder()
+        except ImportError:
+            if name != 'auto':
+                logger.warning(f"JSON_SERIALIZER={candidate} is not installed, using the stdlib json module")
+    return ('json',) + _stdlib_backend()
+
+
+BACKEND, dumps, loads = load_backend()
+
+
+@functools.lru_cache(maxsize=512)
+def encoded_string(text):
+    """JSON encoding of a string as bytes, cached for repeated values such as group and instrument names"""
+    return encode_basestring(text).encode('utf-8')
+
+
+# Benchmark function for development
+def benchmark_serializers(number=20000, repeat=5):
+    """
+    Compare the encode cost per call of each installed backend for a tip
+    payload, an archive record and a detected call, plus the pre-encoded
+    tip body written straight from the TradingCall
+    """
+    from trading_call import TradingCall
+
+    call = TradingCall.from_fields('SENSEX', '81400', 'PE', '50-60', '40', '80/100', 78,
+                                   timestamp=datetime.datetime.now(datetime.timezone.utc), message_id=4242)
+    call.smart_sl, call.smart_target = 42.5, "61.25/68.75"
+    tip = call.to_tip('DAY')
+    call_data = {'type': 'text', 'data': call.as_dict(), 'confidence': call.confidence,
+                 'timestamp': call.timestamp, 'message_id': call.message_id}
+    samples = {
+        'tip payload': tip,
+        'archive record': {
+            'id': 4242, 'date': call.timestamp.isoformat(), 'text': "SENSEX 81400 PE ABV 50-60 SL 40 TARGET 80/100",
+            'has_media': False, 'media_type': None, 'has_image': False, 'group': 'DAY', 'channel_id': 1234567890,
+            'parsing_result': call_data, 'is_trading_call': True, 'confidence': 78,
+            'archived_at': datetime.datetime.now().isoformat()
+        },
+        'detected call': {'message_id': 4242, 'timestamp': str(call.timestamp), 'type': 'text', 'confidence': 78,
+                          'data': call, 'raw_text': "SENSEX 81400 PE ABV 50-60 SL 40 TARGET 80/100",
+                          'has_media': False, 'group': 'DAY'}
+    }
+
+    def per_call_us(func, value):
+        return min(timeit.repeat(lambda: func(value), number=number, repeat=repeat)) / number * 1e6
+
+    results = {}
+    for name in BACKENDS:
+        try:
+            backend_dumps = _BUILDERS[name]()[0]
+        except ImportError:
+            continue
+        results[name] = {label: round(per_call_us(backend_dumps, value), 3) for label, value in samples.items()}
+    results['pre-encoded tip'] = {'tip payload': round(per_call_us(lambda c: c.tip_json('DAY'), call), 3)}
+    return results
+
+
+def test_serializer():
+    """Every installed backend must decode to the same values as the stdlib fallback"""
+    record = {'id': 7, 'text': "NIFTY 25100 PE ABOVE 20 ₹ \"quoted\"", 'price': 20.5, 'flags': [True, None],
+              'date': datetime.datetime(2024, 1, 1, 9, 15, 30, 125000), 'nested': {'strike': '25100'}}
+    expected = json.loads(_stdlib_backend()[0](record))
+    assert expected['date'] == "2024-01-01T09:15:30.125000"
+    for name in BACKENDS:
+        try:
+            backend_dumps, backend_loads = _BUILDERS[name]()
+        except ImportError:
+            print(f"  [SKIP] {name} not installed")
+            continue
+        encoded = backend_dumps(record)
+        assert isinstance(encoded, bytes) and json.loads(encoded) == expected, name
+        assert backend_loads(encoded) == expected and backend_loads(memoryview(encoded)) == expected, name
+        try:
+            backend_loads(b'{"truncated":')
+            raise AssertionError(f"{name} accepted malformed JSON")
+        except ValueError:
+            pass
+        print(f"  [OK] {name}")
+
+
+if __name__ == "__main__":
+    test_serializer()
+    print(f"\n=== JSON ENCODE COST PER CALL (us), active backend: {BACKEND} ===\n")
+    for backend, timings in benchmark_serializers().items():
+        print(f"  {backend:16} " + "  ".join(f"{label}: {value}" for label, value in timings.items()))
@@ -0,0 +1,151 @@
+"""
+Cold-start support for the bot
+Times each startup phase from process start (imports, session restore,
+Telegram connect, background warm-ups) up to the first handled message,
+and restores the Telegram session from the mounted share only when it
+holds a newer file than the local copy.
+"""
+
+import logging
+import os
+import shutil
+import time
+
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+
+def process_start_time():
+    """Wall-clock time the process started (from /proc on Linux), or None if unknown"""
+    try:
+        with open('/proc/self/stat') as f:
+            # Fields after the parenthesised command name start at field 3; starttime is field 22
+            start_ticks = int(f.read().rsplit(')', 1)[1].split()[19])
+        with open('/proc/uptime') as f:
+            uptime = float(f.read().split()[0])
+        return time.time() - uptime + start_ticks / os.sysconf('SC_CLK_TCK')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def restore_session(mounted_path, local_path):
+    """
+    Copy a session file from a mounted (network) share to local_path unless
+    the local copy is at least as new. Returns True if the file was copied.
+    """
+    try:
+        mounted_mtime = os.stat(mounted_path).st_mtime
+    except FileNotFoundError:
+        return False
+    try:
+        # The bot writes to its local copy while running, which makes it the newer one
+        if os.stat(local_path).st_mtime >= mounted_mtime:
+            return False
+    except FileNotFoundError:
+        pass
+    # copy2 keeps the mount's mtime, so an unchanged share is not copied again
+    shutil.copy2(mounted_path, local_path)
+    return True
+
+
+class StartupTimer:
+    """
+    Durations of sequential startup phases, each measured from the previous
+    mark() (the first from process start), plus background tasks timed
+    separately with timed()
+    """
+
+    def __init__(self, started=None):
+        self.started = started or process_start_time() or time.time()
+        self.phases = {}
+        self.background = {}
+        self.ready = None
+        self.first_message = None
+        self._last = self.started
+        registry.gauge('startup_seconds', 'Seconds from process start until connected to Telegram',
+                       lambda: self.ready if self.ready is not None else float('nan'))
+        registry.gauge('time_to_first_message_seconds', 'Seconds from process start until the first message',
+                       lambda: self.first_message if self.first_message is not None else float('nan'))
+
+    def mark(self, phase):
+        """End the current phase"""
+        now = time.time()
+        self.phases[phase] = now - self._last
+        self._last = now
+
+    def timed(self, task, func, *args):
+        """Run func(*args), recording its duration; a failed warm-up is logged, not raised"""
+        started = time.perf_counter()
+        try:
+            return func(*args)
+        except Exception as e:
+            logger.warning(f"Startup task {task} failed: {e}")
+        finally:
+            self.background[task] = time.perf_counter() - started
+
+    def report(self):
+        """Log the phase timings as one startup_timing event, counting the bot as ready now"""
+        self.ready = time.time() - self.started
+        phases = ", ".join(f"{phase} {seconds * 1000:.0f} ms" for phase, seconds in self.phases.items())
+        background = ", ".join(f"{task} {seconds * 1000:.0f} ms" for task, seconds in self.background.items())
+        logger.info(f"Startup: ready {self.ready:.2f}s after process start ({phases}; in background: {background})",
+                    extra={'event': {
+                        'event': 'startup_timing',
+                        'ready_ms': round(self.ready * 1000, 1),
+                        'phases_ms': {phase: round(seconds * 1000, 1) for phase, seconds in self.phases.items()},
+                        'background_ms': {task: round(seconds * 1000, 1) for task, seconds in self.background.items()}
+                    }})
+
+    def message_received(self):
+        """Record time to first message on the first call"""
+        if self.first_message is None:
+            self.first_message = time.time() - self.started
+            logger.info(f"First message received {self.first_message:.2f}s after process start",
+                        extra={'event': {'event': 'first_message', 'elapsed_ms': round(self.first_message * 1000, 1)}})
+
+
+def test_startup():
+    """Session restore copies only a newer mounted file; phases and warm-ups are timed"""
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        mounted = os.path.join(temp_dir, "mounted.session")
+        local = os.path.join(temp_dir, "local.session")
+        assert not restore_session(mounted, local) and not os.path.exists(local)
+
+        with open(mounted, 'w') as f:
+            f.write("v1")
+        assert restore_session(mounted, local)
+        assert not restore_session(mounted, local), "unchanged share copied again"
+
+        # The bot updates its local copy; the older share must not overwrite it
+        with open(local, 'w') as f:
+            f.write("v1 + updates")
+        os.utime(local, (time.time() + 5, time.time() + 5))
+        assert not restore_session(mounted, local)
+
+        # A newer session uploaded to the share replaces the local copy
+        with open(mounted, 'w') as f:
+            f.write("v2")
+        os.utime(mounted, (time.time() + 10, time.time() + 10))
+        assert restore_session(mounted, local)
+        with open(local) as f:
+            assert f.read() == "v2"
+
+    started = process_start_time()
+    assert started is None or 0 <= time.time() - started < 3600
+    timer = StartupTimer()
+    timer.mark('imports')
+    assert timer.timed('sleep', time.sleep, 0.01) is None and timer.background['sleep'] >= 0.01
+    assert timer.timed('broken', int, "not a number") is None and 'broken' in timer.background
+    timer.report()
+    timer.message_received()
+    first = timer.first_message
+    timer.message_received()
+    assert timer.first_message == first >= timer.phases['imports']
+    print(f"Startup: ready {timer.ready * 1000:.0f} ms after process start, phases {timer.phases}")
+
+
+if __name__ == "__main__":
+    test_startup()
@@ -6,28 +6,33 @@ import asyncio
 import datetime
 import ssl
 import os
-import json
 import logging
-from pathlib import Path
 
-import requests
 from telethon import TelegramClient, events
 from telethon.tl.types import PeerChannel
 
-# Import our enhanced message parser
-from message_parser import enhanced_message_processor
-
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('telegram_bot.log'),
-        logging.StreamHandler()
-    ]
-)
+# Import our enhanced message parser and tip dispatcher
+from message_parser import get_parser, enrich_call_data, warm_up_parser
+from message_pipeline import MessagePipeline, PipelineStage
+from tip_dispatcher import TipDispatcher
+from call_dedup import CallDeduplicator
+from media_store import MediaStore
+from image_ocr import OcrEngine
+from image_classifier import ImagePreClassifier
+from logging_setup import setup_logging
+from startup import StartupTimer, restore_session
+from metrics import (calls_detected, confidence_band, heartbeat, messages_seen, parse_latency,
+                     process_trading_data_latency, registry, start_metrics_server)
+
+# Configure logging: records are queued and written as JSON lines to a
+# rotated telegram_bot.log by a background listener thread
+log_listener = setup_logging('telegram_bot.log')
 logger = logging.getLogger(__name__)
 
+# Cold-start phases are timed from process start up to the first message
+startup_timer = StartupTimer()
+startup_timer.mark('imports')
+
 ssl._create_default_https_context = ssl._create_unverified_context
 
 # Load configuration from environment variables
@@ -46,35 +51,41 @@ univest_channel = int(os.getenv("UNIVEST_CHANNEL_ID", "-1001983880498"))
 if not api_id or not api_hash or not phone_number:
     raise ValueError("Missing required environment variables: TELEGRAM_API_ID, TELEGRAM_API_HASH, TELEGRAM_PHONE_NUMBER")
 
-# Check for session file in mounted volume first, then fall back to local
-session_paths = [
-    f"/app/sessions/{session_name}.session",  # Mounted Azure File Share
-    f"{session_name}.session"  # Local fallback
-]
-
-session_file_path = None
-for path in session_paths:
-    if os.path.exists(path):
-        session_file_path = path
-        logger.info(f"Found session file at: {path}")
-        break
-
-if session_file_path and "/app/sessions/" in session_file_path:
-    # Copy session file from mounted volume to local writable location
-    import shutil
-    local_session_path = f"/app/{session_name}.session"
-    shutil.copy2(session_file_path, local_session_path)
-    logger.info(f"Copied session file to writable location: {local_session_path}")
-    client = TelegramClient(session_name, api_id, api_hash)  # Use local copy
-elif session_file_path:
-    # Use existing local session file
-    session_path = session_file_path.replace('.session', '')
-    client = TelegramClient(session_path, api_id, api_hash)
-    logger.info(f"Using local session file: {session_file_path}")
+# Suppresses the same call arriving from several channels (DUPLICATE_CALL_WINDOW)
+call_deduplicator = CallDeduplicator.from_env()
+
+# Pooled, non-blocking client for the trading API
+# (TIP_BATCH_WINDOW_MS > 0 coalesces tips arriving within that window into one bulk post).
+# A tip that is never delivered releases its duplicate claim, so another channel can still send it
+tip_batch_window = float(os.getenv("TIP_BATCH_WINDOW_MS", "0")) / 1000
+tip_dispatcher = TipDispatcher(api_endpoint + "tip", batch_window=tip_batch_window or None,
+                               on_failure=call_deduplicator.release if call_deduplicator else None)
+
+# Session file: the mounted Azure File Share is read-only and slow, so its session is copied to a
+# local writable file, and only when it is newer than the copy a previous run left behind
+mounted_session_path = f"/app/sessions/{session_name}.session"
+local_session_path = f"{session_name}.session"
+
+if os.path.exists(mounted_session_path):
+    if restore_session(mounted_session_path, f"/app/{session_name}.session"):
+        logger.info(f"Copied session file to writable location: /app/{session_name}.session")
+    else:
+        logger.info(f"Local session copy is up to date, not copying {mounted_session_path}")
+elif os.path.exists(local_session_path):
+    logger.info(f"Using local session file: {local_session_path}")
 else:
-    # No existing session found, create new one
-    client = TelegramClient(session_name, api_id, api_hash)
-    logger.info(f"No existing session found, creating new: {session_name}.session")
+    logger.info(f"No existing session found, creating new: {local_session_path}")
+client = TelegramClient(session_name, api_id, api_hash)
+startup_timer.mark('session_restore')
+
+# Image calls without a usable caption are downloaded once, screened for promo images and
+# read with local OCR (disabled when OCR_ENABLED=0 or Tesseract is not installed). With
+# IMAGE_THUMBNAIL_FIRST=1 the screening uses a small preview size of the photo, and the
+# full image is only downloaded for likely calls
+media_store = MediaStore(client)
+ocr_engine = OcrEngine.from_env()
+image_classifier = ImagePreClassifier.from_env(get_parser()) if ocr_engine else None
+thumbnail_first = os.getenv("IMAGE_THUMBNAIL_FIRST", "1") == "1"
 
 
 def is_trading_hours():
@@ -95,141 +106,254 @@ def is_trading_hours():
 async def handleMessages(m, group):
     """
     Enhanced message handler using the new message parser
-    Only processes messages during trading hours
+    Hands the message to the processing pipeline and returns straight away,
+    so Telethon's update loop never waits on parsing or the trading API
     """
+    messages_seen.inc(channel=group)
+    startup_timer.message_received()
+    await message_pipeline.put({'message': m, 'group': group})
+
+
+def ingest_message(job):
+    """Pipeline stage: only process messages during trading hours"""
+    if not is_trading_hours():
+        logger.info(f"Outside trading hours, skipping message from {job['group']}", extra={'sampled': True})
+        return None
+    return job
+
+
+def parse_message(job):
+    """Pipeline stage: run the enhanced parser, dropping non-call messages"""
+    with parse_latency.time():
+        is_call, parsed_data, call_type = get_parser().is_trading_call(job['message'])
+    if not is_call:
+        # Not a trading call; only a sample of these is logged (LOG_SAMPLE_RATE)
+        logger.info("Message skipped, not a trading call", extra={'sampled': True, 'event': {
+            'event': 'message_skipped', 'group': job['group'], 'message_id': job['message'].id}})
+        return None
+    
+    job['parsed_data'] = parsed_data
+    job['call_type'] = call_type
+    return job
+
+
+def enrich_message(job):
+    """Pipeline stage: add smart stop loss and target to the parsed call"""
+    job['call_data'] = enrich_call_data(job['parsed_data'], job['call_type'])
+    calls_detected.inc(channel=job['group'], confidence_band=confidence_band(job['call_data']['confidence']))
+    return job
+
+
+async def dispatch_message(job):
+    """
+    Pipeline stage: route the call to the image or text call handler, then
+    log everything known about the call as one structured event
+    """
+    m, group, call_data = job['message'], job['group'], job['call_data']
+    event = {
+        'event': 'trading_call',
+        'group': group,
+        'message_id': m.id,
+        'call_type': call_data['type'],
+        'timestamp': call_data['timestamp'],
+        'confidence': call_data['confidence']
+    }
     try:
-        # Check if we're in trading hours
-        if not is_trading_hours():
-            logger.info(f"Outside trading hours, skipping message from {group}")
-            return
-        
-        # Use the enhanced message processor
-        call_data = enhanced_message_processor(m)
-        
-        if not call_data:
-            # Not a trading call, skip silently
-            return
-        
-        logger.info(f"TRADING CALL DETECTED - {call_data['type'].upper()}")
-        logger.info(f"Time: {call_data['timestamp']}")
-        logger.info(f"Confidence: {call_data['confidence']}%")
-        logger.info(f"Group: {group}")
-        
         if call_data['type'] == 'image':
-            await handle_image_call(m, call_data, group)
+            await handle_image_call(m, call_data, group, event)
         elif call_data['type'] == 'text':
-            await handle_text_call(m, call_data, group)
+            await handle_text_call(m, call_data, group, event)
         
     except Exception as e:
-        logger.error(f"Error in handleMessages: {e}")
-        if m.text:
-            logger.error(f"Message text: {m.text[:100]}...")
+        event['error'] = str(e)
+        event['text'] = m.text[:100] if m.text else None
+    
+    logger.info(f"TRADING CALL DETECTED - {call_data['type'].upper()} {group} "
+                f"({call_data['confidence']}%): {event.get('decision')}", extra={'event': event})
+    return job
+
+
+def finish_ocr_job(job, decision):
+    """Log the outcome of an OCR job that ended before its call was dispatched"""
+    job['event']['decision'] = decision
+    logger.info(f"IMAGE CALL OCR - {job['group']}: {decision}", extra={'event': job['event']})
+
+
+async def download_classify_image(job):
+    """OCR pipeline stage: fetch the image to screen for promos, a preview size in thumbnail-first mode"""
+    if image_classifier is None:
+        return job
+    fetch = media_store.fetch_preview if thumbnail_first else media_store.fetch
+    job['media'] = await fetch(job['message'])
+    if job['media'] is None:
+        finish_ocr_job(job, 'image_download_failed')
+        return None
+    return job
+
 
+async def download_call_image(job):
+    """OCR pipeline stage: fetch the full image (one download shared by every consumer of the file)"""
+    job['media'] = await media_store.fetch(job['message'])
+    if job['media'] is None:
+        finish_ocr_job(job, 'image_download_failed')
+        return None
+    job['event']['image_sha256'] = job['media'].sha256
+    return job
 
-async def handle_image_call(message_obj, call_data, group):
+
+async def classify_call_image(job):
+    """OCR pipeline stage: drop promotional images before the full download and OCR"""
+    if image_classifier is not None:
+        reason = await image_classifier.classify(job['message'], job['media'])
+        if reason is not None:
+            job['event']['promo_reason'] = reason
+            finish_ocr_job(job, 'promo_image_rejected')
+            return None
+    return job
+
+
+async def ocr_call_image(job):
+    """OCR pipeline stage: extract the image text in a tesseract worker"""
+    job['image_text'] = await ocr_engine.extract_text(job['media'])
+    if not job['image_text']:
+        finish_ocr_job(job, 'ocr_failed' if job['image_text'] is None else 'ocr_no_text')
+        return None
+    return job
+
+
+async def dispatch_ocr_call(job):
+    """OCR pipeline stage: parse the image text like a text call and dispatch it as an image call"""
+    m, group, event = job['message'], job['group'], job['event']
+    is_call, parsed_data, call_type = get_parser().analyze_image_text(job['image_text'], m)
+    if not is_call:
+        finish_ocr_job(job, 'ocr_not_a_call')
+        return job
+    
+    call_data = enrich_call_data(parsed_data, call_type)
+    event['confidence'] = call_data['confidence']
+    await handle_image_call(m, call_data, group, event)
+    logger.info(f"IMAGE CALL OCR - {group} ({call_data['confidence']}%): {event.get('decision')}",
+                extra={'event': event})
+    return job
+
+
+# Ingest -> parse -> enrich -> dispatch, connected by bounded queues
+message_pipeline = MessagePipeline([
+    PipelineStage('ingest', ingest_message, concurrency=1, queue_size=1000),
+    PipelineStage('parse', parse_message, concurrency=1, queue_size=200),
+    PipelineStage('enrich', enrich_message, concurrency=1, queue_size=100),
+    PipelineStage('dispatch', dispatch_message, concurrency=4, queue_size=100)
+])
+
+
+# Image calls needing OCR leave the main pipeline for preview -> promo check -> download -> OCR ->
+# dispatch, so slow images never hold up text calls
+ocr_pipeline = MessagePipeline([
+    PipelineStage('image_preview', download_classify_image, concurrency=media_store.workers, queue_size=50),
+    PipelineStage('image_classify', classify_call_image, concurrency=2, queue_size=50),
+    PipelineStage('image_download', download_call_image, concurrency=media_store.workers, queue_size=50),
+    PipelineStage('ocr', ocr_call_image, concurrency=ocr_engine.workers if ocr_engine else 1, queue_size=50),
+    PipelineStage('ocr_dispatch', dispatch_ocr_call, concurrency=2, queue_size=50)
+])
+
+
+registry.gauge('pipeline_queued_messages', 'Messages waiting in pipeline stage queues',
+               lambda: sum(stage['queue_depth'] for stage in message_pipeline.metrics()['stages'].values()))
+registry.gauge('tip_queue_depth', 'Tips waiting for the trading API', lambda: tip_dispatcher.metrics()['queue_depth'])
+
+
+async def report_pipeline_metrics(interval=900):
+    """Periodically log per-stage latency so slow stages show up in the logs"""
+    while True:
+        await asyncio.sleep(interval)
+        for name, stage in message_pipeline.metrics()['stages'].items():
+            latency = stage['latency']
+            logger.info(f"Pipeline stage {name}: processed {stage['processed']}, queue {stage['queue_depth']}, "
+                        f"p50 <= {latency['p50']}s, p99 <= {latency['p99']}s")
+        parse_cache = get_parser().parse_cache
+        if parse_cache is not None:
+            logger.info(f"Parse cache: {parse_cache.metrics()}")
+        if ocr_engine is not None:
+            for name, stage in ocr_pipeline.metrics()['stages'].items():
+                logger.info(f"OCR pipeline stage {name}: processed {stage['processed']}, queue {stage['queue_depth']}, "
+                            f"p99 <= {stage['latency']['p99']}s")
+            logger.info(f"OCR: {ocr_engine.metrics()}, media: {media_store.metrics()}")
+            if image_classifier is not None:
+                logger.info(f"Image pre-classifier: {image_classifier.metrics()}")
+
+
+async def handle_image_call(message_obj, call_data, group, event):
     """Handle image-based trading calls"""
     try:
-        if call_data['confidence'] >= 70:
-            logger.info("HIGH CONFIDENCE IMAGE CALL")
-            
-            # If the image has a text caption with trading info, process it
-            data = call_data.get('data', {})
-            if not data.get('requires_ocr'):
-                # Caption contained parseable trading info
-                await process_trading_data(data, group, message_obj)
+        data = call_data.get('data', {})
+        if data.get('requires_ocr'):
+            # No usable caption: read the image in the OCR pipeline rather than in dispatch
+            if ocr_engine is None:
+                event['decision'] = 'requires_ocr'
+            elif ocr_pipeline.try_put({'message': message_obj, 'group': group, 'event': {
+                    'event': 'image_call_ocr', 'group': group, 'message_id': message_obj.id}}):
+                event['decision'] = 'ocr_queued'
             else:
-                # Image requires OCR - log for manual review
-                logger.info("Image call requires OCR - manual review recommended")
+                event['decision'] = 'ocr_backlog_full'
+        elif call_data['confidence'] >= 70:
+            # Caption (or image text) contained parseable trading info
+            await process_trading_data(data, group, message_obj, event)
         else:
-            logger.info(f"Low confidence image call ({call_data['confidence']}%), skipping...")
+            event['decision'] = 'low_confidence_skipped'
             
     except Exception as e:
         logger.error(f"Error handling image call: {e}")
 
 
-async def handle_text_call(message_obj, call_data, group):
+async def handle_text_call(message_obj, call_data, group, event):
     """Handle text-based trading calls"""
     try:
         data = call_data.get('data', {})
         
         if call_data['confidence'] >= 70:
-            logger.info("HIGH CONFIDENCE TEXT CALL")
-            await process_trading_data(data, group, message_obj)
+            await process_trading_data(data, group, message_obj, event)
         elif call_data['confidence'] >= 50:
-            logger.info("MEDIUM CONFIDENCE TEXT CALL")
-            await process_trading_data(data, group, message_obj, is_medium_confidence=True)
+            await process_trading_data(data, group, message_obj, event, is_medium_confidence=True)
         else:
-            logger.info(f"Low confidence text call ({call_data['confidence']}%), skipping...")
+            event['decision'] = 'low_confidence_skipped'
             
     except Exception as e:
         logger.error(f"Error handling text call: {e}")
 
 
-async def process_trading_data(data, group, message_obj, is_medium_confidence=False):
-    """Process and send trading call data to API"""
+@process_trading_data_latency.timed
+async def process_trading_data(data, group, message_obj, event, is_medium_confidence=False):
+    """Process and send trading call data to API, recording the outcome in event"""
     try:
-        # Validate essential data
-        if not data.get('strike') or not data.get('trigger_price'):
-            logger.error("Incomplete trading data, skipping API call")
+        # Builds the payload from the parsed numbers; None without a strike and entry price
+        api_data = data.to_tip(group)
+        if api_data is None:
+            event['decision'] = 'incomplete_data'
             return
         
-        # Prepare trigger price (handle ranges like "50-60")
-        trigger_str = str(data.get('trigger_price', '0'))
-        trigger = float(trigger_str.split('-')[0]) if '-' in trigger_str else float(trigger_str)
-        
-        # Use smart stop loss and target if available, otherwise calculate basic ones
-        if data.get('smart_sl') and data.get('smart_target'):
-            stop_loss = data['smart_sl']
-            target = data['smart_target']
-        else:
-            # Fallback to basic calculation
-            stop_loss = max(0.5, trigger - 5) if trigger > 5 else trigger * 0.5
-            target = trigger + 10
-        
-        # Prepare API data
-        api_data = {
-            "instrument": {
-                "name": data.get('instrument', 'BANKNIFTY'),
-                "strike": data.get('strike'),
-                "instrumentType": data.get('option_type', 'PE')
-            },
-            "price": trigger,
-            "stopLoss": stop_loss,
-            "target": target,
-            "confidence": data.get('confidence', 0),
-            "type": group,
-            "parser_version": "enhanced_v1"
-        }
-        
-        # Log detailed call information
-        logger.info(f"Instrument: {api_data['instrument']['name']}")
-        logger.info(f"Strike: {api_data['instrument']['strike']}")
-        logger.info(f"Type: {api_data['instrument']['instrumentType']}")
-        logger.info(f"Entry: {api_data['price']}")
-        logger.info(f"Stop Loss: {api_data['stopLoss']}")
-        logger.info(f"Target: {api_data['target']}")
+        # Detailed call information goes into the consolidated call event
+        event['tip'] = api_data
         
         if not is_medium_confidence:
-            # Send to API for high confidence calls
-            try:
-                logger.info("Sending to trading API...")
-                response = requests.post(url=api_endpoint + "tip", json=api_data, timeout=10)
-                logger.info(f"API Response: {response.status_code}")
-                
-                if response.status_code == 200:
-                    logger.info("Trading call successfully sent to API")
-                else:
-                    logger.warning(f"API returned status code: {response.status_code}")
-                    
-            except requests.RequestException as e:
-                logger.error(f"API request failed: {e}")
+            # Skip calls another channel already sent within the duplicate window
+            first_group = call_deduplicator.claim(api_data, group, message_obj.date) if call_deduplicator else None
+            if first_group:
+                event['decision'] = 'duplicate_suppressed'
+                event['first_channel'] = first_group
+                return
+            
+            # Queue for the API for high confidence calls (delivered and retried in the background)
+            queued = tip_dispatcher.submit(api_data, f"{group}:{message_obj.id}", message_obj.date)
+            event['decision'] = 'queued' if queued else 'not_queued'
+            if not queued and call_deduplicator:
+                call_deduplicator.release(api_data)
         else:
             # For medium confidence, just log but don't send to API
-            logger.info("Medium confidence call logged, not sent to API")
+            event['decision'] = 'medium_confidence_logged'
             
     except Exception as e:
-        logger.error(f"Error processing trading data: {e}")
-        logger.error(f"Data: {data}")
+        event['decision'] = 'error'
+        logger.error(f"Error processing trading data: {e}", extra={'event': {'data': data}})
 
 
 # Event handlers for each channel
@@ -251,12 +375,35 @@ async def trade_univest(event):
 async def main():
     """Main function to start the bot"""
     try:
+        startup_timer.mark('module_setup')
+        # Prometheus-style /metrics and /healthz endpoint (METRICS_PORT), up before
+        # connecting so the container health check passes during a slow connect
+        start_metrics_server()
+        asyncio.ensure_future(heartbeat())
+        
+        # Overlap the Telegram handshake with building the parser and loading the HTTP client
+        # (requests), so the first call pays for neither
+        loop = asyncio.get_event_loop()
+        warm_ups = asyncio.gather(
+            loop.run_in_executor(None, startup_timer.timed, 'parser_warm_up', warm_up_parser,
+                                 ('DAY', 'BTST', 'UNIVEST')),
+            loop.run_in_executor(None, startup_timer.timed, 'http_client_warm_up', lambda: tip_dispatcher.session))
+        
         await client.start(phone=lambda: phone_number)
+        startup_timer.mark('telegram_connect')
         logger.info("Connected to Telegram successfully!")
         logger.info(f"Monitoring channels: DAY({daytrade_channel}), BTST({btst_channel}), UNIVEST({univest_channel})")
         logger.info("Trading hours: Monday-Friday 8:00 AM - 4:00 PM IST")
         logger.info("Bot is running... Press Ctrl+C to stop")
         
+        message_pipeline.start()
+        if ocr_engine is not None:
+            ocr_pipeline.start()
+        asyncio.ensure_future(report_pipeline_metrics())
+        
+        await warm_ups
+        startup_timer.report()
+        
         # Keep the client running
         await client.run_until_disconnected()
         
@@ -0,0 +1,621 @@
+"""
+Non-blocking dispatcher for posting trading tips to the trading API
+Keeps a pool of keep-alive connections and runs requests off the event loop,
+with a bounded outbound queue, retries with backoff and deduplication
+"""
+
+import asyncio
+import datetime
+import json
+import logging
+import socket
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import tip_api_errors, tips_failed
+from serializer import encoded_string
+from trading_call import serialize_tip
+
+logger = logging.getLogger(__name__)
+
+
+class TipRequestError(Exception):
+    """A request to the trading API failed before a response (wraps requests.RequestException)"""
+
+
+class TipDispatcher:
+    """
+    Posts tips to the trading API from async handlers.
+    Requests run on a small thread pool sharing one requests.Session, so
+    connections to the API are kept alive and reused and a slow API never
+    blocks the Telethon event loop.
+
+    Tips handed to submit() go through a bounded queue drained by worker
+    tasks, which retry failed posts with exponential backoff. Each tip
+    carries an idempotency key (channel + message id) so the same message
+    is never dispatched twice.
+
+    With batch_window set (seconds), tips arriving within that window are
+    coalesced into one bulk POST to batch_url; items the bulk endpoint does
+    not accept, or every item if the server has no bulk endpoint, fall back
+    to single posts.
+
+    on_failure(api_data) is called for each tip given up on after its last
+    retry, e.g. to release its cross-channel duplicate claim.
+    """
+
+    def __init__(self, tip_url, pool_size=4, timeout=10, queue_size=100, max_retries=3,
+                 backoff_base=0.5, backoff_max=8.0, dedup_window=5000, latency_window=500,
+                 batch_window=None, batch_url=None, max_batch_size=20, on_failure=None):
+        self.tip_url = tip_url
+        self.on_failure = on_failure
+        self.batch_window = batch_window
+        self.batch_url = batch_url or tip_url.rstrip("/") + "/batch"
+        self.max_batch_size = max_batch_size
+        self.batch_supported = bool(batch_window)
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.queue_size = queue_size
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.dedup_window = dedup_window
+
+        self._queue = None
+        self._workers = []
+        self._batch_slots = None
+        # In-flight batch deliveries; the event loop only keeps weak references to tasks
+        self._batch_tasks = set()
+        self._recent_keys = OrderedDict()
+        self._delivery_latencies = deque(maxlen=latency_window)
+        self._end_to_end_latencies = deque(maxlen=latency_window)
+        self.stats = {
+            'queued': 0,
+            'delivered': 0,
+            'failed': 0,
+            'retries': 0,
+            'dropped': 0,
+            'duplicates': 0,
+            'batches': 0,
+            'unconfirmed': 0
+        }
+
+        # requests (about 60 ms to import) is loaded with the session, off the startup path
+        self._requests = None
+        self._session = None
+        self._session_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="tip-dispatch")
+
+    @property
+    def session(self):
+        """Pooled requests.Session, created on first use"""
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    import requests
+                    from requests.adapters import HTTPAdapter
+
+                    session = requests.Session()
+                    # Bodies are pre-serialized (see trading_call.serialize_tip)
+                    session.headers["Content-Type"] = "application/json"
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                    session.mount("http://", adapter)
+                    session.mount("https://", adapter)
+                    self._requests = requests
+                    self._session = session
+        return self._session
+
+    def submit(self, api_data, idempotency_key, message_date=None):
+        """
+        Queue a tip for delivery and return immediately.
+        message_date is the Telegram timestamp of the source message, used
+        for the receipt-to-acknowledgement latency metric.
+        Returns: True if queued, False if it was a duplicate or the queue is full
+        """
+        if idempotency_key in self._recent_keys:
+            self.stats['duplicates'] += 1
+            logger.info(f"Duplicate tip {idempotency_key} skipped")
+            return False
+
+        self._ensure_workers()
+        try:
+            self._queue.put_nowait((api_data, idempotency_key, message_date, time.monotonic()))
+        except asyncio.QueueFull:
+            self.stats['dropped'] += 1
+            logger.error(f"Tip queue full ({self.queue_size}), dropping tip {idempotency_key}")
+            return False
+
+        self._remember_key(idempotency_key)
+        self.stats['queued'] += 1
+        return True
+
+    async def post_tip(self, api_data, idempotency_key=None):
+        """
+        Send one tip to the API without blocking the event loop
+        Returns: requests.Response (raises TipRequestError on failure)
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._post, api_data, idempotency_key)
+
+    def _post(self, api_data, idempotency_key):
+        headers = {"Idempotency-Key": idempotency_key} if idempotency_key else None
+        return self._send(self.tip_url, serialize_tip(api_data), headers)
+
+    def _post_batch(self, items):
+        # {"tips": [{"idempotencyKey": ..., "tip": {...}}, ...]} from the already encoded tip bodies
+        tips = b','.join(b'{"idempotencyKey":' + encoded_string(idempotency_key) + b',"tip":'
+                         + serialize_tip(api_data) + b'}' for api_data, idempotency_key, _, _ in items)
+        return self._send(self.batch_url, b'{"tips":[' + tips + b']}')
+
+    def _send(self, url, body, headers=None):
+        session = self.session
+        try:
+            return session.post(url=url, data=body, headers=headers, timeout=self.timeout)
+        except self._requests.RequestException as e:
+            raise TipRequestError(str(e)) from e
+
+    def _ensure_workers(self):
+        """Create the queue and worker tasks on the running event loop"""
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.queue_size)
+            if self.batch_window:
+                self._batch_slots = asyncio.Semaphore(self.pool_size)
+                self._workers = [asyncio.ensure_future(self._batch_worker())]
+            else:
+                self._workers = [asyncio.ensure_future(self._worker()) for _ in range(self.pool_size)]
+
+    def _remember_key(self, idempotency_key):
+        self._recent_keys[idempotency_key] = None
+        if len(self._recent_keys) > self.dedup_window:
+            self._recent_keys.popitem(last=False)
+
+    async def _worker(self):
+        while True:
+            api_data, idempotency_key, message_date, queued_at = await self._queue.get()
+            try:
+                await self._deliver(api_data, idempotency_key, message_date, queued_at)
+            except Exception as e:
+                logger.error(f"Error delivering tip {idempotency_key}: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def _batch_worker(self):
+        """Collect tips arriving within batch_window and post each group concurrently"""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.batch_window
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            await self._batch_slots.acquire()
+            task = asyncio.ensure_future(self._run_batch(batch))
+            self._batch_tasks.add(task)
+            task.add_done_callback(self._batch_tasks.discard)
+
+    async def _run_batch(self, batch):
+        try:
+            await self._deliver_batch(batch)
+        except Exception as e:
+            logger.error(f"Error delivering tip batch: {e}")
+        finally:
+            self._batch_slots.release()
+            for _ in batch:
+                self._queue.task_done()
+
+    async def _deliver_batch(self, batch):
+        """Post a batch in one bulk request, falling back to single posts per failed item"""
+        pending = batch
+        if self.batch_supported and len(batch) > 1:
+            pending = await self._post_bulk(batch)
+
+        if pending:
+            await asyncio.gather(*(self._deliver(*item) for item in pending))
+
+    async def _post_bulk(self, batch):
+        """
+        Send a batch to the bulk endpoint and map per-item results back
+        Returns: the items that still need a single post
+        """
+        loop = asyncio.get_running_loop()
+        try:
+            response = await loop.run_in_executor(self._executor, self._post_batch, batch)
+        except TipRequestError as e:
+            tip_api_errors.inc(reason='connection')
+            logger.error(f"Bulk API request failed, posting {len(batch)} tips individually: {e}")
+            return batch
+
+        if response.status_code in (404, 405, 501):
+            logger.warning(f"Bulk tip endpoint not supported ({response.status_code}), using single posts")
+            self.batch_supported = False
+            return batch
+        if response.status_code != 200:
+            logger.warning(f"Bulk API returned status code {response.status_code}, posting tips individually")
+            return batch
+
+        self.stats['batches'] += 1
+        try:
+            body = response.json()
+        except ValueError:
+            body = None
+        results = body.get('results') if isinstance(body, dict) else None
+        if not isinstance(results, list):
+            results = []
+
+        # The server took the batch, so a tip without a per-item status may well have
+        # been placed: it is reported as unconfirmed rather than posted again
+        pending = []
+        unconfirmed = []
+        for index, item in enumerate(batch):
+            result = results[index] if index < len(results) else None
+            status = result.get('status') if isinstance(result, dict) else None
+            if status == 200:
+                self._record_delivery(item[1], item[2], item[3])
+            elif status is None:
+                unconfirmed.append(item[1])
+            else:
+                pending.append(item)
+
+        if unconfirmed:
+            self.stats['unconfirmed'] += len(unconfirmed)
+            tip_api_errors.inc(reason='bulk_unconfirmed')
+            logger.warning(f"Bulk API returned 200 without a status for {len(unconfirmed)}/{len(batch)} tips, "
+                           f"delivery unknown, not resending: {', '.join(unconfirmed)}")
+        logger.info(f"Bulk API accepted {len(batch) - len(pending) - len(unconfirmed)}/{len(batch)} tips")
+        return pending
+
+    async def _deliver(self, api_data, idempotency_key, message_date, queued_at):
+        """Post one tip, retrying connection errors, 429 and 5xx with exponential backoff"""
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = await self.post_tip(api_data, idempotency_key)
+                logger.debug(f"API Response for {idempotency_key}: {response.status_code}")
+                if response.status_code == 200:
+                    self._record_delivery(idempotency_key, message_date, queued_at)
+                    return True
+                tip_api_errors.inc(reason=response.status_code)
+                if response.status_code != 429 and response.status_code < 500:
+                    logger.warning(f"API rejected tip {idempotency_key} with status code: {response.status_code}")
+                    break
+            except TipRequestError as e:
+                tip_api_errors.inc(reason='connection')
+                logger.error(f"API request failed for {idempotency_key}: {e}")
+
+            if attempt < self.max_retries:
+                self.stats['retries'] += 1
+                await asyncio.sleep(min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+        self.stats['failed'] += 1
+        tips_failed.inc()
+        logger.error(f"Giving up on tip {idempotency_key} after {attempt + 1} attempts")
+        if self.on_failure is not None:
+            try:
+                self.on_failure(api_data)
+            except Exception as e:
+                logger.error(f"Tip failure callback failed for {idempotency_key}: {e}")
+        return False
+
+    def _record_delivery(self, idempotency_key, message_date, queued_at):
+        self.stats['delivered'] += 1
+        delivery_latency = time.monotonic() - queued_at
+        self._delivery_latencies.append(delivery_latency)
+
+        if message_date is not None:
+            end_to_end = datetime.datetime.now(message_date.tzinfo) - message_date
+            self._end_to_end_latencies.append(end_to_end.total_seconds())
+
+        logger.info(f"Tip {idempotency_key} acknowledged in {delivery_latency * 1000:.0f} ms", extra={'event': {
+            'event': 'tip_delivered', 'idempotency_key': idempotency_key, 'delivery_ms': round(delivery_latency * 1000, 1)}})
+
+    def metrics(self):
+        """Queue depth, delivery counters and recent latency percentiles (seconds)"""
+        return {
+            **self.stats,
+            'queue_depth': self._queue.qsize() if self._queue is not None else 0,
+            'delivery_latency': latency_summary(self._delivery_latencies),
+            'end_to_end_latency': latency_summary(self._end_to_end_latencies)
+        }
+
+    async def drain(self):
+        """Wait until every queued tip has been delivered or given up on"""
+        if self._queue is not None:
+            await self._queue.join()
+        if self._batch_tasks:
+            await asyncio.gather(*self._batch_tasks, return_exceptions=True)
+
+    def close(self):
+        """Stop workers and in-flight batches, and release pooled connections and worker threads"""
+        for task in [*self._workers, *self._batch_tasks]:
+            if not task.done():
+                task.cancel()
+        self._executor.shutdown(wait=False)
+        if self._session is not None:
+            self._session.close()
+
+
+def latency_summary(latencies):
+    """p50/p95/max of recent latencies in seconds"""
+    if not latencies:
+        return {'count': 0, 'p50': None, 'p95': None, 'max': None}
+
+    ordered = sorted(latencies)
+    return {
+        'count': len(ordered),
+        'p50': ordered[len(ordered) // 2],
+        'p95': ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+        'max': ordered[-1]
+    }
+
+
+def start_stub_api(api_delay=0.0, failures_per_tip=0, supports_batch=False, on_receive=None, batch_reply=None):
+    """
+    Start a local stand-in for the trading API on a free port.
+    Each request sleeps api_delay seconds; the first failures_per_tip
+    attempts for each idempotency key get a 503. The bulk endpoint
+    (<tip url>/batch) answers 404 unless supports_batch is set; with
+    batch_reply (a payload, or raw bytes) it accepts the tips but replies
+    with that instead of the per-item results.
+    on_receive(idempotency_key, tip) is called for every accepted tip.
+    Returns: (server, received) where received lists the posted tips
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    received = []
+    attempts = {}
+    lock = threading.Lock()
+
+    def accept(key, tip):
+        with lock:
+            attempts[key] = attempts.get(key, 0) + 1
+            if attempts[key] <= failures_per_tip:
+                return 503
+            received.append(tip)
+        if on_receive is not None:
+            on_receive(key, tip)
+        return 200
+
+    class StubTipHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def setup(self):
+            super().setup()
+            # Headers and body are separate writes; without this, Nagle plus
+            # delayed ACKs add ~40 ms to every keep-alive request
+            self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            time.sleep(api_delay)
+
+            if self.path.endswith("/batch"):
+                if not supports_batch:
+                    return self._reply(404, {"status": "not found"})
+                results = [{"status": accept(item["idempotencyKey"], item["tip"])} for item in body["tips"]]
+                return self._reply(200, {"results": results} if batch_reply is None else batch_reply)
+
+            status = accept(self.headers.get("Idempotency-Key"), body)
+            self._reply(status, {"status": "ok" if status == 200 else "retry"})
+
+        def _reply(self, status, payload):
+            reply = payload if isinstance(payload, bytes) else json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(reply)))
+            self.end_headers()
+            self.wfile.write(reply)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubTipHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, received
+
+
+# Test function for development
+def test_dispatcher(api_delay=1.0, concurrent_tips=3):
+    """
+    Post tips to a deliberately slow local stub API and check that other
+    message handling keeps running on the event loop meanwhile
+    """
+    server, _ = start_stub_api(api_delay=api_delay)
+    dispatcher = TipDispatcher(f"http://127.0.0.1:{server.server_port}/tip", pool_size=concurrent_tips)
+
+    async def handle_other_messages(delays):
+        # Stand-in for parsing the messages that arrive while tips are in flight
+        for _ in range(20):
+            started = time.perf_counter()
+            await asyncio.sleep(0.01)
+            delays.append(time.perf_counter() - started - 0.01)
+
+    async def run():
+        delays = []
+        started = time.perf_counter()
+        responses = await asyncio.gather(
+            *(dispatcher.post_tip({"instrument": {"name": "NIFTY"}, "price": i}) for i in range(concurrent_tips)),
+            handle_other_messages(delays)
+        )
+        return responses[:-1], delays, time.perf_counter() - started
+
+    print("=== TESTING TIP DISPATCHER ===\n")
+    try:
+        responses, delays, elapsed = asyncio.run(run())
+    finally:
+        dispatcher.close()
+        server.shutdown()
+
+    print(f"  [API] {len(responses)} tips posted, status codes: {[r.status_code for r in responses]}")
+    print(f"  [TIME] Total {elapsed:.2f}s with {api_delay:.1f}s API delay per tip")
+    print(f"  [LOOP] Worst event loop delay while posting: {max(delays) * 1000:.1f} ms")
+
+    assert all(r.status_code == 200 for r in responses)
+    assert elapsed < api_delay * concurrent_tips, "Tips were posted sequentially"
+    assert max(delays) < 0.1, "Posting tips blocked the event loop"
+    print("  [OK] Slow API did not delay concurrent message handling")
+
+
+# Test function for development
+def test_dispatch_queue(tips=3):
+    """
+    Queue tips against a stub API that fails each first attempt and check
+    that every tip is retried, delivered once and duplicates are skipped
+    """
+    server, received = start_stub_api(failures_per_tip=1)
+    dispatcher = TipDispatcher(f"http://127.0.0.1:{server.server_port}/tip", backoff_base=0.05)
+
+    async def run():
+        message_date = datetime.datetime.now(datetime.timezone.utc)
+        for message_id in range(tips):
+            dispatcher.submit({"instrument": {"name": "NIFTY"}, "price": message_id},
+                              f"DAY:{message_id}", message_date)
+        # Same message seen again, e.g. a re-delivered update
+        dispatcher.submit({"instrument": {"name": "NIFTY"}, "price": 0}, "DAY:0", message_date)
+        await dispatcher.drain()
+        return dispatcher.metrics()
+
+    print("\n=== TESTING DISPATCH QUEUE ===\n")
+    try:
+        metrics = asyncio.run(run())
+    finally:
+        dispatcher.close()
+        server.shutdown()
+
+    print(f"  [API] Delivered {metrics['delivered']}, retries {metrics['retries']}, "
+          f"duplicates {metrics['duplicates']}, queue depth {metrics['queue_depth']}")
+    print(f"  [TIME] Delivery latency p50 {metrics['delivery_latency']['p50'] * 1000:.0f} ms, "
+          f"max {metrics['delivery_latency']['max'] * 1000:.0f} ms")
+
+    assert len(received) == tips and metrics['delivered'] == tips
+    assert metrics['retries'] == tips and metrics['duplicates'] == 1 and metrics['failed'] == 0
+    print("  [OK] Failed posts were retried and duplicates suppressed")
+
+
+# Test function for development
+def test_failed_delivery():
+    """
+    A tip the API keeps failing is given up on and its duplicate claim is
+    released, so the same call from another channel can still be sent
+    """
+    from call_dedup import CallDeduplicator
+
+    server, received = start_stub_api(failures_per_tip=10)
+    deduplicator = CallDeduplicator()
+    dispatcher = TipDispatcher(f"http://127.0.0.1:{server.server_port}/tip", max_retries=1, backoff_base=0.01,
+                               on_failure=deduplicator.release)
+    tip = {"instrument": {"name": "NIFTY", "strike": "25100", "instrumentType": "PE"}, "price": 20.0}
+
+    async def run():
+        assert deduplicator.claim(tip, "DAY") is None
+        dispatcher.submit(tip, "DAY:1")
+        await dispatcher.drain()
+        return dispatcher.metrics()
+
+    print("\n=== TESTING FAILED DELIVERY ===\n")
+    try:
+        metrics = asyncio.run(run())
+    finally:
+        dispatcher.close()
+        server.shutdown()
+
+    assert metrics['failed'] == 1 and not received
+    assert deduplicator.claim(tip, "UNIVEST") is None, "claim of an undelivered call was kept"
+
+    # An API that cannot be reached raises TipRequestError, from the lazily imported requests
+    server.server_close()
+    unreachable = TipDispatcher(f"http://127.0.0.1:{server.server_port}/tip", timeout=2)
+    try:
+        asyncio.run(unreachable.post_tip(tip, "DAY:2"))
+        raise AssertionError("post to a stopped API did not fail")
+    except TipRequestError as e:
+        assert isinstance(e.__cause__, unreachable._requests.RequestException)
+    finally:
+        unreachable.close()
+    print("  [OK] Undelivered tip released its duplicate claim")
+
+
+# Test function for development
+def test_batch_dispatch(tips=5):
+    """
+    Queue a burst of tips with batching enabled, against a stub API with
+    and without a bulk endpoint, and check every tip is delivered once
+    """
+    print("\n=== TESTING BATCH DISPATCH ===\n")
+
+    for supports_batch in (True, False):
+        server, received = start_stub_api(supports_batch=supports_batch)
+        dispatcher = TipDispatcher(f"http://127.0.0.1:{server.server_port}/tip", batch_window=0.02)
+
+        async def run():
+            for message_id in range(tips):
+                dispatcher.submit({"instrument": {"name": "NIFTY"}, "price": message_id}, f"UNIVEST:{message_id}")
+            await dispatcher.drain()
+            return dispatcher.metrics()
+
+        try:
+            metrics = asyncio.run(run())
+        finally:
+            dispatcher.close()
+            server.shutdown()
+
+        print(f"  [API] Bulk endpoint {'available' if supports_batch else 'missing'}: "
+              f"delivered {metrics['delivered']}, bulk requests {metrics['batches']}")
+        assert len(received) == tips and metrics['delivered'] == tips
+        assert metrics['batches'] == (1 if supports_batch else 0)
+        assert not dispatcher._batch_tasks, "finished batch tasks still referenced"
+
+    print("  [OK] Burst coalesced into one bulk post, single posts used as fallback")
+
+    # close() cancels a batch still waiting on a slow API
+    server, _ = start_stub_api(api_delay=0.5, supports_batch=True)
+    dispatcher = TipDispatcher(f"http://127.0.0.1:{server.server_port}/tip", batch_window=0.02)
+
+    async def close_in_flight():
+        for message_id in range(2):
+            dispatcher.submit({"instrument": {"name": "NIFTY"}, "price": message_id}, f"BTST:{message_id}")
+        await asyncio.sleep(0.1)
+        in_flight = set(dispatcher._batch_tasks)
+        dispatcher.close()
+        await asyncio.sleep(0)
+        return in_flight
+
+    try:
+        in_flight = asyncio.run(close_in_flight())
+    finally:
+        server.shutdown()
+    assert len(in_flight) == 1 and all(task.cancelled() for task in in_flight)
+
+    # A 200 without usable per-item results: the tips were taken, so none is posted again
+    for batch_reply in (b"accepted", [], {"status": "ok"}, {"results": ["ok"]}):
+        server, received = start_stub_api(supports_batch=True, batch_reply=batch_reply)
+        dispatcher = TipDispatcher(f"http://127.0.0.1:{server.server_port}/tip", batch_window=0.02)
+
+        async def run():
+            for message_id in range(tips):
+                dispatcher.submit({"instrument": {"name": "NIFTY"}, "price": message_id}, f"DAY:{message_id}")
+            await dispatcher.drain()
+            return dispatcher.metrics()
+
+        try:
+            metrics = asyncio.run(run())
+        finally:
+            dispatcher.close()
+            server.shutdown()
+
+        assert len(received) == tips, f"tips resent after bulk reply {batch_reply!r}"
+        assert metrics['unconfirmed'] == tips and metrics['failed'] == 0 and metrics['delivered'] == 0
+    print("  [OK] Bulk replies without per-item results reported as unconfirmed, not resent")
+
+
+if __name__ == "__main__":
+    test_dispatcher()
+    test_dispatch_queue()
+    test_failed_delivery()
+    test_batch_dispatch()
@@ -0,0 +1,240 @@
+"""
+Compact record for a parsed trading call
+Replaces the per-message dicts passed from the parser through enrichment to
+process_trading_data: numeric fields are converted once at parse time and
+the tip API body is serialized straight from the record
+"""
+
+import serializer
+from serializer import encoded_string
+
+PARSER_VERSION = "enhanced_v1"
+
+# Pre-encoded static parts of the tip body, in the key order of to_tip()
+_TIP_PARTS = (b'{"instrument":{"name":', b',"strike":"', b'","instrumentType":', b'},"price":', b',"stopLoss":',
+              b',"target":', b',"confidence":', b',"type":', b',"parser_version":' + encoded_string(PARSER_VERSION) + b'}')
+
+
+def parse_price(text):
+    """Price text from the parser ("340", "50.5" or a range "50-60") -> (low, high or None)"""
+    if text is None:
+        return None, None
+    low, sep, high = str(text).partition('-')
+    return float(low), (float(high) if sep and high else None)
+
+
+def format_price(value):
+    """340.0 -> "340", 50.5 -> "50.5", as the price appeared in the message"""
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+class TradingCall:
+    """
+    One parsed call. strike is an int, trigger the entry price as a float
+    (the lower bound for ranges, with trigger_high the upper bound), and
+    stop_loss a float; target stays as written since it may list several
+    levels ("80/100"). Image calls without a usable caption only carry the
+    media fields.
+
+    get()/[] accept the old dict keys (e.g. 'trigger_price' gives "50-60")
+    so report and logging code keeps working unchanged.
+    """
+
+    __slots__ = ('call_type', 'instrument', 'strike', 'option_type', 'trigger', 'trigger_high', 'stop_loss',
+                 'target', 'confidence', 'has_media', 'requires_ocr', 'caption', 'smart_sl', 'smart_target',
+                 'timestamp', 'message_id')
+
+    # Keys of the old parsed_data dict, in their original order
+    FIELDS = ('call_type', 'instrument', 'strike', 'option_type', 'trigger_price', 'stop_loss', 'target',
+              'confidence', 'has_media', 'caption', 'requires_ocr', 'timestamp', 'message_id',
+              'smart_sl', 'smart_target')
+
+    def __init__(self, call_type='TEXT', instrument=None, strike=None, option_type=None, trigger=None,
+                 trigger_high=None, stop_loss=None, target=None, confidence=0, has_media=False,
+                 requires_ocr=False, caption=None, smart_sl=None, smart_target=None, timestamp=None,
+                 message_id=None):
+        self.call_type = call_type
+        self.instrument = instrument
+        self.strike = strike
+        self.option_type = option_type
+        self.trigger = trigger
+        self.trigger_high = trigger_high
+        self.stop_loss = stop_loss
+        self.target = target
+        self.confidence = confidence
+        self.has_media = has_media
+        self.requires_ocr = requires_ocr
+        self.caption = caption
+        self.smart_sl = smart_sl
+        self.smart_target = smart_target
+        self.timestamp = timestamp
+        self.message_id = message_id
+
+    @classmethod
+    def from_fields(cls, instrument, strike, option_type, trigger_price, stop_loss, target, confidence,
+                    timestamp=None, message_id=None):
+        """Build a text call from the strings matched by the parser, converting each number once"""
+        trigger, trigger_high = parse_price(trigger_price)
+        return cls('TEXT', instrument, int(strike) if strike else None, option_type, trigger, trigger_high,
+                   float(stop_loss) if stop_loss else None, target, confidence,
+                   timestamp=timestamp, message_id=message_id)
+
+    @property
+    def trigger_range(self):
+        """(low, high) entry range; high equals low for a single price"""
+        if self.trigger is None:
+            return None
+        return self.trigger, self.trigger if self.trigger_high is None else self.trigger_high
+
+    @property
+    def trigger_price(self):
+        """Entry price as written in the message, e.g. "50-60\""""
+        if self.trigger is None:
+            return None
+        if self.trigger_high is None:
+            return format_price(self.trigger)
+        return f"{format_price(self.trigger)}-{format_price(self.trigger_high)}"
+
+    def copy(self):
+        clone = TradingCall.__new__(TradingCall)
+        for name in self.__slots__:
+            setattr(clone, name, getattr(self, name))
+        return clone
+
+    def get(self, key, default=None):
+        if key not in self.FIELDS:
+            return default
+        value = getattr(self, key)
+        return default if value is None else value
+
+    def __getitem__(self, key):
+        if key not in self.FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __contains__(self, key):
+        return key in self.FIELDS and getattr(self, key) is not None
+
+    def as_dict(self):
+        """The set fields under the old parsed_data keys, for JSON archives and reports"""
+        return {key: value for key in self.FIELDS for value in (getattr(self, key),) if value is not None}
+
+    def __repr__(self):
+        return f"TradingCall({self.as_dict()!r})"
+
+    def __eq__(self, other):
+        if not isinstance(other, TradingCall):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    def to_tip(self, group):
+        """
+        Tip API payload for this call. Uses the smart SL/target when both are
+        set, otherwise the basic fallback. Returns None without a recognised
+        instrument, option type, strike and entry price, rather than guessing
+        the contract. The strike is sent as a string, as before.
+        """
+        if self.instrument is None or self.option_type is None or self.strike is None or self.trigger is None:
+            return None
+        trigger = self.trigger
+        if self.smart_sl and self.smart_target:
+            stop_loss, target = self.smart_sl, self.smart_target
+        else:
+            stop_loss = max(0.5, trigger - 5) if trigger > 5 else trigger * 0.5
+            target = trigger + 10
+        return TipPayload(self, {
+            "instrument": {
+                "name": self.instrument,
+                "strike": str(self.strike),
+                "instrumentType": self.option_type
+            },
+            "price": trigger,
+            "stopLoss": stop_loss,
+            "target": target,
+            "confidence": self.confidence,
+            "type": group,
+            "parser_version": PARSER_VERSION
+        })
+
+    def tip_json(self, group):
+        """The to_tip() payload as compact JSON bytes, joined from pre-encoded parts and the fields"""
+        trigger = self.trigger
+        if self.smart_sl and self.smart_target:
+            stop_loss, target = _json_value(self.smart_sl), _json_value(self.smart_target)
+        else:
+            stop_loss = repr(max(0.5, trigger - 5) if trigger > 5 else trigger * 0.5).encode()
+            target = repr(trigger + 10).encode()
+        parts = _TIP_PARTS
+        return b''.join((parts[0], encoded_string(self.instrument),
+                         parts[1], str(self.strike).encode(),
+                         parts[2], encoded_string(self.option_type),
+                         parts[3], repr(trigger).encode(), parts[4], stop_loss, parts[5], target,
+                         parts[6], repr(self.confidence).encode(), parts[7], encoded_string(group), parts[8]))
+
+
+def _json_value(value):
+    return encoded_string(value) if value.__class__ is str else repr(value).encode()
+
+
+class TipPayload(dict):
+    """Tip API payload dict that remembers its TradingCall, so the body is written from the record"""
+
+    __slots__ = ('call',)
+
+    def __init__(self, call, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.call = call
+
+
+def serialize_tip(api_data):
+    """
+    Tip payload -> JSON request body (bytes). orjson/msgspec encode the dict
+    faster than it can be joined in Python; with the stdlib fallback the
+    body is written from the TradingCall instead.
+    """
+    if serializer.BACKEND == 'json' and isinstance(api_data, TipPayload):
+        return api_data.call.tip_json(api_data['type'])
+    return serializer.dumps(api_data)
+
+
+def test_trading_call():
+    """Check conversions, the dict-style view and that the tip body matches json.dumps"""
+    import json
+    import math
+
+    call = TradingCall.from_fields('SENSEX', '81400', 'PE', '50-60', '40', '80/100', 78, message_id=7)
+    assert call.strike == 81400 and call.trigger == 50.0 and call.trigger_high == 60.0
+    assert call.trigger_range == (50.0, 60.0) and call.trigger_price == "50-60"
+    assert call.get('trigger_price') == "50-60" and call['stop_loss'] == 40.0
+    assert call.get('smart_sl', 'N/A') == 'N/A' and 'caption' not in call
+    assert call.as_dict()['strike'] == 81400 and 'caption' not in call.as_dict()
+
+    tip = call.to_tip('DAY')
+    assert tip['instrument']['strike'] == "81400" and tip['price'] == 50.0
+    assert tip['stopLoss'] == 45.0 and tip['target'] == 60.0
+
+    call.smart_sl, call.smart_target = 42.5, "61.25/68.75"
+    tip = call.to_tip('DAY')
+    assert (tip['stopLoss'], tip['target']) == (42.5, "61.25/68.75")
+    assert call.tip_json('DAY') == json.dumps(tip, separators=(',', ':')).encode('utf-8')
+    assert json.loads(serialize_tip(tip)) == json.loads(serialize_tip(dict(tip))) == tip
+
+    for trigger, smart in ((math.pi, True), (3.0, False), (1.5, False)):
+        call.trigger, call.trigger_high = trigger, None
+        if not smart:
+            call.smart_sl = call.smart_target = None
+        call.instrument = 'NIFTY "50" ₹'
+        tip = call.to_tip('DAY')
+        assert json.loads(call.tip_json('DAY')) == json.loads(serialize_tip(tip)) == tip
+
+    assert TradingCall.from_fields('NIFTY', '25100', 'PE', None, None, None, 45).to_tip('DAY') is None
+    # An unrecognised instrument (e.g. "ASHOKLEY 200 CE ABOVE 5") must not become a BANKNIFTY order
+    assert TradingCall.from_fields(None, '200', 'CE', '5', '3', '10', 79).to_tip('DAY') is None
+    assert TradingCall.from_fields('NIFTY', '25100', None, '20', '10', '40', 79).to_tip('DAY') is None
+    image = TradingCall('IMAGE', confidence=30, has_media=True, requires_ocr=True, caption="")
+    assert image.get('requires_ocr') and image.copy() == image
+    print("[OK] TradingCall conversions and tip serialization")
+
+
+if __name__ == "__main__":
+    test_trading_call()